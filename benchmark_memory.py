@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+قياس أداء نظام الذاكرة
+"""
+
+import argparse
+import random
+import tempfile
+import time
+
+# إضافة مسار المشروع
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import numpy as np
+
+from core.memory import ChromaBackend, LessonIndex, Memory, NumpyBackend
+
+
+ARABIC_WORDS = [
+    "برنامج", "بايثون", "ملف", "قاعدة", "بيانات", "خطأ", "تحليل", "جدول",
+    "مستخدم", "طلب", "رسالة", "ذاكرة", "نموذج", "تدريب", "سرعة", "أداء",
+    "تقرير", "مشروع", "واجهة", "خادم", "شبكة", "أمان", "كلمة", "مرور",
+    "تاريخ", "وقت", "مدينة", "طقس", "سعر", "منتج", "فاتورة", "عميل",
+]
+ENGLISH_WORDS = [
+    "python", "pandas", "docker", "api", "json", "csv", "error", "timeout",
+    "server", "query", "index", "cache", "thread", "socket", "token", "model",
+]
+DIACRITICS = ["َ", "ُ", "ِ", "ّ", "ْ"]
+
+
+def _synthetic_corpus(n: int, seed: int = 42):
+    """توليد أسئلة وأجوبة عشوائية مختلطة عربية وإنجليزية"""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(n):
+        words = rng.sample(ARABIC_WORDS, 5) + rng.sample(ENGLISH_WORDS, 2)
+        rng.shuffle(words)
+        question = " ".join(words)
+        answer = " ".join(rng.sample(ARABIC_WORDS, 6))
+        corpus.append((question, answer))
+    return corpus
+
+
+def _perturb(text: str, rng: random.Random) -> str:
+    """صياغة قريبة من السؤال الأصلي: حذف كلمة وإضافة تشكيل وتغيير شكل الألف"""
+    words = text.split()
+    words.pop(rng.randrange(len(words)))
+    words = [
+        word + rng.choice(DIACRITICS) if rng.random() < 0.3 else word
+        for word in words
+    ]
+    return " ".join(words).replace("أ", "ا")
+
+
+def _measure_embedding(spec: str, corpus, queries, k: int):
+    """قياس زمن الإدخال والبحث ودقة الاسترجاع لدالة تضمين واحدة"""
+    with tempfile.TemporaryDirectory() as tmp:
+        memory = Memory(db_path=tmp, embedding_function=spec, embedding_cache_size=0)
+
+        start = time.perf_counter()
+        result = memory.add_interactions_bulk(corpus, batch_size=128)
+        insert_seconds = time.perf_counter() - start
+
+        hits = 0
+        latencies = []
+        for query, expected_id in queries:
+            start = time.perf_counter()
+            found = memory.search_interactions(query, n_results=k)
+            latencies.append(time.perf_counter() - start)
+            hits += any(item["id"] == expected_id for item in found)
+
+        memory.close()
+
+    latencies.sort()
+    return {
+        "insert_records_per_sec": result["count"] / insert_seconds,
+        "query_p50_ms": latencies[len(latencies) // 2] * 1000,
+        "query_p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+        f"recall@{k}": hits / len(queries)
+    }
+
+
+def benchmark_embeddings(n_records: int = 1000, n_queries: int = 100, k: int = 5):
+    """مقارنة المُضمِّن المحلي (hashing) مع نموذج ChromaDB الافتراضي"""
+    print(f"\n📏 دوال التضمين: {n_records} سجل، {n_queries} استعلام")
+
+    corpus = _synthetic_corpus(n_records)
+    rng = random.Random(7)
+    queries = []
+    for _ in range(n_queries):
+        index = rng.randrange(n_records)
+        queries.append((_perturb(corpus[index][0], rng), f"interaction_{index + 1}"))
+
+    for spec in ("hashing", "default"):
+        try:
+            stats = _measure_embedding(spec, corpus, queries, k)
+        except Exception as e:
+            print(f"  ⚠️ {spec}: تعذر القياس ({e})")
+            continue
+
+        summary = ", ".join(
+            f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+            for key, value in stats.items()
+        )
+        print(f"  {spec}: {summary}")
+
+
+def _time_call(func, repeat: int = 20) -> float:
+    """متوسط زمن الاستدعاء بالمللي ثانية"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def benchmark_lesson_indexes(n_lessons: int = 100000):
+    """مقارنة الفهارس الثانوية للدروس مع المسح الخطي"""
+    print(f"\n📚 فهارس الدروس: {n_lessons} درس")
+
+    rng = random.Random(42)
+    categories = [f"فئة_{i}" for i in range(50)]
+    lessons = [
+        {
+            "id": f"lesson_{i + 1}",
+            "lesson": f"درس {i}",
+            "category": rng.choice(categories),
+            # توزيع منحاز نحو الأهمية المتوسطة كما في الاستخدام الفعلي
+            "importance": min(10, max(1, int(rng.gauss(5, 2))))
+        }
+        for i in range(n_lessons)
+    ]
+
+    start = time.perf_counter()
+    index = LessonIndex()
+    index.rebuild(lessons)
+    print(f"  بناء الفهرس: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    cases = {
+        "by_category": (
+            lambda: [lesson for lesson in lessons if lesson.get("category") == categories[0]],
+            lambda: index.by_category(categories[0])
+        ),
+        "important(>=9)": (
+            lambda: [lesson for lesson in lessons if lesson.get("importance", 0) >= 9],
+            lambda: index.important(9)
+        ),
+        "categories": (
+            lambda: list(set(lesson.get("category", "unknown") for lesson in lessons)),
+            lambda: index.categories()
+        ),
+    }
+
+    for name, (scan, indexed) in cases.items():
+        scan_ms = _time_call(scan)
+        indexed_ms = _time_call(indexed)
+        print(f"  {name}: مسح خطي {scan_ms:.3f} ms، فهرس {indexed_ms:.3f} ms "
+              f"(×{scan_ms / max(indexed_ms, 1e-9):.0f})")
+
+
+def _open_backend(name: str, path: str):
+    """فتح فهرس متجهات في مجلد"""
+    if name == "numpy":
+        return NumpyBackend(path)
+
+    import chromadb
+    client = chromadb.PersistentClient(path=path)
+    return ChromaBackend(client.get_or_create_collection(name="interactions"))
+
+
+def benchmark_backends(n_records: int = 50000, dim: int = 384,
+                       n_queries: int = 200, k: int = 5, batch_size: int = 5000):
+    """مقارنة فهرس NumPy المربوط بالذاكرة مع ChromaDB"""
+    print(f"\n🗄️ فهارس المتجهات: {n_records} متجه بطول {dim}، {n_queries} استعلام")
+
+    rng = np.random.default_rng(42)
+    vectors = rng.standard_normal((n_records, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = vectors[rng.choice(n_records, n_queries, replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+
+    # الحقيقة المرجعية: أقرب k بالبحث الدقيق
+    exact = np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+    expected = [{f"interaction_{row + 1}" for row in rows} for rows in exact]
+
+    for name in ("numpy", "chroma"):
+        with tempfile.TemporaryDirectory() as tmp:
+            try:
+                start = time.perf_counter()
+                backend = _open_backend(name, tmp)
+                open_ms = (time.perf_counter() - start) * 1000
+
+                start = time.perf_counter()
+                for offset in range(0, n_records, batch_size):
+                    batch = vectors[offset:offset + batch_size]
+                    ids = [f"interaction_{offset + i + 1}" for i in range(len(batch))]
+                    backend.add(ids, batch, ["" for _ in ids], [{"type": "interaction"} for _ in ids])
+                insert_seconds = time.perf_counter() - start
+
+                latencies = []
+                recall = 0.0
+                for query, truth in zip(queries, expected):
+                    start = time.perf_counter()
+                    hits = backend.query(query, k)
+                    latencies.append(time.perf_counter() - start)
+                    recall += len(truth & {hit["id"] for hit in hits}) / k
+                backend.close()
+            except Exception as e:
+                print(f"  ⚠️ {name}: تعذر القياس ({e})")
+                continue
+
+        latencies.sort()
+        print(f"  {name}: open={open_ms:.1f} ms، "
+              f"insert={n_records / insert_seconds:.0f} rec/s، "
+              f"query p50={latencies[len(latencies) // 2] * 1000:.2f} ms، "
+              f"p95={latencies[int(len(latencies) * 0.95)] * 1000:.2f} ms، "
+              f"recall@{k}={recall / n_queries:.3f}")
+
+
+def benchmark_quantization(n_records: int = 50000, dim: int = 384, n_queries: int = 200,
+                           k: int = 10, rerank_candidates: int = 100, batch_size: int = 5000):
+    """مقارنة تخزين المتجهات float32 مع float16 و int8 (مع إعادة الترتيب وبدونها)"""
+    print(f"\n🗜️ تكميم المتجهات: {n_records} متجه بطول {dim}، {n_queries} استعلام")
+
+    rng = np.random.default_rng(42)
+    vectors = rng.standard_normal((n_records, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = vectors[rng.choice(n_records, n_queries, replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+
+    # الحقيقة المرجعية: أقرب k بالبحث الدقيق على float32
+    exact = np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+    expected = [{f"interaction_{row + 1}" for row in rows} for rows in exact]
+
+    configs = [
+        ("float32", "none", 0),
+        ("float16", "float16", 0),
+        ("int8", "int8", 0),
+        (f"int8+rerank{rerank_candidates}", "int8", rerank_candidates),
+    ]
+    for label, quantization, rerank in configs:
+        with tempfile.TemporaryDirectory() as tmp:
+            backend = NumpyBackend(tmp, quantization=quantization, rerank_candidates=rerank)
+
+            start = time.perf_counter()
+            for offset in range(0, n_records, batch_size):
+                batch = vectors[offset:offset + batch_size]
+                ids = [f"interaction_{offset + i + 1}" for i in range(len(batch))]
+                backend.add(ids, batch, ["" for _ in ids], [{"type": "interaction"} for _ in ids])
+            insert_seconds = time.perf_counter() - start
+
+            latencies = []
+            recall = 0.0
+            for query, truth in zip(queries, expected):
+                start = time.perf_counter()
+                hits = backend.query(query, k)
+                latencies.append(time.perf_counter() - start)
+                recall += len(truth & {hit["id"] for hit in hits}) / k
+            index_mb = backend.index_bytes() / 1024 / 1024
+            backend.close()
+
+        latencies.sort()
+        print(f"  {label}: index={index_mb:.1f} MB، "
+              f"insert={n_records / insert_seconds:.0f} rec/s، "
+              f"query p50={latencies[len(latencies) // 2] * 1000:.2f} ms، "
+              f"p95={latencies[int(len(latencies) * 0.95)] * 1000:.2f} ms، "
+              f"recall@{k}={recall / n_queries:.3f}")
+
+
+BENCHMARKS = {
+    "embeddings": benchmark_embeddings,
+    "lessons": benchmark_lesson_indexes,
+    "backends": benchmark_backends,
+    "quantization": benchmark_quantization,
+}
+
+
+def main():
+    """الدالة الرئيسية"""
+    parser = argparse.ArgumentParser(description="قياس أداء نظام الذاكرة")
+    parser.add_argument(
+        "benchmarks", nargs="*",
+        help=f"القياسات المطلوب تشغيلها من {', '.join(BENCHMARKS)} (الكل افتراضياً)"
+    )
+    args = parser.parse_args()
+
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"قياس غير معروف: {', '.join(unknown)}")
+
+    print("=" * 60)
+    print("⏱️ قياس أداء نظام الذاكرة")
+    print("=" * 60)
+
+    for name in args.benchmarks or BENCHMARKS:
+        BENCHMARKS[name]()
+
+    print("\n" + "=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,14 +3,19 @@
 يدمج الذاكرة والتفكير المنطقي والأدوات المتقدمة
 """
 
+import asyncio
 import os
-from typing import Dict, Any, List, Optional
+import time
+import uuid
+from typing import AsyncIterator, Dict, Any, List, Optional, Union
 from datetime import datetime
 import json
 
-from openai import OpenAI
-
+from .context_builder import ContextBuilder, format_memory_context, format_summary
+from .conversation import ConversationHistory
 from .memory import Memory
+from .memory_namespaces import MemoryNamespaces
+from .providers import LLMProvider, resolve_provider
 from .reasoning import ReasoningEngine, ThoughtType
 from .tools import ToolBox
 
@@ -18,8 +23,18 @@ from .tools import ToolBox
 class SmartAgent:
     """الوكيل الذكي المتقدم"""
 
+    # حدود طلب التلخيص: طول كل رسالة فيه وطول الملخص الناتج
+    SUMMARY_MESSAGE_CHARS = 500
+    SUMMARY_MAX_TOKENS = 300
+
     def __init__(self, agent_name: str = "الوكيل الذكي", 
-                 language: str = "ar", debug: bool = False):
+                 language: str = "ar", debug: bool = False,
+                 memory_min_score: Optional[float] = 0.5,
+                 memory: Optional[Any] = None, namespace: Optional[str] = None,
+                 namespaces: Optional[MemoryNamespaces] = None,
+                 provider: Union[str, LLMProvider] = "openai", context_budget: int = 2000,
+                 history_dir: str = "./data/sessions", max_history_in_memory: int = 200,
+                 summarize_every: int = 10):
         """
         تهيئة الوكيل الذكي
         
@@ -27,30 +42,61 @@ class SmartAgent:
             agent_name: اسم الوكيل
             language: اللغة (ar, en)
             debug: تفعيل وضع التصحيح
+            memory_min_score: أقل درجة تشابه لإدراج نتيجة من الذاكرة في السياق (None لإدراج الكل)
+            memory: ذاكرة مشتركة بين الجلسات (مثل MemoryClient متصل بخدمة الذاكرة)؛
+                الافتراضي Memory محلية خاصة بهذا الوكيل
+            namespace: مساحة الذاكرة للمستأجر أو المستخدم؛ البحث والحفظ في بياناته فقط
+            namespaces: مدير المساحات المشترك بين الوكلاء (يُنشأ مدير خاص إذا لم يُمرَّر)
+            provider: مزود النموذج: openai (يتطلب OPENAI_API_KEY)، fake (مزود محلي دون اتصال)،
+                أو كائن LLMProvider مثل FakeProvider بزمن ومعدل رموز وأخطاء مضبوطة
+            context_budget: أقصى عدد رموز لرسائل الطلب (التعليمات والسجل والذاكرة)
+            history_dir: مجلد ملفات رسائل الجلسات المنقولة إلى القرص
+            max_history_in_memory: أقصى عدد رسائل السجل في الذاكرة
+            summarize_every: عدد الرسائل التي لم تعد تُدرج في الطلب وتُطوى معاً في الملخص
         """
         self.agent_name = agent_name
         self.language = language
         self.debug = debug
+        self.memory_min_score = memory_min_score
+        self.tokens_saved = 0
         
-        # تهيئة مفتاح API
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY غير موجود في متغيرات البيئة")
-        
-        self.client = OpenAI(api_key=api_key)
-        self.model = "gpt-3.5-turbo"
+        # مزود النموذج (غير متزامن: انتظار الرد لا يحجب حلقة الأحداث عن الجلسات الأخرى)
+        self.provider = resolve_provider(provider)
+        self.model = self.provider.model
+        self.context_builder = ContextBuilder(budget=context_budget, model=self.model)
         
         # تهيئة الأنظمة الفرعية
-        self.memory = Memory()
+        self.namespace = namespace
+        if namespace is not None:
+            self.memory = (namespaces or MemoryNamespaces()).get(namespace)
+        else:
+            self.memory = memory if memory is not None else Memory()
         self.reasoning_engine = ReasoningEngine()
         self.toolbox = ToolBox()
         
-        # السجل
-        self.conversation_history: List[Dict[str, str]] = []
+        # السجل: محدود في الذاكرة، والأقدم على القرص ومطوي في ملخص متجدد
+        self.history_dir = history_dir
+        self.max_history_in_memory = max_history_in_memory
+        self.summarize_every = summarize_every
         self.session_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.history = self._new_history()
+        self._summary_task: Optional[asyncio.Task] = None
+        # أقدم رسالة أدرجها آخر طلب؛ ما قبلها لم يعد في الطلبات ويُطوى في الملخص
+        self._context_start = 0
         
         # نظام التعليمات
         self.system_prompt = self._build_system_prompt()
+        self._system_tokens = self.context_builder.count({"role": "system", "content": self.system_prompt})
+
+    def _new_history(self) -> ConversationHistory:
+        """سجل جديد للجلسة الحالية (اسم الملف فريد لأن معرف الجلسة بدقة الثانية)"""
+        path = os.path.join(self.history_dir, f"{self.session_id}_{uuid.uuid4().hex[:8]}.jsonl")
+        return ConversationHistory(path, max_messages=self.max_history_in_memory)
+
+    @property
+    def conversation_history(self) -> List[Dict[str, str]]:
+        """رسائل السجل الموجودة في الذاكرة (الأحدث)"""
+        return self.history.messages()
 
     def _build_system_prompt(self) -> str:
         """بناء تعليمات النظام"""
@@ -92,17 +138,105 @@ class SmartAgent:
         Returns:
             النتيجة والمعلومات الإضافية
         """
+        prepared = await self._prepare_request(user_input)
+        
+        # استدعاء مزود النموذج
+        try:
+            response = await self._call_openai(prepared["messages"])
+            return self._complete_request(user_input, response, prepared)
+        except Exception as e:
+            return self._failed_request(e)
+
+    async def process_request_stream(self, user_input: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        معالجة طلب المستخدم مع بث الرد أثناء توليده
+        يظهر أول جزء من الرد قبل اكتماله، ويُحفظ التفاعل في الذاكرة بعد انتهاء البث
+        
+        Args:
+            user_input: طلب المستخدم
+            
+        Yields:
+            أحداث بالترتيب: {"type": "thought", "thought": ...} لكل فكرة جديدة،
+            {"type": "token", "content": ...} لكل جزء من الرد،
+            ثم {"type": "done", "result": ...} بنتيجة process_request مع time_to_first_token
+        """
+        start = time.perf_counter()
+        prepared = await self._prepare_request(user_input)
+        for thought in self.reasoning_engine.get_thought_process():
+            yield {"type": "thought", "thought": thought}
+        reported = len(self.reasoning_engine.thoughts)
+        
+        chunks: List[str] = []
+        time_to_first_token = None
+        try:
+            async for token in self._stream_openai(prepared["messages"]):
+                if time_to_first_token is None:
+                    time_to_first_token = time.perf_counter() - start
+                chunks.append(token)
+                yield {"type": "token", "content": token}
+            result = self._complete_request(user_input, "".join(chunks), prepared)
+            result["time_to_first_token"] = time_to_first_token
+        except Exception as e:
+            result = self._failed_request(e)
+        
+        for thought in result["thought_process"][reported:]:
+            yield {"type": "thought", "thought": thought}
+        yield {"type": "done", "result": result}
+
+    async def _prepare_request(self, user_input: str) -> Dict[str, Any]:
+        """
+        بدء المهمة واسترجاع سياق الذاكرة وبناء رسائل الطلب ضمن الميزانية وتخطيط الخطوات
+        
+        Returns:
+            messages و context (تقرير الرموز) و tokens_saved و steps
+        """
         # بدء مهمة جديدة
         self.reasoning_engine.start_task(user_input)
         
         # إضافة إلى السجل
-        self.conversation_history.append({
-            "role": "user",
-            "content": user_input
-        })
+        self._append_history("user", user_input)
         
-        # البحث عن التفاعلات السابقة المشابهة
-        similar_interactions = self.memory.search_interactions(user_input, n_results=3)
+        # البحث عن التفاعلات والدروس ذات الصلة بتضمين واحد وبحث متوازٍ (في خيط خارج الحلقة)
+        memory_results = await self.memory.asearch_all(user_input, n_interactions=3, n_lessons=3)
+        similar_interactions = self.memory.filter_by_relevance(
+            memory_results["interactions"], min_score=self.memory_min_score
+        )
+        relevant_lessons = self.memory.filter_by_relevance(
+            memory_results["lessons"], min_score=self.memory_min_score
+        )
+        
+        # السياق يُحذف كاملاً إذا لم تتجاوز أي نتيجة العتبة، وما تبقى يُدرج بقدر الميزانية؛
+        # الرسائل المطوية في الملخص لا تُدرج مرة أخرى
+        history, history_tokens = self.history.recent(min(
+            self.context_builder.max_history_messages, len(self.history) - self.history.summarized
+        ))
+        messages, context = self.context_builder.build(
+            self.system_prompt, history, history_tokens,
+            similar_interactions, relevant_lessons, system_tokens=self._system_tokens,
+            summary=self.history.summary, summary_tokens=self.history.summary_tokens
+        )
+        self._context_start = len(self.history) - context["history_messages"]
+        unfiltered_context = format_memory_context(
+            memory_results["interactions"], memory_results["lessons"], self.context_builder.snippet_chars
+        )
+        unfiltered_tokens = (
+            self.context_builder.count({"role": "system", "content": unfiltered_context})
+            if unfiltered_context else 0
+        )
+        # التوفير من عتبة الصلة وحدها: المرشحون قبل التصفية وبعدها بنفس الصيغة وطول المقتطف،
+        # وما حذفته الميزانية بعد التصفية يُبلَّغ منفصلاً في context["dropped_memory_tokens"]
+        filtered_tokens = context["memory_tokens"] + context["dropped_memory_tokens"]
+        tokens_saved = unfiltered_tokens - filtered_tokens
+        self.tokens_saved += tokens_saved
+        
+        skipped = (len(memory_results["interactions"]) + len(memory_results["lessons"])
+                   - len(similar_interactions) - len(relevant_lessons))
+        if skipped:
+            self.reasoning_engine.add_thought(
+                content=f"تجاهلت {skipped} نتائج من الذاكرة ضعيفة الصلة",
+                thought_type=ThoughtType.ANALYSIS,
+                reasoning=f"درجة التشابه أقل من {self.memory_min_score}"
+            )
         
         if similar_interactions:
             self.reasoning_engine.add_thought(
@@ -111,9 +245,6 @@ class SmartAgent:
                 reasoning="البحث في الذاكرة عن تجارب سابقة"
             )
         
-        # البحث عن الدروس المستفادة ذات الصلة
-        relevant_lessons = self.memory.search_lessons(user_input, n_results=3)
-        
         if relevant_lessons:
             self.reasoning_engine.add_thought(
                 content=f"وجدت {len(relevant_lessons)} دروس مستفادة ذات صلة",
@@ -124,87 +255,126 @@ class SmartAgent:
         # تخطيط الخطوات
         steps = self.reasoning_engine.plan_steps(user_input)
         
-        # استدعاء OpenAI
-        try:
-            response = await self._call_openai(user_input, similar_interactions, relevant_lessons)
-            
-            # إضافة الرد إلى السجل
-            self.conversation_history.append({
-                "role": "assistant",
-                "content": response
-            })
-            
-            # حفظ التفاعل في الذاكرة
-            self.memory.add_interaction(user_input, response)
-            
-            # تقييم النتيجة
-            self.reasoning_engine.evaluate_result(response, quality=0.8)
-            
-            return {
-                "success": True,
-                "response": response,
-                "thought_process": self.reasoning_engine.get_thought_process(),
-                "summary": self.reasoning_engine.get_summary(),
-                "steps": steps,
-                "timestamp": datetime.now().isoformat()
-            }
-        except Exception as e:
-            error_msg = f"خطأ في معالجة الطلب: {str(e)}"
-            self.reasoning_engine.add_thought(
-                content=error_msg,
-                thought_type=ThoughtType.EVALUATION,
-                reasoning="حدث خطأ أثناء المعالجة",
-                confidence=0.0
-            )
-            
-            return {
-                "success": False,
-                "error": error_msg,
-                "thought_process": self.reasoning_engine.get_thought_process(),
-                "timestamp": datetime.now().isoformat()
-            }
+        return {
+            "messages": messages,
+            "context": context,
+            "tokens_saved": tokens_saved,
+            "steps": steps
+        }
 
-    async def _call_openai(self, user_input: str, 
-                          similar_interactions: List[Dict],
-                          relevant_lessons: List[Dict]) -> str:
-        """استدعاء OpenAI API"""
-        
-        # بناء السياق من الذاكرة
-        context = ""
+    def _complete_request(self, user_input: str, response: str,
+                          prepared: Dict[str, Any]) -> Dict[str, Any]:
+        """تسجيل الرد المكتمل وحفظه وبناء نتيجة الطلب"""
+        # إضافة الرد إلى السجل
+        self._append_history("assistant", response)
+        self._schedule_summary()
         
-        if similar_interactions:
-            context += "\n### تفاعلات سابقة مشابهة:\n"
-            for interaction in similar_interactions[:2]:
-                context += f"- {interaction.get('document', '')[:200]}\n"
-        
-        if relevant_lessons:
-            context += "\n### دروس مستفادة:\n"
-            for lesson in relevant_lessons[:2]:
-                context += f"- {lesson.get('lesson', '')[:200]}\n"
+        # حفظ التفاعل في الذاكرة في الخلفية خارج المسار الحرج للرد
+        self.memory.add_interaction_async(user_input, response)
         
-        # بناء الرسالة
-        messages = [
-            {"role": "system", "content": self.system_prompt}
-        ]
+        # تقييم النتيجة
+        self.reasoning_engine.evaluate_result(response, quality=0.8)
         
-        # إضافة السجل
-        messages.extend(self.conversation_history[-10:])  # آخر 10 رسائل
+        return {
+            "success": True,
+            "response": response,
+            "thought_process": self.reasoning_engine.get_thought_process(),
+            "summary": self.reasoning_engine.get_summary(),
+            "steps": prepared["steps"],
+            "memory_context_tokens": prepared["context"]["memory_tokens"],
+            "tokens_saved": prepared["tokens_saved"],
+            "prompt_tokens": prepared["context"]["prompt_tokens"],
+            "context": prepared["context"],
+            "timestamp": datetime.now().isoformat()
+        }
+
+    def _failed_request(self, error: Exception) -> Dict[str, Any]:
+        """تسجيل خطأ الطلب وبناء نتيجته"""
+        error_msg = f"خطأ في معالجة الطلب: {str(error)}"
+        self.reasoning_engine.add_thought(
+            content=error_msg,
+            thought_type=ThoughtType.EVALUATION,
+            reasoning="حدث خطأ أثناء المعالجة",
+            confidence=0.0
+        )
         
-        if context:
-            messages.append({
-                "role": "system",
-                "content": f"السياق من الذاكرة:{context}"
-            })
+        return {
+            "success": False,
+            "error": error_msg,
+            "thought_process": self.reasoning_engine.get_thought_process(),
+            "timestamp": datetime.now().isoformat()
+        }
+
+    def _append_history(self, role: str, content: str) -> None:
+        """إضافة رسالة إلى السجل مع حساب عدد رموزها مرة واحدة"""
+        message = {"role": role, "content": content}
+        self.history.append(message, self.context_builder.count(message))
+
+    def _schedule_summary(self) -> None:
+        """
+        طي الرسائل التي لم يُدرجها آخر طلب في الملخص، في الخلفية خارج المسار الحرج
+        (الحد مما أدرجه باني السياق فعلاً، فتُطوى أيضاً الأدوار التي حذفتها الميزانية من النافذة)
+        """
+        end = self._context_start
+        if end - self.history.summarized < self.summarize_every:
+            return
+        if self._summary_task is not None and not self._summary_task.done():
+            return
+        self._summary_task = asyncio.get_running_loop().create_task(
+            self._summarize(self.history, self.history.summarized, end)
+        )
+
+    async def _summarize(self, history: ConversationHistory, start: int, end: int) -> None:
+        """
+        تحديث الملخص بالرسائل من start حتى end
         
-        # استدعاء API
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
+        Args:
+            history: السجل (قد تُعاد الجلسة أثناء التلخيص فيُحدَّث السجل القديم وحده)
+            start: أول رسالة لم تُلخص بعد
+            end: نهاية الرسائل المطوية (أقدم رسالة أدرجها آخر طلب)
+        """
+        try:
+            messages = await asyncio.to_thread(history.slice, start, end)
+            transcript = "\n".join(
+                f"{message['role']}: {message['content'][:self.SUMMARY_MESSAGE_CHARS]}"
+                for message in messages
+            )
+            summary = await self.provider.complete(
+                [
+                    {"role": "system", "content": "لخص المحادثة في فقرة موجزة تحفظ طلبات المستخدم "
+                                                  "والحقائق والقرارات المهمة دون تفاصيل زائدة."},
+                    {"role": "user", "content": f"الملخص السابق:\n{history.summary or 'لا يوجد'}"
+                                                f"\n\nالرسائل الجديدة:\n{transcript}"}
+                ],
+                temperature=0.3,
+                max_tokens=self.SUMMARY_MAX_TOKENS
+            )
+            tokens = self.context_builder.count({"role": "system", "content": format_summary(summary)})
+            history.set_summary(summary, tokens, end)
+        except Exception as e:
+            print(f"خطأ في تلخيص المحادثة: {e}")
+
+    async def wait_for_summary(self) -> None:
+        """انتظار اكتمال التلخيص الجاري (عند الإغلاق أو في الاختبارات)"""
+        if self._summary_task is not None:
+            await self._summary_task
+
+    async def _call_openai(self, messages: List[Dict[str, str]]) -> str:
+        """استدعاء مزود النموذج"""
+        return await self.provider.complete(
+            messages,
             temperature=0.7,
             max_tokens=2000
         )
-        
-        return response.choices[0].message.content
+
+    async def _stream_openai(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """استدعاء مزود النموذج مع البث: أجزاء الرد بترتيب وصولها"""
+        async for token in self.provider.stream(
+            messages,
+            temperature=0.7,
+            max_tokens=2000
+        ):
+            yield token
 
     def use_tool(self, tool_name: str, **kwargs) -> Dict[str, Any]:
         """استخدام أداة من الأدوات المتاحة"""
@@ -246,15 +416,26 @@ class SmartAgent:
         """الحصول على إحصائيات الذاكرة"""
         return self.memory.get_memory_stats()
 
+    def flush_memory(self) -> None:
+        """انتظار حفظ كل التفاعلات المعلقة (عند الإغلاق أو في الاختبارات)"""
+        self.memory.flush()
+
+    async def aflush_memory(self) -> None:
+        """انتظار حفظ كل التفاعلات المعلقة دون حجب حلقة الأحداث"""
+        await self.memory.aflush()
+
     def get_session_summary(self) -> Dict[str, Any]:
         """الحصول على ملخص الجلسة"""
         return {
             "session_id": self.session_id,
             "agent_name": self.agent_name,
             "language": self.language,
-            "conversation_turns": len(self.conversation_history) // 2,
+            "namespace": self.namespace,
+            "conversation_turns": len(self.history) // 2,
+            "history": self.history.stats(),
             "reasoning_summary": self.reasoning_engine.get_summary(),
             "memory_stats": self.get_memory_stats(),
+            "tokens_saved": self.tokens_saved,
             "timestamp": datetime.now().isoformat()
         }
 
@@ -263,7 +444,8 @@ class SmartAgent:
         try:
             data = {
                 "session": self.get_session_summary(),
-                "conversation": self.conversation_history,
+                "conversation_summary": self.history.summary,
+                "conversation": list(self.history.iter_all()),
                 "reasoning": self.reasoning_engine.get_thought_process()
             }
             
@@ -277,6 +459,9 @@ class SmartAgent:
 
     def reset_session(self) -> None:
         """إعادة تعيين الجلسة"""
-        self.conversation_history = []
+        self.history.clear()
+        self._summary_task = None
+        self._context_start = 0
         self.reasoning_engine.reset()
         self.session_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.history = self._new_history()
@@ -0,0 +1,244 @@
+"""
+ذاكرة التخزين المؤقت لنظام الذاكرة
+تخزين التضمينات (embeddings) حسب محتوى النص لتجنب إعادة حسابها،
+وتخزين نتائج البحث مع إبطالها عند الكتابة
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """توحيد النص قبل حساب مفتاحه: صيغة يونيكود موحدة ومسافات مختصرة"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+class EmbeddingCache:
+    """ذاكرة مؤقتة للتضمينات مفتاحها بصمة النص ومعرّف نموذج التضمين، مع إخلاء LRU"""
+
+    def __init__(self, model_id: str, max_entries: int = 10000,
+                 persist_path: Optional[str] = None):
+        """
+        Args:
+            model_id: معرّف نموذج التضمين (يدخل في المفتاح حتى لا تختلط النماذج)
+            max_entries: الحد الأقصى لعدد التضمينات المحفوظة في الذاكرة
+            persist_path: مسار ملف .npz لحفظ الذاكرة المؤقتة على القرص (اختياري)
+        """
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.persist_path = persist_path
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        if persist_path and os.path.exists(persist_path):
+            self.load()
+
+    def key(self, text: str) -> str:
+        """مفتاح التخزين: بصمة SHA-256 لمعرّف النموذج والنص الموحد"""
+        payload = f"{self.model_id}\0{normalize_text(text)}".encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    def _put(self, key: str, vector: np.ndarray):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def embed(self, texts: Sequence[str],
+              embedding_function: Callable[[List[str]], Any]) -> List[np.ndarray]:
+        """
+        تضمين قائمة نصوص مع استخدام الذاكرة المؤقتة
+        النصوص غير المخزنة تُضمَّن معاً باستدعاء واحد، والمكررة داخل الدفعة تُحسب مرة واحدة
+
+        Args:
+            texts: النصوص المطلوب تضمينها
+            embedding_function: دالة التضمين الفعلية
+
+        Returns:
+            التضمينات بنفس ترتيب النصوص
+        """
+        keys = [self.key(text) for text in texts]
+        vectors: List[Optional[np.ndarray]] = [None] * len(texts)
+        missing: Dict[str, List[int]] = {}
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    vectors[i] = vector
+                    self.hits += 1
+                elif key in missing:
+                    # تكرار داخل نفس الدفعة يُحسب مرة واحدة
+                    missing[key].append(i)
+                    self.hits += 1
+                else:
+                    missing[key] = [i]
+                    self.misses += 1
+
+        if missing:
+            missing_keys = list(missing)
+            computed = embedding_function([texts[missing[key][0]] for key in missing_keys])
+
+            with self._lock:
+                for key, vector in zip(missing_keys, computed):
+                    vector = np.asarray(vector, dtype=np.float32)
+                    self._put(key, vector)
+                    for i in missing[key]:
+                        vectors[i] = vector
+
+        return vectors
+
+    def stats(self) -> Dict[str, Any]:
+        """إحصائيات الذاكرة المؤقتة"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+            "max_entries": self.max_entries
+        }
+
+    def save(self):
+        """حفظ التضمينات المخزنة إلى القرص"""
+        if not self.persist_path:
+            return
+
+        with self._lock:
+            keys = list(self._entries)
+            vectors = list(self._entries.values())
+
+        try:
+            tmp_path = f"{self.persist_path}.{os.getpid()}.tmp.npz"
+            np.savez(
+                tmp_path,
+                model_id=np.array(self.model_id),
+                keys=np.array(keys),
+                vectors=np.stack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+            )
+            os.replace(tmp_path, self.persist_path)
+        except Exception as e:
+            print(f"خطأ في حفظ ذاكرة التضمينات: {e}")
+
+    def load(self):
+        """تحميل التضمينات المحفوظة من القرص"""
+        try:
+            with np.load(self.persist_path) as data:
+                if str(data["model_id"]) != self.model_id:
+                    return
+                with self._lock:
+                    for key, vector in zip(data["keys"], data["vectors"]):
+                        self._put(str(key), vector)
+        except Exception as e:
+            print(f"خطأ في تحميل ذاكرة التضمينات: {e}")
+
+
+class SearchResultCache:
+    """
+    ذاكرة مؤقتة لنتائج البحث (LRU مع مدة صلاحية)
+    كل مجموعة لها عدّاد أجيال يزداد عند أي كتابة، فتصبح النتائج المخزنة قبلها غير صالحة
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 300.0):
+        """
+        Args:
+            max_entries: الحد الأقصى لعدد النتائج المخزنة (0 لتعطيل الذاكرة المؤقتة)
+            ttl_seconds: مدة صلاحية النتيجة بالثواني
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        self._generations: Dict[str, int] = {}
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(collection: str, query: str, n_results: int, variant: str) -> tuple:
+        return (collection, variant, normalize_text(query).casefold(), n_results)
+
+    def generation(self, collection: str) -> int:
+        """الجيل الحالي للمجموعة"""
+        return self._generations.get(collection, 0)
+
+    def invalidate(self, collection: str):
+        """إبطال نتائج المجموعة بعد الكتابة فيها"""
+        with self._lock:
+            self._generations[collection] = self.generation(collection) + 1
+            self.invalidations += 1
+
+    def get(self, collection: str, query: str, n_results: int,
+            variant: str = "") -> Optional[List[Dict]]:
+        """
+        البحث عن نتيجة مخزنة صالحة
+
+        Args:
+            variant: ما يميز طريقة البحث (مثل نمط البحث) ضمن نفس المجموعة
+
+        Returns:
+            نسخة من النتائج، أو None إذا لم توجد أو انتهت صلاحيتها
+        """
+        key = self._key(collection, query, n_results, variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                generation, stored_at, results = entry
+                if generation == self.generation(collection) and \
+                        time.monotonic() - stored_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return [dict(item) for item in results]
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, collection: str, query: str, n_results: int,
+            results: List[Dict], generation: int, variant: str = ""):
+        """
+        تخزين نتائج بحث
+
+        Args:
+            generation: جيل المجموعة عند بدء البحث؛ تُهمل النتيجة إذا حدثت كتابة أثناءه
+        """
+        if self.max_entries <= 0:
+            return
+
+        key = self._key(collection, query, n_results, variant)
+        with self._lock:
+            if generation != self.generation(collection):
+                return
+            self._entries[key] = (generation, time.monotonic(), [dict(item) for item in results])
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """إحصائيات الذاكرة المؤقتة"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "invalidations": self.invalidations,
+            "size": len(self._entries),
+            "max_entries": self.max_entries
+        }
@@ -0,0 +1,157 @@
+"""
+بناء سياق الطلب ضمن ميزانية رموز
+تُملأ الميزانية بالأولوية: تعليمات النظام، ثم آخر أدوار المحادثة، ثم ملخص ما سبقها،
+ثم مقتطفات الذاكرة، ثم الدروس المستفادة؛ فلا تضخم الرسائل الطويلة الطلب ولا تُهدر المساحة مع القصيرة
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .tokens import count_message_tokens
+
+
+def format_summary(summary: str) -> str:
+    """رسالة ملخص المحادثة السابقة (فارغة إذا لم يوجد ملخص)"""
+    return f"ملخص المحادثة السابقة:\n{summary}" if summary else ""
+
+
+def format_memory_context(interactions: List[Dict], lessons: List[Dict],
+                          max_chars: int = 200) -> str:
+    """
+    رسالة السياق من نتائج الذاكرة
+
+    Args:
+        interactions: التفاعلات المسترجعة
+        lessons: الدروس المسترجعة
+        max_chars: أقصى طول لكل مقتطف
+
+    Returns:
+        نص الرسالة (فارغ إذا لم توجد نتائج)
+    """
+    context = ""
+
+    if interactions:
+        context += "\n### تفاعلات سابقة مشابهة:\n"
+        for interaction in interactions:
+            context += f"- {interaction.get('document', '')[:max_chars]}\n"
+
+    if lessons:
+        context += "\n### دروس مستفادة:\n"
+        for lesson in lessons:
+            context += f"- {lesson.get('lesson', '')[:max_chars]}\n"
+
+    return f"السياق من الذاكرة:{context}" if context else ""
+
+
+class ContextBuilder:
+    """باني رسائل الطلب ضمن ميزانية رموز"""
+
+    def __init__(self, budget: int = 2000, max_history_messages: int = 10,
+                 snippet_chars: int = 200, model: Optional[str] = None):
+        """
+        Args:
+            budget: أقصى عدد رموز لرسائل الطلب (دون الرد)
+            max_history_messages: أقصى عدد رسائل من السجل
+            snippet_chars: أقصى طول لكل مقتطف من الذاكرة
+            model: اسم النموذج (لاختيار ترميز عد الرموز)
+        """
+        self.budget = budget
+        self.max_history_messages = max_history_messages
+        self.snippet_chars = snippet_chars
+        self.model = model
+
+    def count(self, message: Dict[str, str]) -> int:
+        """عدد رموز رسالة واحدة (مع رموز صيغة المحادثة)"""
+        return count_message_tokens([message], self.model)
+
+    def build(self, system_prompt: str, history: Sequence[Dict[str, str]],
+              history_tokens: Sequence[int], interactions: List[Dict], lessons: List[Dict],
+              system_tokens: Optional[int] = None, summary: str = "",
+              summary_tokens: Optional[int] = None) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+        """
+        بناء رسائل الطلب
+
+        Args:
+            system_prompt: تعليمات النظام (تُدرج دائماً)
+            history: سجل المحادثة وآخره طلب المستخدم الحالي (يُدرج دائماً)
+            history_tokens: عدد رموز كل رسالة في السجل (محسوب عند الإضافة)
+            interactions: التفاعلات ذات الصلة بالأهمية
+            lessons: الدروس ذات الصلة بالأهمية
+            system_tokens: عدد رموز التعليمات إن كان محسوباً مسبقاً
+            summary: ملخص الرسائل الأقدم من السجل المُمرَّر
+            summary_tokens: عدد رموز رسالة الملخص إن كان محسوباً مسبقاً
+
+        Returns:
+            (الرسائل، تقرير بعدد الرموز وما أُدرج وما حُذف من كل جزء)
+        """
+        system = {"role": "system", "content": system_prompt}
+        used = system_tokens if system_tokens is not None else self.count(system)
+
+        # آخر الأدوار من الأحدث إلى الأقدم حتى تنفد الميزانية (دون فجوات في السجل)
+        recent = max(0, len(history) - self.max_history_messages)
+        included = 0
+        history_used = 0
+        for index in range(len(history) - 1, recent - 1, -1):
+            tokens = history_tokens[index]
+            if included and used + tokens > self.budget:
+                break
+            used += tokens
+            history_used += tokens
+            included += 1
+
+        # الملخص بعد آخر الأدوار، ويُحذف كاملاً إذا لم يتسع
+        summary_message = {"role": "system", "content": format_summary(summary)}
+        summary_used = 0
+        if summary:
+            tokens = summary_tokens if summary_tokens is not None else self.count(summary_message)
+            if used + tokens <= self.budget:
+                used += tokens
+                summary_used = tokens
+
+        # مقتطفات الذاكرة ثم الدروس بالأولوية؛ المقتطف الذي لا يتسع يُتخطى ويُجرَّب ما بعده
+        chosen_interactions: List[Dict] = []
+        chosen_lessons: List[Dict] = []
+        memory_tokens = 0
+        for kind, candidates in (("interactions", interactions), ("lessons", lessons)):
+            for candidate in candidates:
+                trial_interactions = chosen_interactions + ([candidate] if kind == "interactions" else [])
+                trial_lessons = chosen_lessons + ([candidate] if kind == "lessons" else [])
+                tokens = self.count({
+                    "role": "system",
+                    "content": format_memory_context(trial_interactions, trial_lessons, self.snippet_chars)
+                })
+                if used - memory_tokens + tokens <= self.budget:
+                    used += tokens - memory_tokens
+                    memory_tokens = tokens
+                    chosen_interactions, chosen_lessons = trial_interactions, trial_lessons
+
+        # ما حذفته الميزانية من المقتطفات المرشحة (منفصلاً عن ما استبعدته عتبة الصلة قبل البناء)
+        dropped_memory_tokens = 0
+        if len(chosen_interactions) + len(chosen_lessons) < len(interactions) + len(lessons):
+            dropped_memory_tokens = self.count({
+                "role": "system",
+                "content": format_memory_context(interactions, lessons, self.snippet_chars)
+            }) - memory_tokens
+
+        messages = [system]
+        if summary_used:
+            messages.append(summary_message)
+        messages.extend(history[len(history) - included:])
+        memory_context = format_memory_context(chosen_interactions, chosen_lessons, self.snippet_chars)
+        if memory_context:
+            messages.append({"role": "system", "content": memory_context})
+
+        return messages, {
+            "budget": self.budget,
+            "prompt_tokens": used,
+            "over_budget": used > self.budget,
+            "history_messages": included,
+            "history_tokens": history_used,
+            "dropped_history_messages": len(history) - recent - included,
+            "summary_tokens": summary_used,
+            "memory_snippets": len(chosen_interactions),
+            "lessons": len(chosen_lessons),
+            "memory_tokens": memory_tokens,
+            "dropped_snippets": len(interactions) + len(lessons)
+                                - len(chosen_interactions) - len(chosen_lessons),
+            "dropped_memory_tokens": dropped_memory_tokens
+        }
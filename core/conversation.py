@@ -0,0 +1,139 @@
+"""
+سجل المحادثة المحدود مع النقل إلى القرص وملخص متجدد
+آخر الرسائل فقط تبقى في الذاكرة مع عدد رموزها، والأقدم تُنقل إلى ملف NDJSON،
+والرسائل الخارجة من نافذة الطلب تُطوى في ملخص يُدرج في الطلبات بدلاً منها
+"""
+
+import json
+import os
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+class ConversationHistory:
+    """سجل رسائل محدود في الذاكرة، وما زاد عن الحد يُلحق بملف على القرص"""
+
+    def __init__(self, path: str, max_messages: int = 200):
+        """
+        Args:
+            path: ملف NDJSON للرسائل المنقولة إلى القرص (يُنشأ عند أول نقل)
+            max_messages: أقصى عدد رسائل في الذاكرة؛ عند تجاوزه يُنقل أقدم نصفها إلى القرص
+        """
+        if max_messages < 2:
+            raise ValueError("max_messages يجب أن يكون 2 على الأقل")
+
+        self.path = path
+        self.max_messages = max_messages
+        self._lock = threading.Lock()
+        self._messages: List[Dict[str, str]] = []
+        self._tokens: List[int] = []
+        # ترتيب أول رسالة في الذاكرة (= عدد الرسائل المنقولة إلى القرص)
+        self._offset = 0
+        # موضع القراءة التالي في الملف: (ترتيب الرسالة، الإزاحة بالبايت)
+        self._cursor = (0, 0)
+
+        # الملخص المتجدد يغطي أول summarized رسالة
+        self.summary = ""
+        self.summary_tokens = 0
+        self.summarized = 0
+
+    def __len__(self) -> int:
+        """عدد كل الرسائل (في الذاكرة وعلى القرص)"""
+        return self._offset + len(self._messages)
+
+    def append(self, message: Dict[str, str], tokens: int):
+        """
+        إضافة رسالة مع عدد رموزها
+
+        Args:
+            message: الرسالة (role و content)
+            tokens: عدد رموز الرسالة (يُحسب مرة واحدة عند الإضافة)
+        """
+        with self._lock:
+            self._messages.append(message)
+            self._tokens.append(tokens)
+            if len(self._messages) > self.max_messages:
+                self._spill(len(self._messages) - self.max_messages // 2)
+
+    def _spill(self, count: int):
+        """نقل أقدم count رسالة إلى القرص"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.writelines(json.dumps(message, ensure_ascii=False) + "\n"
+                         for message in self._messages[:count])
+        del self._messages[:count]
+        del self._tokens[:count]
+        self._offset += count
+
+    def messages(self) -> List[Dict[str, str]]:
+        """الرسائل الموجودة في الذاكرة (الأحدث)"""
+        with self._lock:
+            return list(self._messages)
+
+    def recent(self, n: int) -> Tuple[List[Dict[str, str]], List[int]]:
+        """آخر n رسالة (من الذاكرة) مع عدد رموز كل منها"""
+        with self._lock:
+            n = min(n, len(self._messages))
+            return self._messages[len(self._messages) - n:], self._tokens[len(self._tokens) - n:]
+
+    def slice(self, start: int, end: int) -> List[Dict[str, str]]:
+        """
+        الرسائل من الترتيب start حتى end (دون end)
+        ما نُقل إلى القرص يُقرأ من موضع القراءة السابق، فالقراءة المتتابعة لا تعيد مسح الملف
+        """
+        with self._lock:
+            messages = []
+            if start < self._offset:
+                index, position = self._cursor if self._cursor[0] <= start else (0, 0)
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    f.seek(position)
+                    while index < min(end, self._offset):
+                        line = f.readline()
+                        if index >= start:
+                            messages.append(json.loads(line))
+                        index += 1
+                    self._cursor = (index, f.tell())
+            first = max(start, self._offset) - self._offset
+            messages.extend(self._messages[first:max(first, end - self._offset)])
+            return messages
+
+    def iter_all(self) -> Iterator[Dict[str, str]]:
+        """كل الرسائل بالترتيب: من القرص ثم من الذاكرة"""
+        with self._lock:
+            spilled = self._offset
+            in_memory = list(self._messages)
+        if spilled:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for _, line in zip(range(spilled), f):
+                    yield json.loads(line)
+        yield from in_memory
+
+    def set_summary(self, summary: str, tokens: int, summarized: int):
+        """تحديث الملخص بعد طي الرسائل حتى الترتيب summarized"""
+        with self._lock:
+            self.summary = summary
+            self.summary_tokens = tokens
+            self.summarized = summarized
+
+    def stats(self) -> Dict[str, Any]:
+        """عدد الرسائل في الذاكرة وعلى القرص وفي الملخص"""
+        return {
+            "messages": len(self),
+            "in_memory": len(self._messages),
+            "spilled": self._offset,
+            "summarized": self.summarized,
+            "summary_tokens": self.summary_tokens
+        }
+
+    def clear(self):
+        """حذف كل الرسائل والملخص وملف القرص"""
+        with self._lock:
+            self._messages = []
+            self._tokens = []
+            self._offset = 0
+            self._cursor = (0, 0)
+            self.summary = ""
+            self.summary_tokens = 0
+            self.summarized = 0
+            if os.path.exists(self.path):
+                os.remove(self.path)
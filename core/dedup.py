@@ -0,0 +1,204 @@
+"""
+كشف التكرار عند الإدخال
+بصمة دقيقة للنص بعد التطبيع، وبصمة SimHash للنصوص شبه المتطابقة،
+فيُدمج السجل المكرر في السجل الأصلي بدلاً من تضمينه وفهرسته مرة أخرى
+"""
+
+import hashlib
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .cache import normalize_text
+from .embeddings import normalize_arabic
+
+
+SIMHASH_BITS = 64
+# تقسيم البصمة إلى 4 نطاقات: بصمتان بمسافة هامنغ ≤ 3 تتطابقان في نطاق واحد على الأقل
+SIMHASH_BANDS = 4
+
+_PUNCTUATION = re.compile(r"[^\w\s]+", re.UNICODE)
+
+
+def normalize_for_dedup(text: str) -> str:
+    """تطبيع النص قبل حساب البصمات (علامات الترقيم والتشكيل وأشكال الحروف والمسافات)"""
+    return normalize_text(_PUNCTUATION.sub(" ", normalize_arabic(text)))
+
+
+def content_hash(text: str) -> str:
+    """البصمة الدقيقة للنص بعد التطبيع"""
+    return hashlib.sha1(normalize_for_dedup(text).encode('utf-8')).hexdigest()
+
+
+def _features(text: str, ngram: int = 3) -> List[str]:
+    """مقاطع حرفية متداخلة من الكلمات (shingles)"""
+    features = []
+    for word in text.split():
+        if len(word) <= ngram:
+            features.append(word)
+        else:
+            features.extend(word[i:i + ngram] for i in range(len(word) - ngram + 1))
+    return features
+
+
+def simhash(text: str, bits: int = SIMHASH_BITS) -> Tuple[int, int]:
+    """
+    حساب بصمة SimHash
+
+    Returns:
+        (البصمة، عدد الخصائص التي بُنيت منها)
+    """
+    features = _features(normalize_for_dedup(text))
+    if not features:
+        return 0, 0
+
+    hashes = np.array([
+        int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=bits // 8).digest(), "big")
+        for feature in features
+    ], dtype=np.uint64)
+    # كل بت في البصمة = 1 إذا كانت أغلب الخصائص تحمل 1 في هذا الموقع
+    set_bits = ((hashes[:, None] >> np.arange(bits, dtype=np.uint64)) & np.uint64(1)).sum(axis=0)
+    fingerprint = 0
+    for bit in np.flatnonzero(set_bits * 2 > len(features)):
+        fingerprint |= 1 << int(bit)
+    return fingerprint, len(features)
+
+
+class DedupPolicy:
+    """سياسة كشف التكرار لمجموعة واحدة"""
+
+    def __init__(self, exact: bool = True, simhash_distance: Optional[int] = None,
+                 min_features: int = 24, embedding_distance: Optional[float] = None):
+        """
+        Args:
+            exact: دمج النصوص المتطابقة بعد التطبيع
+            simhash_distance: أقصى مسافة هامنغ بين بصمتي SimHash لاعتبار النصين متكررين
+                (None، الافتراضي، للتعطيل؛ والحد الأقصى المدعوم 3)
+            min_features: أقل عدد خصائص لاستخدام SimHash؛ النصوص القصيرة تُقارن بالبصمة الدقيقة فقط
+            embedding_distance: أقصى مسافة في فهرس المتجهات لاعتبار السجل مكرراً (None للتعطيل)
+        """
+        if simhash_distance is not None and not 0 <= simhash_distance < SIMHASH_BANDS:
+            raise ValueError(f"simhash_distance يجب أن يكون بين 0 و {SIMHASH_BANDS - 1}")
+
+        self.exact = exact
+        self.simhash_distance = simhash_distance
+        self.min_features = min_features
+        self.embedding_distance = embedding_distance
+
+    def is_enabled(self) -> bool:
+        """هل تكشف السياسة أي نوع من التكرار"""
+        return self.exact or self.simhash_distance is not None or self.embedding_distance is not None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """تحويل السياسة إلى قاموس"""
+        return {
+            "exact": self.exact,
+            "simhash_distance": self.simhash_distance,
+            "min_features": self.min_features,
+            "embedding_distance": self.embedding_distance
+        }
+
+
+class Deduplicator:
+    """فهرس بصمات لمجموعة واحدة مع إحصائيات التكرار"""
+
+    def __init__(self, policy: DedupPolicy):
+        """
+        Args:
+            policy: سياسة كشف التكرار
+        """
+        self.policy = policy
+        self.clear()
+        self._stats = {
+            "checked": 0,
+            "exact": 0,
+            "near": 0,
+            "embedding": 0,
+            "saved_bytes": 0
+        }
+
+    def clear(self):
+        """تفريغ البصمات (الإحصائيات تبقى)"""
+        self._by_hash: Dict[str, str] = {}
+        self._bands: Dict[Tuple[int, int], Set[str]] = {}
+        self._fingerprints: Dict[str, Tuple[str, Optional[int]]] = {}
+
+    @staticmethod
+    def _band_keys(fingerprint: int):
+        width = SIMHASH_BITS // SIMHASH_BANDS
+        mask = (1 << width) - 1
+        return [(band, fingerprint >> (band * width) & mask) for band in range(SIMHASH_BANDS)]
+
+    def _fingerprint(self, text: str) -> Tuple[str, Optional[int]]:
+        exact = content_hash(text)
+        if self.policy.simhash_distance is None:
+            return exact, None
+        fingerprint, n_features = simhash(text)
+        return exact, fingerprint if n_features >= self.policy.min_features else None
+
+    def find(self, text: str) -> Optional[Tuple[str, str]]:
+        """
+        البحث عن سجل مكرر
+
+        Returns:
+            (معرف السجل الأصلي، نوع التطابق exact أو near) أو None
+        """
+        self._stats["checked"] += 1
+        exact, fingerprint = self._fingerprint(text)
+
+        if self.policy.exact and exact in self._by_hash:
+            return self._by_hash[exact], "exact"
+
+        if fingerprint is not None:
+            for key in self._band_keys(fingerprint):
+                for record_id in self._bands.get(key, ()):
+                    other = self._fingerprints[record_id][1]
+                    if bin(fingerprint ^ other).count("1") <= self.policy.simhash_distance:
+                        return record_id, "near"
+        return None
+
+    def add(self, record_id: str, text: str):
+        """تسجيل بصمات سجل جديد"""
+        exact, fingerprint = self._fingerprint(text)
+        self._by_hash.setdefault(exact, record_id)
+        self._fingerprints[record_id] = (exact, fingerprint)
+        if fingerprint is not None:
+            for key in self._band_keys(fingerprint):
+                self._bands.setdefault(key, set()).add(record_id)
+
+    def remove(self, record_ids: List[str]):
+        """حذف بصمات سجلات (حذف أو نقل إلى الطبقة الباردة)"""
+        for record_id in record_ids:
+            entry = self._fingerprints.pop(record_id, None)
+            if entry is None:
+                continue
+            exact, fingerprint = entry
+            if self._by_hash.get(exact) == record_id:
+                del self._by_hash[exact]
+            if fingerprint is not None:
+                for key in self._band_keys(fingerprint):
+                    bucket = self._bands.get(key)
+                    if bucket is not None:
+                        bucket.discard(record_id)
+                        if not bucket:
+                            del self._bands[key]
+
+    def __contains__(self, record_id: str) -> bool:
+        return record_id in self._fingerprints
+
+    def record_duplicate(self, kind: str, saved_bytes: int):
+        """احتساب تكرار مدموج والمساحة التي وفّرها في الفهرس"""
+        self._stats[kind] += 1
+        self._stats["saved_bytes"] += saved_bytes
+
+    def stats(self) -> Dict[str, Any]:
+        """إحصائيات التكرار"""
+        duplicates = self._stats["exact"] + self._stats["near"] + self._stats["embedding"]
+        return {
+            **self._stats,
+            "duplicates": duplicates,
+            "duplicate_rate": duplicates / self._stats["checked"] if self._stats["checked"] else 0.0,
+            "tracked": len(self._fingerprints),
+            "policy": self.policy.to_dict()
+        }
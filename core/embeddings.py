@@ -0,0 +1,122 @@
+"""
+دوال التضمين (Embedding Functions) لنظام الذاكرة
+تتضمن مُضمِّناً محلياً سريعاً يعمل دون اتصال بالإنترنت
+"""
+
+import re
+import zlib
+from typing import Any, Callable, List, Union
+
+import numpy as np
+
+
+# التشكيل والتطويل في النص العربي
+_ARABIC_DIACRITICS = re.compile(r"[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]")
+_ARABIC_LETTER_MAP = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ة": "ه", "ؤ": "و", "ئ": "ي"
+})
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize_arabic(text: str) -> str:
+    """توحيد النص العربي: حذف التشكيل والتطويل وتوحيد أشكال الألف والياء والتاء المربوطة"""
+    text = _ARABIC_DIACRITICS.sub("", text)
+    return text.translate(_ARABIC_LETTER_MAP).lower()
+
+
+class HashingEmbeddingFunction:
+    """
+    مُضمِّن محلي بتقنية تجزئة الخصائص (feature hashing)
+    يجزّئ كلمات النص وأجزاءها الحرفية (n-grams) إلى متجه ثابت الطول،
+    فلا يحتاج إلى تحميل نموذج ويعمل مع اللغة العربية بعد توحيدها
+    """
+
+    def __init__(self, dim: int = 512, ngram_range: tuple = (2, 4),
+                 word_weight: float = 2.0):
+        """
+        Args:
+            dim: طول المتجه الناتج
+            ngram_range: أصغر وأكبر طول للأجزاء الحرفية
+            word_weight: وزن الكلمة الكاملة مقارنة بأجزائها الحرفية
+        """
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.word_weight = word_weight
+
+    def name(self) -> str:
+        """معرّف النموذج (يُستخدم في مفاتيح الذاكرة المؤقتة وأسماء المجموعات)"""
+        low, high = self.ngram_range
+        return f"hashing-{self.dim}-{low}{high}"
+
+    def _features(self, text: str):
+        """استخراج الخصائص وأوزانها من النص"""
+        min_n, max_n = self.ngram_range
+        for token in _TOKEN.findall(normalize_arabic(text)):
+            yield token, self.word_weight
+
+            padded = f"<{token}>"
+            for n in range(min_n, max_n + 1):
+                for i in range(len(padded) - n + 1):
+                    yield padded[i:i + n], 1.0
+
+    def embed_one(self, text: str) -> np.ndarray:
+        """تضمين نص واحد في متجه موحّد الطول (L2)"""
+        vector = np.zeros(self.dim, dtype=np.float32)
+
+        indices = []
+        weights = []
+        for feature, weight in self._features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            indices.append(h % self.dim)
+            # بت الإشارة يقلل أثر التصادمات
+            weights.append(weight if (h >> 31) & 1 else -weight)
+
+        if indices:
+            np.add.at(vector, np.array(indices), np.array(weights, dtype=np.float32))
+            norm = np.linalg.norm(vector)
+            if norm > 0:
+                vector /= norm
+        return vector
+
+    def __call__(self, input: List[str]) -> List[np.ndarray]:
+        """تضمين قائمة نصوص (نفس واجهة دوال التضمين في ChromaDB)"""
+        return [self.embed_one(text) for text in input]
+
+
+def resolve_embedding_function(spec: Union[str, Callable[[List[str]], Any]]):
+    """
+    تحويل وصف دالة التضمين إلى كائن قابل للاستدعاء
+
+    Args:
+        spec: default (نموذج ChromaDB الافتراضي)، hashing (المُضمِّن المحلي)، أو دالة مخصصة
+            تعرّف name() (انظر embedding_model_id)
+
+    Returns:
+        دالة التضمين
+    """
+    if callable(spec):
+        return spec
+
+    if spec == "default":
+        from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+        return DefaultEmbeddingFunction()
+    if spec == "hashing":
+        return HashingEmbeddingFunction()
+
+    raise ValueError(f"دالة تضمين غير معروفة: {spec}")
+
+
+def embedding_model_id(embedding_function) -> str:
+    """
+    معرّف نموذج التضمين من name()
+    المعرف يفصل الذاكرة المؤقتة للتضمينات ومجموعات الفهرس بين النماذج، فالدالة المخصصة
+    بلا name() تُرفض بدل أن تشترك دالتان مختلفتان في معرف واحد (مثل "function")
+    """
+    name = getattr(embedding_function, "name", None)
+    if not callable(name):
+        raise ValueError(
+            "دالة التضمين المخصصة يجب أن تعرّف name() تعيد معرّفاً فريداً للنموذج "
+            f"(النوع {type(embedding_function).__name__})"
+        )
+    return name()
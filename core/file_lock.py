@@ -0,0 +1,60 @@
+"""
+قفل ملف بين العمليات لنظام الذاكرة
+يسمح لعدة عمليات (مثل عمّال Streamlit) بمشاركة نفس مجلد الذاكرة؛
+القفل متداخل داخل العملية الواحدة وحصري بين العمليات عبر fcntl.flock
+"""
+
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # ويندوز: القفل يحمي خيوط العملية الواحدة فقط
+    fcntl = None
+
+
+class FileLock:
+    """قفل حصري متداخل (reentrant) على ملف"""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: مسار ملف القفل (يُنشأ إن لم يكن موجوداً)
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    def acquire(self):
+        """حجز القفل (ينتظر حتى تحرره العمليات الأخرى)"""
+        self._thread_lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except BaseException:
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        """تحرير القفل"""
+        self._depth -= 1
+        if self._depth == 0 and fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def close(self):
+        """إغلاق ملف القفل"""
+        with self._thread_lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
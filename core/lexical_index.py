@@ -0,0 +1,144 @@
+"""
+الفهرس النصي (Lexical Index) لنظام الذاكرة
+فهرس SQLite FTS5 يلتقط التطابقات الحرفية (أسماء الملفات، رموز الأخطاء) التي يفوّتها البحث المتجهي
+"""
+
+import json
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, List, Set
+
+from .embeddings import normalize_arabic
+
+
+# مصطلح البحث: كلمة أو معرّف مركّب مثل app.py أو E-1234 أو core/memory
+_TERM = re.compile(r"\w+(?:[._\-:/]\w+)*", re.UNICODE)
+
+
+def build_match_query(query: str) -> str:
+    """
+    تحويل نص البحث إلى استعلام FTS5
+    كل مصطلح يصبح عبارة بين علامتي تنصيص (فيطابق المعرّف المركّب كتسلسل رموز متتالية)،
+    والمصطلحات مربوطة بـ OR ليرتبها bm25
+    """
+    terms = _TERM.findall(normalize_arabic(query))
+    return " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+class LexicalIndex:
+    """فهرس FTS5 لكل مجموعة، مع جدول للمستندات والبيانات الوصفية"""
+
+    COLLECTIONS = ("interactions", "lessons")
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: مسار ملف قاعدة بيانات SQLite
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+
+        with self._conn:
+            for collection in self.COLLECTIONS:
+                self._conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {collection}_docs ("
+                    "rowid INTEGER PRIMARY KEY, id TEXT UNIQUE, document TEXT, metadata TEXT)"
+                )
+                self._conn.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {collection}_fts "
+                    "USING fts5(content, tokenize='unicode61 remove_diacritics 2')"
+                )
+
+    def add(self, collection: str, ids: List[str], documents: List[str],
+            metadatas: List[Dict[str, Any]]):
+        """إضافة مستندات إلى فهرس مجموعة (المعرف الموجود يُستبدل مستنده)"""
+        with self._lock, self._conn:
+            for record_id, document, metadata in zip(ids, documents, metadatas):
+                # الاستبدال يحذف صف FTS القديم أولاً، فـ INSERT OR REPLACE وحده يخصص rowid
+                # جديداً للمستند ويترك الصف القديم في FTS دون مستند
+                self._delete_locked(collection, record_id)
+                cursor = self._conn.execute(
+                    f"INSERT INTO {collection}_docs (id, document, metadata) VALUES (?, ?, ?)",
+                    (record_id, document, json.dumps(metadata, ensure_ascii=False))
+                )
+                self._conn.execute(
+                    f"INSERT INTO {collection}_fts (rowid, content) VALUES (?, ?)",
+                    (cursor.lastrowid, normalize_arabic(document))
+                )
+
+    def _delete_locked(self, collection: str, record_id: str):
+        """حذف مستند وصف FTS الخاص به (يُستدعى والقفل محجوز داخل معاملة)"""
+        row = self._conn.execute(
+            f"SELECT rowid FROM {collection}_docs WHERE id = ?", (record_id,)
+        ).fetchone()
+        if row is not None:
+            self._conn.execute(f"DELETE FROM {collection}_fts WHERE rowid = ?", row)
+            self._conn.execute(f"DELETE FROM {collection}_docs WHERE rowid = ?", row)
+
+    def delete(self, collection: str, ids: List[str]):
+        """حذف مستندات من فهرس مجموعة"""
+        with self._lock, self._conn:
+            for record_id in ids:
+                self._delete_locked(collection, record_id)
+
+    def existing_ids(self, collection: str, ids: List[str]) -> Set[str]:
+        """المعرفات المفهرسة من بين ids"""
+        if not ids:
+            return set()
+        placeholders = ",".join("?" for _ in ids)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id FROM {collection}_docs WHERE id IN ({placeholders})", ids
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def search(self, collection: str, query: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        البحث النصي مرتباً حسب bm25
+
+        Returns:
+            قائمة (id, document, metadata) مرتبة من الأكثر صلة
+        """
+        match = build_match_query(query)
+        if not match:
+            return []
+
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT d.id, d.document, d.metadata FROM {collection}_fts "
+                f"JOIN {collection}_docs AS d ON d.rowid = {collection}_fts.rowid "
+                f"WHERE {collection}_fts MATCH ? ORDER BY bm25({collection}_fts) LIMIT ?",
+                (match, limit)
+            ).fetchall()
+
+        return [
+            {"id": record_id, "document": document, "metadata": json.loads(metadata)}
+            for record_id, document, metadata in rows
+        ]
+
+    def close(self):
+        """إغلاق قاعدة البيانات"""
+        with self._lock:
+            self._conn.close()
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """
+    دمج عدة ترتيبات بطريقة Reciprocal Rank Fusion
+
+    Args:
+        rankings: قوائم معرفات مرتبة من الأفضل
+        k: ثابت التنعيم
+
+    Returns:
+        المعرفات مرتبة حسب مجموع 1/(k + الترتيب)
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, record_id in enumerate(ranking, 1):
+            scores[record_id] = scores.get(record_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
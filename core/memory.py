@@ -1,65 +1,1439 @@
 """
 نظام الذاكرة المستمرة للوكيل الذكي
-يستخدم ChromaDB لتخزين التفاعلات والدروس المستفادة
+يستخدم ChromaDB (أو مخزن متجهات NumPy محلي) لتخزين التفاعلات والدروس المستفادة
 """
 
+import ast
+import asyncio
+import bisect
+import contextlib
+import heapq
+import itertools
 import json
 import os
-from datetime import datetime
-from typing import List, Dict, Any, Optional
-import chromadb
+import re
+import struct
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Iterable, Callable, Union, Set
 
+import numpy as np
 
+from .cache import EmbeddingCache, SearchResultCache
+from .dedup import DedupPolicy, Deduplicator
+from .embeddings import embedding_model_id, resolve_embedding_function
+from .file_lock import FileLock
+from .lexical_index import LexicalIndex, reciprocal_rank_fusion
+from .memory_log import MemoryLog
+from .memory_segments import SegmentStore
+from .memory_writer import MemoryWriter
+from .retention import RetentionPolicy, RetentionScheduler
 
-class Memory:
+
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+
+
+class MemoryBackend(ABC):
+    """واجهة أساسية لفهرس المتجهات الذي تبحث فيه الذاكرة"""
+
+    @abstractmethod
+    def add(self, ids: List[str], embeddings: List, documents: List[str],
+            metadatas: List[Dict[str, Any]]) -> None:
+        """إضافة سجلات مع تضميناتها"""
+        pass
+
+    @abstractmethod
+    def query(self, embedding, n_results: int,
+              ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        البحث عن أقرب السجلات
+
+        Args:
+            embedding: تضمين نص البحث
+            n_results: عدد النتائج
+            ids: حصر البحث في هذه المعرفات (اختياري)
+
+        Returns:
+            قائمة (id, document, metadata, distance) مرتبة من الأقرب
+        """
+        pass
+
+    def query_many(self, embeddings: List, n_results: int) -> List[List[Dict[str, Any]]]:
+        """
+        البحث بعدة تضمينات معاً (الفهارس التي تدعم البحث المجمّع تعيد تعريفها)
+
+        Returns:
+            قائمة نتائج لكل تضمين بنفس الترتيب
+        """
+        return [self.query(embedding, n_results) for embedding in embeddings]
+
+    @abstractmethod
+    def delete(self, ids: List[str]) -> None:
+        """حذف سجلات"""
+        pass
+
+    @abstractmethod
+    def existing_ids(self, ids: List[str]) -> Set[str]:
+        """المعرفات الموجودة في الفهرس من بين ids"""
+        pass
+
+    @abstractmethod
+    def count(self) -> int:
+        """عدد السجلات في الفهرس"""
+        pass
+
+    def refresh(self) -> None:
+        """قراءة ما كتبته العمليات الأخرى في الفهرس (للفهارس المشتركة بين العمليات)"""
+        pass
+
+    def close(self) -> None:
+        """إغلاق الفهرس"""
+        pass
+
+
+def unit_vectors(embeddings) -> np.ndarray:
+    """
+    توحيد طول التضمينات (صف لكل تضمين)
+    مربع مسافة L2 بين متجهين موحّدين = 2 - 2cos، فتبقى درجة التشابه بين -1 و 1 في كل الفهارس
+    """
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+class ChromaBackend(MemoryBackend):
+    """فهرس متجهات مبني على مجموعة ChromaDB"""
+
+    def __init__(self, collection):
+        """
+        Args:
+            collection: مجموعة ChromaDB
+        """
+        self.collection = collection
+
+    def add(self, ids, embeddings, documents, metadatas):
+        self.collection.add(
+            ids=ids,
+            embeddings=unit_vectors(embeddings).tolist(),
+            documents=documents,
+            metadatas=metadatas
+        )
+
+    def query(self, embedding, n_results, ids=None):
+        return self._query([embedding], n_results, ids)[0]
+
+    def query_many(self, embeddings, n_results):
+        return self._query(list(embeddings), n_results, None)
+
+    def _query(self, embeddings, n_results, ids):
+        results = self.collection.query(
+            query_embeddings=unit_vectors(embeddings).tolist(),
+            n_results=n_results,
+            ids=ids
+        )
+        return [
+            [
+                {
+                    "id": results['ids'][q][i],
+                    "document": doc,
+                    "metadata": results['metadatas'][q][i],
+                    "distance": results['distances'][q][i]
+                }
+                for i, doc in enumerate(results['documents'][q])
+            ]
+            for q in range(len(embeddings))
+        ]
+
+    def delete(self, ids):
+        self.collection.delete(ids=ids)
+
+    def existing_ids(self, ids):
+        return set(self.collection.get(ids=ids, include=[])["ids"])
+
+    def count(self):
+        return self.collection.count()
+
+
+class AppendableArray:
+    """
+    مصفوفة ثنائية الأبعاد في ملف .npy تُلحق بها الصفوف في مكانها وتُقرأ بربطها بالذاكرة
+    الترويسة بطول ثابت، فالإلحاق يكتب الصفوف في نهاية الملف ثم يعيد كتابة الترويسة فقط
+    """
+
+    # ترويسة .npy بطول ثابت حتى يمكن تحديث عدد الصفوف في مكانها
+    HEADER_SIZE = 128
+
+    def __init__(self, path: str, dtype):
+        """
+        Args:
+            path: مسار الملف
+            dtype: نوع العناصر (يُقرأ من الترويسة إن كان الملف موجوداً)
+        """
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.rows = 0
+        self.dim: Optional[int] = None
+        self._mapped: Optional[np.ndarray] = None
+        self.reload()
+
+    def reload(self):
+        """إعادة قراءة الشكل من الترويسة (بعد إلحاق من عملية أخرى)"""
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                header = ast.literal_eval(f.read(self.HEADER_SIZE)[10:].decode("latin1"))
+            self.rows, self.dim = header["shape"]
+            self.dtype = np.dtype(header["descr"])
+
+    def _header(self, rows: int) -> bytes:
+        header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d, %d), }" % (
+            self.dtype.str, rows, self.dim
+        )
+        preamble = b"\x93NUMPY\x01\x00" + struct.pack("<H", self.HEADER_SIZE - 10)
+        return preamble + header.ljust(self.HEADER_SIZE - 11).encode("latin1") + b"\n"
+
+    def append(self, rows: np.ndarray, start: Optional[int] = None):
+        """
+        إلحاق صفوف بالملف
+
+        Args:
+            rows: الصفوف
+            start: أول صف يُكتب فيه (الافتراضي نهاية الملف)؛ ما بعده من صفوف يُستبدل
+        """
+        rows = np.ascontiguousarray(rows, dtype=self.dtype)
+        if self.dim is None:
+            self.dim = rows.shape[1]
+            with open(self.path, "wb") as f:
+                f.write(self._header(0))
+
+        start = self.rows if start is None else start
+        with open(self.path, "r+b") as f:
+            f.seek(self.HEADER_SIZE + start * self.dim * self.dtype.itemsize)
+            f.write(rows.tobytes())
+            f.truncate()
+            f.seek(0)
+            f.write(self._header(start + len(rows)))
+        self.rows = start + len(rows)
+
+    def mapped(self, rows: int) -> np.ndarray:
+        """أول rows صفاً مربوطة بالذاكرة (يُعاد الربط بعد كل إلحاق)"""
+        if self._mapped is None or self._mapped.shape[0] != rows:
+            if rows == 0:
+                return np.zeros((0, self.dim or 0), dtype=self.dtype)
+            self._mapped = np.memmap(
+                self.path, dtype=self.dtype, mode="r",
+                offset=self.HEADER_SIZE, shape=(rows, self.dim)
+            )
+        return self._mapped
+
+    def nbytes(self) -> int:
+        """حجم البيانات في الملف"""
+        return self.rows * (self.dim or 0) * self.dtype.itemsize
+
+    def close(self):
+        self._mapped = None
+
+
+QUANTIZATIONS = ("none", "float16", "int8")
+
+
+class NumpyBackend(MemoryBackend):
+    """
+    فهرس متجهات في ملف .npy مربوط بالذاكرة (memory-mapped)
+    المتجهات موحّدة الطول (L2) في مصفوفة متصلة، والبحث بالقوة الغاشمة مع argpartition.
+    الإضافة تُلحق الصفوف بنهاية الملف وتعيد كتابة الترويسة فقط،
+    والمعرفات والمستندات في ملف NDJSON جانبي مع علامات حذف.
+    
+    التكميم اختياري: float16، أو int8 بمعامل قياس لكل متجه، فيُمسح نصف أو ربع
+    حجم float32 عند البحث. يمكن إبقاء نسخة float32 على القرص لإعادة ترتيب
+    أفضل المرشحين بالدقة الكاملة
+    """
+
+    # عدد الصفوف المحوّلة إلى float32 دفعة واحدة عند البحث في متجهات مكمّمة
+    SCORE_CHUNK_ROWS = 1024
+
+    def __init__(self, path: str, quantization: str = "none",
+                 keep_full_precision: bool = True, rerank_candidates: int = 0):
+        """
+        Args:
+            path: مجلد الفهرس
+            quantization: none (float32)، float16، أو int8 (بمعامل قياس لكل متجه)
+            keep_full_precision: حفظ نسخة float32 على القرص مع المتجهات المكمّمة
+            rerank_candidates: عدد المرشحين الذين يُعاد ترتيبهم بالدقة الكاملة (0 للتعطيل)
+        """
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"نوع تكميم غير معروف: {quantization}")
+
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.sidecar_path = os.path.join(path, "ids.ndjson")
+        self.quantization = quantization
+        self.rerank_candidates = rerank_candidates
+
+        dtype = {"none": np.float32, "float16": np.float16, "int8": np.int8}[quantization]
+        self._vectors = AppendableArray(os.path.join(path, "vectors.npy"), dtype)
+        self._scales: Optional[AppendableArray] = None
+        if quantization == "int8":
+            self._scales = AppendableArray(os.path.join(path, "scales.npy"), np.float32)
+        self._full: Optional[AppendableArray] = None
+        if quantization != "none" and (
+                keep_full_precision or os.path.exists(os.path.join(path, "vectors_full.npy"))):
+            self._full = AppendableArray(os.path.join(path, "vectors_full.npy"), np.float32)
+
+        self.dim: Optional[int] = self._vectors.dim
+        self._rows = 0
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._row_of: Dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._sidecar_offset = 0
+        self._lock = threading.Lock()
+
+        self._load()
+
+    def _arrays(self) -> List[AppendableArray]:
+        """ملفات المتجهات بترتيب الكتابة (الملف الرئيسي آخراً)"""
+        return [array for array in (self._full, self._scales) if array is not None] + [self._vectors]
+
+    def _load(self):
+        if self.dim is None:
+            return
+        self._read_sidecar()
+
+    def _read_sidecar(self):
+        """قراءة أسطر الملف الجانبي المكتملة بعد آخر موضع مقروء"""
+        if not os.path.exists(self.sidecar_path):
+            return
+
+        # عدد الصفوف المكتملة في كل الملفات (انقطاع بين كتابتين)
+        rows = min(array.rows for array in self._arrays())
+
+        first_new = len(self._ids)
+        deleted_rows = []
+        with open(self.sidecar_path, 'rb') as f:
+            f.seek(self._sidecar_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # سطر مبتور بسبب انقطاع أثناء الكتابة
+                    break
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    self._sidecar_offset += len(line)
+                    continue
+
+                if record.get("deleted"):
+                    row = self._row_of.pop(record["id"], None)
+                    if row is not None:
+                        deleted_rows.append(row)
+                elif len(self._ids) >= rows:
+                    # سطر جانبي بلا متجه مكتوب
+                    break
+                else:
+                    previous = self._row_of.get(record["id"])
+                    if previous is not None:
+                        deleted_rows.append(previous)
+                    self._row_of[record["id"]] = len(self._ids)
+                    self._ids.append(record["id"])
+                    self._documents.append(record["document"])
+                    self._metadatas.append(record["metadata"])
+                self._sidecar_offset += len(line)
+
+        self._rows = len(self._ids)
+        self._alive = np.concatenate([self._alive, np.ones(self._rows - first_new, dtype=bool)])
+        self._alive[deleted_rows] = False
+
+    def refresh(self):
+        with self._lock:
+            size = os.path.getsize(self.sidecar_path) if os.path.exists(self.sidecar_path) else 0
+            if size == self._sidecar_offset:
+                return
+            for array in self._arrays():
+                array.reload()
+            self.dim = self._vectors.dim
+            self._read_sidecar()
+
+    def _quantize(self, vectors: np.ndarray):
+        """
+        تحويل متجهات float32 إلى صيغة التخزين
+
+        Returns:
+            (المتجهات المخزنة، معاملات القياس أو None)
+        """
+        if self.quantization == "float16":
+            return vectors.astype(np.float16), None
+        if self.quantization == "int8":
+            scales = np.abs(vectors).max(axis=1, keepdims=True) / 127.0
+            scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+            return np.round(vectors / scales).astype(np.int8), scales
+        return vectors, None
+
+    def _scores(self, query: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        """
+        درجات التشابه (الجداء الداخلي) على المتجهات المخزنة، كل الصفوف أو rows فقط
+        
+        Args:
+            query: مصفوفة الاستعلامات (البعد × عدد الاستعلامات)
+            rows: الصفوف المطلوبة (None لكل الصفوف)
+        
+        Returns:
+            مصفوفة (الصفوف × عدد الاستعلامات)
+        """
+        matrix = self._vectors.mapped(self._rows)
+        scales = self._scales.mapped(self._rows) if self._scales is not None else None
+        if rows is not None:
+            matrix = matrix[rows]
+            scales = scales[rows] if scales is not None else None
+
+        if self.quantization == "none":
+            return matrix @ query
+
+        # التحويل إلى float32 على دفعات صغيرة في مخزن واحد يبقى في ذاكرة المعالج المؤقتة
+        scores = np.empty((len(matrix), query.shape[1]), dtype=np.float32)
+        buffer = np.empty((min(self.SCORE_CHUNK_ROWS, len(matrix)), self.dim), dtype=np.float32)
+        for start in range(0, len(matrix), self.SCORE_CHUNK_ROWS):
+            chunk = matrix[start:start + self.SCORE_CHUNK_ROWS]
+            converted = buffer[:len(chunk)]
+            np.copyto(converted, chunk, casting="unsafe")
+            scores[start:start + len(chunk)] = converted @ query
+        if scales is not None:
+            scores *= scales
+        return scores
+
+    # ------------------------------------------------------------------
+    # واجهة الفهرس
+    # ------------------------------------------------------------------
+
+    def add(self, ids, embeddings, documents, metadatas):
+        vectors = unit_vectors(embeddings)
+        if vectors.ndim != 2:
+            raise ValueError("التضمينات يجب أن تكون مصفوفة ثنائية الأبعاد")
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"بُعد التضمين {vectors.shape[1]} لا يطابق الفهرس ({self.dim})")
+
+            # المتجهات أولاً ثم الملف الجانبي؛ الكتابة تبدأ بعد آخر صف له سطر جانبي، فصفوف
+            # بلا سطر جانبي (انقطاع أو خطأ بين الكتابتين) تُستبدل ولا تزيح المعرفات عن صفوفها
+            stored, scales = self._quantize(vectors)
+            if self._full is not None:
+                self._full.append(vectors, start=self._rows)
+            if self._scales is not None:
+                self._scales.append(scales, start=self._rows)
+            self._vectors.append(stored, start=self._rows)
+
+            with open(self.sidecar_path, 'ab') as f:
+                f.write("".join(
+                    json.dumps(
+                        {"id": record_id, "document": document, "metadata": metadata},
+                        ensure_ascii=False
+                    ) + "\n"
+                    for record_id, document, metadata in zip(ids, documents, metadatas)
+                ).encode('utf-8'))
+                self._sidecar_offset = f.tell()
+
+            for record_id, document, metadata in zip(ids, documents, metadatas):
+                previous = self._row_of.get(record_id)
+                if previous is not None:
+                    self._alive[previous] = False
+                self._row_of[record_id] = len(self._ids)
+                self._ids.append(record_id)
+                self._documents.append(document)
+                self._metadatas.append(metadata)
+
+            self._rows = len(self._ids)
+            self._alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+
+    def query(self, embedding, n_results, ids=None):
+        return self._query([embedding], n_results, ids)[0]
+
+    def query_many(self, embeddings, n_results):
+        # مسح واحد للمصفوفة لكل الاستعلامات (ضرب مصفوفتين بدل ضرب مصفوفة بمتجه لكل استعلام)
+        return self._query(embeddings, n_results, None)
+
+    def _query(self, embeddings, n_results, ids):
+        queries = unit_vectors(np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1))
+
+        with self._lock:
+            if self._rows == 0:
+                return [[] for _ in queries]
+            records = self._ids, self._documents, self._metadatas
+            full = self._full.mapped(self._rows) if self._full is not None else None
+
+            if ids is None:
+                rows = None
+                scores = np.where(self._alive[:, None], self._scores(queries.T, None), -np.inf)
+            else:
+                rows = np.array(
+                    sorted(self._row_of[record_id] for record_id in set(ids) if record_id in self._row_of),
+                    dtype=np.int64
+                )
+                scores = self._scores(queries.T, rows) if len(rows) else \
+                    np.zeros((0, len(queries)), dtype=np.float32)
+
+        return [
+            self._top_hits(scores[:, column], rows, query, n_results, full, records)
+            for column, query in enumerate(queries)
+        ]
+
+    def _top_hits(self, scores: np.ndarray, rows: Optional[np.ndarray], query: np.ndarray,
+                  n_results: int, full: Optional[np.ndarray], records) -> List[Dict[str, Any]]:
+        """أفضل n_results نتيجة لاستعلام واحد من درجاته"""
+        rerank = full is not None and self.rerank_candidates > 0
+        candidates = max(n_results, self.rerank_candidates) if rerank else n_results
+        k = min(candidates, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return []
+
+        top = np.argpartition(-scores, k - 1)[:k]
+        top_scores = scores[top]
+        if rows is not None:
+            top = rows[top]
+
+        if rerank:
+            # إعادة ترتيب المرشحين بالدقة الكاملة من نسخة float32 على القرص
+            top_scores = full[top] @ query
+        order = np.argsort(-top_scores)[:n_results]
+        top, top_scores = top[order], top_scores[order]
+
+        record_ids, documents, metadatas = records
+
+        # مسافة L2 التربيعية بين متجهين موحّدين (نفس مقياس ChromaDB الافتراضي)
+        return [
+            {
+                "id": record_ids[row],
+                "document": documents[row],
+                "metadata": metadatas[row],
+                "distance": float(2.0 - 2.0 * score)
+            }
+            for row, score in zip(top, top_scores)
+        ]
+
+    def delete(self, ids):
+        with self._lock:
+            deleted = [record_id for record_id in ids if record_id in self._row_of]
+            if not deleted:
+                return
+            with open(self.sidecar_path, 'ab') as f:
+                f.write("".join(
+                    json.dumps({"id": record_id, "deleted": True}) + "\n" for record_id in deleted
+                ).encode('utf-8'))
+                self._sidecar_offset = f.tell()
+            for record_id in deleted:
+                self._alive[self._row_of.pop(record_id)] = False
+
+    def existing_ids(self, ids):
+        return {record_id for record_id in ids if record_id in self._row_of}
+
+    def count(self):
+        return len(self._row_of)
+
+    def index_bytes(self) -> int:
+        """حجم المتجهات التي يمسحها البحث (دون نسخة الدقة الكاملة)"""
+        return self._vectors.nbytes() + (self._scales.nbytes() if self._scales is not None else 0)
+
+    def close(self):
+        for array in self._arrays():
+            array.close()
+
+
+class LessonIndex:
+    """فهارس ثانوية للدروس: حسب الفئة وحسب الأهمية، مع عدّادات للفئات"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """تفريغ الفهارس"""
+        self._by_category: Dict[str, List[Dict]] = {}
+        self._by_importance: Dict[Any, List[Dict]] = {}
+        self._importance_levels: List[Any] = []
+
+    def add(self, lesson: Dict[str, Any]):
+        """فهرسة درس جديد"""
+        category = lesson.get("category", "unknown")
+        self._by_category.setdefault(category, []).append(lesson)
+
+        importance = lesson.get("importance", 0)
+        bucket = self._by_importance.get(importance)
+        if bucket is None:
+            bucket = self._by_importance[importance] = []
+            bisect.insort(self._importance_levels, importance)
+        bucket.append(lesson)
+
+    def replace(self, old: Dict[str, Any], new: Dict[str, Any]):
+        """استبدال نسخة محدّثة من درس بنفس الفئة والأهمية"""
+        for bucket in (self._by_category.get(old.get("category", "unknown"), []),
+                       self._by_importance.get(old.get("importance", 0), [])):
+            for position, lesson in enumerate(bucket):
+                if lesson is old:
+                    bucket[position] = new
+                    break
+
+    def rebuild(self, lessons: Iterable[Dict[str, Any]]):
+        """إعادة بناء الفهارس من قائمة الدروس"""
+        self.clear()
+        for lesson in lessons:
+            self.add(lesson)
+
+    def by_category(self, category: str) -> List[Dict]:
+        """الدروس في فئة معينة بترتيب إضافتها"""
+        return list(self._by_category.get(category, []))
+
+    def important(self, min_importance) -> List[Dict]:
+        """الدروس التي أهميتها >= min_importance، الأعلى أهمية أولاً"""
+        start = bisect.bisect_left(self._importance_levels, min_importance)
+        lessons = []
+        for importance in reversed(self._importance_levels[start:]):
+            lessons.extend(self._by_importance[importance])
+        return lessons
+
+    def categories(self) -> List[str]:
+        """الفئات الموجودة"""
+        return list(self._by_category)
+
+    def category_counts(self) -> Dict[str, int]:
+        """عدد الدروس في كل فئة"""
+        return {category: len(lessons) for category, lessons in self._by_category.items()}
+
+
+class AwaitableMemory:
+    """
+    واجهة async لعمليات الذاكرة المتزامنة
+    البحث يُنفَّذ في خيط من منفذ حلقة الأحداث، والحفظ ينتظر Future كاتب الخلفية،
+    فلا يحجب أي منهما الحلقة عن بقية الجلسات
+    """
+
+    async def asearch_all(self, query: str, n_interactions: int = 5, n_lessons: int = 5,
+                          mode: str = "vector", max_distance: Optional[float] = None,
+                          min_score: Optional[float] = None) -> Dict[str, List[Dict]]:
+        """search_all دون حجب حلقة الأحداث"""
+        return await asyncio.to_thread(
+            self.search_all, query, n_interactions, n_lessons, mode, max_distance, min_score
+        )
+
+    async def aadd_interaction(self, user_input: str, agent_response: str,
+                               metadata: Optional[Dict[str, Any]] = None) -> str:
+        """إضافة تفاعل عبر كاتب الخلفية وانتظار كتابته دون حجب حلقة الأحداث"""
+        return await asyncio.wrap_future(self.add_interaction_async(user_input, agent_response, metadata))
+
+    async def aflush(self):
+        """flush دون حجب حلقة الأحداث"""
+        await asyncio.to_thread(self.flush)
+
+
+class Memory(AwaitableMemory):
     """نظام الذاكرة المستمرة"""
 
-    def __init__(self, db_path: str = "./data/chroma_db"):
+    def __init__(self, db_path: str = "./data/chroma_db", storage: str = "log",
+                 fsync_policy: str = "interval", compact_threshold: int = 1000,
+                 persistent_index: bool = True, reconcile_batch_size: int = 256,
+                 embedding_cache_size: int = 10000, persist_embedding_cache: bool = False,
+                 embedding_function: Union[str, Callable[[List[str]], Any]] = "default",
+                 search_cache_size: int = 256, search_cache_ttl: float = 300.0,
+                 backend: str = "chroma", lexical_index: bool = True,
+                 hybrid_candidates: int = 50, hot_interactions: Optional[int] = 10000,
+                 segment_size: int = 5000,
+                 dedup: Optional[Dict[str, DedupPolicy]] = None,
+                 quantization: str = "none", rerank_candidates: int = 0,
+                 shared: bool = False, quota: Optional[RetentionPolicy] = None,
+                 embedding_cache: Optional[EmbeddingCache] = None):
+        """
+        تهيئة نظام الذاكرة
+        
+        Args:
+            db_path: مسار قاعدة بيانات ChromaDB
+            storage: طريقة الحفظ: log (سجل إلحاقي مع لقطة دورية) أو json (إعادة كتابة الملف كاملاً)
+            fsync_policy: سياسة المزامنة مع القرص في وضع log (always, interval, never)
+            compact_threshold: عدد العمليات في السجل قبل ضغطه في memory.json
+            persistent_index: حفظ مجموعات ChromaDB على القرص تحت db_path بدلاً من الذاكرة المؤقتة
+            reconcile_batch_size: حجم الدفعة عند مطابقة الفهرس مع memory.json عند البدء
+            embedding_cache_size: الحد الأقصى لعدد التضمينات في الذاكرة المؤقتة
+            persist_embedding_cache: حفظ الذاكرة المؤقتة للتضمينات على القرص
+            embedding_function: دالة التضمين: default (نموذج ChromaDB، يتطلب تحميله)،
+                hashing (مُضمِّن محلي يعمل دون اتصال)، أو كائن قابل للاستدعاء يستقبل قائمة نصوص
+                ويعرّف name() بمعرّف فريد للنموذج (يفصل الذاكرة المؤقتة ومجموعات الفهرس)
+            search_cache_size: الحد الأقصى لعدد نتائج البحث المخزنة مؤقتاً (0 للتعطيل)
+            search_cache_ttl: مدة صلاحية نتيجة البحث المخزنة بالثواني
+            backend: فهرس المتجهات: chroma (ChromaDB) أو numpy (مصفوفة مربوطة بالذاكرة تحت db_path/vectors)
+            lexical_index: صيانة فهرس نصي SQLite FTS5 بجانب فهرس المتجهات (مطلوب لنمطي lexical و hybrid)
+            hybrid_candidates: عدد المرشحين النصيين في البحث الهجين قبل الترتيب المتجهي
+            hot_interactions: عدد التفاعلات الحديثة التي تبقى في الذاكرة؛ الأقدم تُنقل إلى
+                مقاطع على القرص تحت db_path/segments تُحمّل عند الحاجة (None لإبقاء الكل في الذاكرة)
+            segment_size: عدد التفاعلات في كل مقطع على القرص
+            dedup: سياسة كشف التكرار لكل مجموعة (interactions, lessons)؛ الافتراضي التطابق الدقيق
+                فقط للمجموعتين (شبه المتطابق بـ SimHash أو المتجهات اختياري في DedupPolicy)،
+                والمجموعة غير المذكورة لا يُكشف فيها التكرار. المكرر لا يُنشأ له سجل: الإضافة
+                تعيد معرف السجل الموجود وتزيد عدّاد تكراره
+            quantization: تخزين المتجهات مكمّمة في فهرس numpy: none، float16، أو int8
+            rerank_candidates: عدد المرشحين الذين يُعاد ترتيبهم بالدقة الكاملة عند التكميم (0 للتعطيل)
+            shared: مشاركة db_path بين عدة عمليات (مثل عمّال Streamlit): كل تعديل يتم تحت قفل
+                ملف، والمعرفات تُخصص بعد قراءة ما كتبته العمليات الأخرى في السجل، وكل عملية
+                تطبّق الإدخالات الجديدة فقط قبل القراءة (يتطلب storage=log و backend=numpy)
+            quota: حصة التفاعلات (العدد، الحجم، العمر)؛ عند تجاوزها يُحذف الأقدم فور الإضافة
+            embedding_cache: ذاكرة مؤقتة للتضمينات مشتركة مع ذاكرات أخرى بنفس دالة التضمين
+                (تتجاهل embedding_cache_size و persist_embedding_cache)
+        """
+        if storage not in ("log", "json"):
+            raise ValueError(f"طريقة حفظ غير معروفة: {storage}")
+        if backend not in ("chroma", "numpy"):
+            raise ValueError(f"فهرس متجهات غير معروف: {backend}")
+        if segment_size < 1:
+            raise ValueError("segment_size يجب أن يكون 1 على الأقل")
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"نوع تكميم غير معروف: {quantization}")
+        if quantization != "none" and backend != "numpy":
+            raise ValueError("تكميم المتجهات يتطلب backend=numpy")
+        if shared and (storage != "log" or backend != "numpy"):
+            # فهرس ChromaDB يحمّل المتجهات في ذاكرة كل عملية فلا يرى إضافات العمليات الأخرى
+            raise ValueError("الوضع المشترك بين العمليات يتطلب storage=log و backend=numpy")
+
+        self.db_path = db_path
+        self.storage = storage
+        os.makedirs(db_path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._file_lock: Optional[FileLock] = None
+        if shared:
+            self._file_lock = FileLock(os.path.join(db_path, "memory.lock"))
+        self._search_executor: Optional[ThreadPoolExecutor] = None
+        self._retention_scheduler: Optional[RetentionScheduler] = None
+        self._writer: Optional[MemoryWriter] = None
+        
+        # دالة التضمين مع ذاكرة مؤقتة مشتركة بين الإدخال والبحث
+        self.embedding_function = resolve_embedding_function(embedding_function)
+        self.embedding_model = embedding_model_id(self.embedding_function)
+        self.embedding_cache = embedding_cache or EmbeddingCache(
+            model_id=self.embedding_model,
+            max_entries=embedding_cache_size,
+            persist_path=os.path.join(db_path, "embedding_cache.npz") if persist_embedding_cache else None
+        )
+        
+        self.search_cache = SearchResultCache(
+            max_entries=search_cache_size, ttl_seconds=search_cache_ttl
+        )
+        
+        # إنشاء فهارس الذاكرة (فهرس منفصل لكل نموذج تضمين لاختلاف أبعاد المتجهات)
+        self.backend = backend
+        self.quantization = quantization
+        self.rerank_candidates = rerank_candidates
+        self.persistent_index = persistent_index
+        self.client = None
+        self.interactions_backend = self._create_backend(
+            "interactions", "سجل التفاعلات والمحادثات"
+        )
+        self.lessons_backend = self._create_backend(
+            "lessons", "الدروس المستفادة والخبرات"
+        )
+        
+        self.lexical_index: Optional[LexicalIndex] = None
+        if lexical_index:
+            self.lexical_index = LexicalIndex(os.path.join(db_path, "lexical.sqlite3"))
+        self.hybrid_candidates = hybrid_candidates
+        
+        self.memory_file = os.path.join(db_path, "memory.json")
+        self._log: Optional[MemoryLog] = None
+        if storage == "log":
+            self._log = MemoryLog(
+                os.path.join(db_path, "memory.log"),
+                self.memory_file,
+                fsync_policy=fsync_policy,
+                compact_threshold=compact_threshold,
+                lock=self._file_lock
+            )
+        self.lesson_index = LessonIndex()
+        
+        # كشف التكرار عند الإدخال: المكرر يُدمج في السجل الأصلي (hit_count, last_seen)
+        if dedup is None:
+            dedup = {"interactions": DedupPolicy(), "lessons": DedupPolicy()}
+        self.deduplicators = {
+            collection: Deduplicator(policy)
+            for collection, policy in dedup.items() if policy.is_enabled()
+        }
+        self._embedding_dim: Optional[int] = None
+        self._interactions_bytes = 0
+        
+        # الطبقة الباردة: تفاعلات قديمة في مقاطع على القرص
+        self.hot_interactions = hot_interactions
+        self.segment_size = segment_size
+        self.cold_store: Optional[SegmentStore] = None
+        if hot_interactions is not None:
+            self.cold_store = SegmentStore(os.path.join(db_path, "segments"))
+        with self._exclusive(sync=False):
+            self._load_memory()
+        
+        # فهرسة السجلات الموجودة في memory.json والناقصة من الفهرس فقط
+        self.reconcile_batch_size = reconcile_batch_size
+        self.reconcile_stats = self.reconcile_index()
+        
+        # الحصة قد تكون أصغر مما حُفظ في تشغيل سابق
+        self.quota = quota if quota is not None and not quota.is_empty() else None
+        self.quota_evictions = 0
+        self._enforce_quota()
+
+    def _create_backend(self, name: str, description: str) -> MemoryBackend:
+        """إنشاء فهرس متجهات لمجموعة"""
+        suffix = "" if self.embedding_model == "default" else \
+            "_" + re.sub(r"[^a-zA-Z0-9._-]", "-", self.embedding_model)
+        
+        if self.backend == "numpy":
+            # فهرس منفصل لكل نوع تكميم، تملؤه مطابقة الفهرس عند أول تشغيل
+            if self.quantization != "none":
+                suffix += f"_{self.quantization}"
+            return NumpyBackend(
+                os.path.join(self.db_path, "vectors", f"{name}{suffix}"),
+                quantization=self.quantization,
+                rerank_candidates=self.rerank_candidates
+            )
+        
+        # ChromaDB يُستورد عند الحاجة فقط لثقل تحميله
+        if self.client is None:
+            import chromadb
+            if self.persistent_index:
+                self.client = chromadb.PersistentClient(path=self.db_path)
+            else:
+                self.client = chromadb.EphemeralClient()
+        
+        collection = self.client.get_or_create_collection(
+            name=f"{name}{suffix}",
+            metadata={"description": description}
+        )
+        return ChromaBackend(collection)
+
+    def _load_memory(self):
+        """تحميل الذاكرة من الملف"""
+        self._load_memory_data()
+        self._drop_spilled_duplicates()
+        self._rebuild_derived_state()
+
+    @contextlib.contextmanager
+    def _exclusive(self, sync: bool = True):
+        """
+        حجز قفل الذاكرة، والقفل بين العمليات في الوضع المشترك مع تطبيق ما كتبته
+        العمليات الأخرى أولاً، فتُخصص المعرفات وتُلحق الإدخالات على أحدث حالة
+        """
+        with self._lock:
+            if self._file_lock is None:
+                yield
+                return
+            with self._file_lock:
+                if sync:
+                    self._sync_from_log()
+                yield
+
+    def refresh(self):
+        """تطبيق التغييرات التي كتبتها العمليات الأخرى (في الوضع المشترك فقط)"""
+        if self._file_lock is not None:
+            with self._exclusive():
+                pass
+
+    def _sync_from_log(self):
+        """قراءة الإدخالات الجديدة من السجل المشترك وتطبيقها (يُستدعى والقفلان محجوزان)"""
+        entries = self._log.poll()
+        if entries is None:
+            self._reload_from_disk()
+        else:
+            self._apply_remote_entries(entries)
+        self.interactions_backend.refresh()
+        self.lessons_backend.refresh()
+
+    def _apply_remote_entries(self, entries: List[Dict[str, Any]]):
+        """تطبيق إدخالات عمليات أخرى مع تحديث الفهارس المشتقة تدريجياً"""
+        changed = set()
+        for entry in entries:
+            op = entry.get("op")
+            if op in ("add_interaction", "add_lesson"):
+                kind = op[len("add_"):]
+                self._import_record(kind, entry["record"])
+                changed.add(self._EXPORT_KINDS[kind][0])
+            elif op in ("trim_interactions", "spill_interactions"):
+                interactions = self.memory_data["interactions"]
+                expired = interactions[:entry["count"]]
+                del interactions[:entry["count"]]
+                self._interactions_bytes -= sum(self._record_size(record) for record in expired)
+                self._forget_fingerprints("interactions", [record["id"] for record in expired])
+                if op == "spill_interactions":
+                    self.cold_store.reload()
+                changed.add("interactions")
+            elif op == "trim_cold":
+                self.cold_store.reload()
+                changed.add("interactions")
+            elif op == "touch_record":
+                self._touch_record(entry["collection"], entry["id"], entry["hit_count"], entry["last_seen"])
+            else:
+                # استبدال البيانات كاملة (استيراد أو حذف الكل) في عملية أخرى
+                self._reload_from_disk()
+                return
+        
+        for collection in changed:
+            self.search_cache.invalidate(collection)
+
+    def _reload_from_disk(self):
+        """إعادة التحميل من اللقطة والسجل عندما تفوت العملية إدخالات ضُغطت في لقطة"""
+        self._log.reset()
+        if self.cold_store is not None:
+            self.cold_store.reload()
+        self._load_memory()
+        self.search_cache.invalidate("interactions")
+        self.search_cache.invalidate("lessons")
+
+    def _drop_spilled_duplicates(self):
+        """
+        إزالة التفاعلات التي نُقلت إلى آخر مقطع قبل تسجيل عملية النقل
+        (انقطاع بين كتابة المقطع وإلحاق spill_interactions بالسجل)
+        """
+        if self.cold_store is None or not self.cold_store.segments:
+            return
+        spilled = set(self.cold_store.ids(self.cold_store.segments[-1]["name"]))
+        interactions = self.memory_data["interactions"]
+        if any(record["id"] in spilled for record in interactions):
+            self.memory_data["interactions"] = [
+                record for record in interactions if record["id"] not in spilled
+            ]
+
+    def _rebuild_derived_state(self):
+        """إعادة بناء الفهارس والعدّادات المشتقة من بيانات الذاكرة"""
+        interactions = self.memory_data["interactions"]
+        
+        # التفاعلات مرتبة زمنياً ليعمل البحث الثنائي في نظام الاحتفاظ
+        if any(interactions[i]["timestamp"] > interactions[i + 1]["timestamp"]
+               for i in range(len(interactions) - 1)):
+            interactions.sort(key=lambda interaction: interaction["timestamp"])
+        
+        self._interactions_bytes = sum(self._record_size(record) for record in interactions)
+        cold_max_id = self.cold_store.max_id_number() if self.cold_store is not None else 0
+        self._next_ids = {
+            "interaction": max(self._max_id_number(interactions), cold_max_id) + 1,
+            "lesson": self._max_id_number(self.memory_data["lessons"]) + 1
+        }
+        self.lesson_index.rebuild(self.memory_data["lessons"])
+        
+        for collection, deduplicator in self.deduplicators.items():
+            deduplicator.clear()
+            for record in self.memory_data[collection]:
+                self._register_fingerprint(collection, record)
+
+    @staticmethod
+    def _max_id_number(records: List[Dict]) -> int:
+        """أكبر رقم مستخدم في معرفات السجلات (مثل interaction_42)"""
+        numbers = [0]
+        for record in records:
+            suffix = str(record.get("id", "")).rsplit("_", 1)[-1]
+            if suffix.isdigit():
+                numbers.append(int(suffix))
+        return max(numbers)
+
+    def _allocate_id(self, kind: str) -> str:
+        """تخصيص معرف جديد لا يتكرر حتى بعد حذف السجلات القديمة"""
+        number = self._next_ids[kind]
+        self._next_ids[kind] = number + 1
+        return f"{kind}_{number}"
+
+    @staticmethod
+    def _record_size(record: Dict[str, Any]) -> int:
+        """حجم السجل بالبايت في تمثيله JSON"""
+        return len(json.dumps(record, ensure_ascii=False).encode('utf-8'))
+
+    def _load_memory_data(self):
+        """قراءة بيانات الذاكرة من اللقطة والسجل أو من ملف json"""
+        if self._log is not None:
+            self._load_from_log()
+        elif os.path.exists(self.memory_file):
+            try:
+                with open(self.memory_file, 'r', encoding='utf-8') as f:
+                    self.memory_data = json.load(f)
+                self.memory_data.pop("log_seq", None)
+            except Exception as e:
+                print(f"خطأ في تحميل الذاكرة: {e}")
+                self.memory_data = {"interactions": [], "lessons": []}
+        else:
+            self.memory_data = {"interactions": [], "lessons": []}
+
+    def _load_from_log(self):
+        """تحميل اللقطة ثم إعادة تشغيل السجل فوقها"""
+        try:
+            self.memory_data = self._log.load_snapshot() or {"interactions": [], "lessons": []}
+        except Exception as e:
+            print(f"خطأ في تحميل الذاكرة: {e}")
+            self.memory_data = {"interactions": [], "lessons": []}
+
+        for entry in self._log.replay():
+            self._apply_log_entry(entry)
+
+    def _apply_log_entry(self, entry: Dict[str, Any]):
+        """تطبيق إدخال من السجل على بيانات الذاكرة"""
+        op = entry.get("op")
+        if op == "add_interaction":
+            self.memory_data["interactions"].append(entry["record"])
+        elif op == "add_lesson":
+            self.memory_data["lessons"].append(entry["record"])
+        elif op in ("trim_interactions", "spill_interactions"):
+            del self.memory_data["interactions"][:entry["count"]]
+        elif op == "touch_record":
+            self._touch_record(entry["collection"], entry["id"], entry["hit_count"], entry["last_seen"])
+        elif op in ("trim_cold", "snapshot"):
+            # علامات للعمليات الأخرى في الوضع المشترك؛ المقاطع واللقطة هي المرجع
+            pass
+        else:
+            print(f"عملية غير معروفة في سجل الذاكرة: {op}")
+
+    def _save_memory(self):
+        """حفظ الذاكرة إلى الملف"""
+        if self._log is not None:
+            # في وضع السجل يكون الحفظ الكامل عبارة عن ضغط فوري
+            if self._file_lock is not None:
+                # علامة تُعلم العمليات الأخرى بأن عليها إعادة التحميل من اللقطة
+                self._log.append("snapshot")
+            self._compact_log()
+            return
+
+        try:
+            with open(self.memory_file, 'w', encoding='utf-8') as f:
+                json.dump(self.memory_data, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            print(f"خطأ في حفظ الذاكرة: {e}")
+
+    def _persist(self, op: str, **payload):
+        """
+        حفظ عملية واحدة: إلحاق O(1) بالسجل، أو إعادة كتابة الملف في وضع json
+        
+        Args:
+            op: اسم العملية
+            **payload: بيانات العملية
+        """
+        self._persist_many([dict(payload, op=op)])
+
+    def _persist_many(self, entries: List[Dict[str, Any]]):
+        """حفظ عدة عمليات بكتابة واحدة"""
+        if self._log is None:
+            self._save_memory()
+            return
+
+        try:
+            self._log.append_many(entries)
+        except Exception as e:
+            print(f"خطأ في حفظ الذاكرة: {e}")
+            return
+
+        if self._log.should_compact():
+            if self._file_lock is not None:
+                # الضغط تحت القفل بين العمليات حتى لا تحذف عملية سجلات لم تقرأها أخرى
+                self._compact_log()
+            else:
+                self._log.compact_in_background(self._prepare_compaction)
+
+    def _prepare_compaction(self):
+        """تدوير السجل وأخذ نسخة سطحية متسقة من البيانات"""
+        with self._exclusive():
+            seq = self._log.rotate()
+            data = {key: list(value) for key, value in self.memory_data.items()}
+        return data, seq
+
+    def _compact_log(self):
+        """
+        ضغط السجل في اللقطة فوراً
+        لا ينتظر الضغط الخلفي الجاري: المستدعي قد يحجز قفل الذاكرة الذي يحتاجه ذلك الضغط،
+        ولقطته الأقدم تُتجاهل إن كُتبت بعد هذه
+        """
+        try:
+            data, seq = self._prepare_compaction()
+            self._log.write_snapshot(data, seq)
+        except Exception as e:
+            print(f"خطأ في حفظ الذاكرة: {e}")
+
+    @staticmethod
+    def _interaction_document(user_input: str, agent_response: str) -> str:
+        """نص التفاعل في الفهرس"""
+        return f"{user_input} {agent_response}"
+
+    @staticmethod
+    def _interaction_index_entry(interaction: Dict[str, Any]):
+        """بناء (المعرف، المستند، البيانات الوصفية) لتفاعل في الفهرس"""
+        return (
+            interaction["id"],
+            Memory._interaction_document(interaction["user_input"], interaction["agent_response"]),
+            {
+                "timestamp": interaction["timestamp"],
+                "user_input": interaction["user_input"][:500],  # تقليص الطول
+                "type": "interaction"
+            }
+        )
+
+    @staticmethod
+    def _lesson_index_entry(lesson: Dict[str, Any]):
+        """بناء (المعرف، المستند، البيانات الوصفية) لدرس في الفهرس"""
+        return (
+            lesson["id"],
+            lesson["lesson"],
+            {
+                "timestamp": lesson["timestamp"],
+                "category": lesson["category"],
+                "importance": lesson["importance"],
+                "type": "lesson"
+            }
+        )
+
+    def _reconcile_collection(self, collection: str, records: List[Dict],
+                              build_entry) -> int:
+        """
+        إضافة السجلات الناقصة من فهرس المتجهات (والفهرس النصي) على دفعات
+        
+        Returns:
+            عدد السجلات التي تمت فهرستها متجهياً
+        """
+        backend = getattr(self, f"{collection}_backend")
+        added = 0
+        for start in range(0, len(records), self.reconcile_batch_size):
+            batch = records[start:start + self.reconcile_batch_size]
+            ids = [record["id"] for record in batch]
+            
+            if self.lexical_index is not None:
+                existing = self.lexical_index.existing_ids(collection, ids)
+                entries = [build_entry(record) for record in batch if record["id"] not in existing]
+                if entries:
+                    self.lexical_index.add(
+                        collection,
+                        [entry[0] for entry in entries],
+                        [entry[1] for entry in entries],
+                        [entry[2] for entry in entries]
+                    )
+            
+            existing = backend.existing_ids(ids)
+            
+            missing = {}
+            for record in batch:
+                if record["id"] not in existing and record["id"] not in missing:
+                    missing[record["id"]] = build_entry(record)
+            
+            if missing:
+                entries = list(missing.values())
+                documents = [entry[1] for entry in entries]
+                backend.add(
+                    [entry[0] for entry in entries],
+                    self._embed(documents),
+                    documents,
+                    [entry[2] for entry in entries]
+                )
+                added += len(entries)
+        return added
+
+    def reconcile_index(self) -> Dict[str, int]:
+        """
+        مطابقة فهرس المتجهات مع memory.json
+        يضمّن فقط السجلات غير المفهرسة، فتكون كلفة البدء بحجم الفرق لا بحجم السجل كاملاً
+        
+        Returns:
+            عدد السجلات المضافة لكل مجموعة
+        """
+        stats = {"interactions": 0, "lessons": 0}
+        with self._exclusive():
+            try:
+                stats["interactions"] = self._reconcile_collection(
+                    "interactions",
+                    self.memory_data["interactions"],
+                    self._interaction_index_entry
+                )
+                stats["interactions"] += self._reconcile_cold()
+                stats["lessons"] = self._reconcile_collection(
+                    "lessons",
+                    self.memory_data["lessons"],
+                    self._lesson_index_entry
+                )
+            except Exception as e:
+                print(f"خطأ في مطابقة الفهرس: {e}")
+            
+            for collection, added in stats.items():
+                if added:
+                    self.search_cache.invalidate(collection)
+        return stats
+
+    def _reconcile_cold(self) -> int:
+        """
+        مطابقة المقاطع الباردة مع الفهرس؛ تُفتح المقاطع فقط إذا كان الفهرس
+        أصغر من عدد التفاعلات الكلي
+        """
+        if self.cold_store is None or not self.cold_store.segments:
+            return 0
+        if self.interactions_backend.count() >= self._total_interactions():
+            return 0
+        return sum(
+            self._reconcile_collection(
+                "interactions", self.cold_store.load(meta["name"]), self._interaction_index_entry
+            )
+            for meta in list(self.cold_store.segments)
+        )
+
+    def _total_interactions(self) -> int:
+        """عدد التفاعلات في الطبقتين"""
+        cold = self.cold_store.count() if self.cold_store is not None else 0
+        return len(self.memory_data["interactions"]) + cold
+
+    def _maybe_spill(self):
+        """
+        نقل أقدم التفاعلات إلى مقطع على القرص عندما تتجاوز الطبقة الساخنة حدها
+        بمقطع كامل (يُستدعى والقفل محجوز بعد حفظ الإضافات)
+        """
+        if self.cold_store is None:
+            return
+        interactions = self.memory_data["interactions"]
+        while len(interactions) >= self.hot_interactions + self.segment_size:
+            records = interactions[:self.segment_size]
+            meta = self.cold_store.append(records)
+            del interactions[:self.segment_size]
+            self._forget_fingerprints("interactions", [record["id"] for record in records])
+            self._interactions_bytes -= meta["bytes"]
+            self._persist("spill_interactions", count=len(records), segment=meta["name"])
+
+    def _restore_cold_order(self) -> bool:
+        """
+        إعادة الترتيب الزمني للطبقة الباردة بعد دمج تفاعلات أقدم من مقاطعها (يُستدعى والقفل محجوز)
+        المقاطع من أول مقطع متداخل مع ما بعده تُدمج مع الطبقة الساخنة دمجاً متدفقاً وتُعاد كتابتها،
+        فلا يُحمّل في الذاكرة إلا سجل واحد من كل مقطع
+
+        Returns:
+            هل أعيدت كتابة مقاطع
+        """
+        if self.cold_store is None or not self.cold_store.segments:
+            return False
+        segments = self.cold_store.segments
+        hot = sorted(self.memory_data["interactions"], key=lambda record: record["timestamp"])
+        
+        # أقدم مقطع ينتهي بعد بداية سجل في مقطع أحدث منه أو في الطبقة الساخنة
+        first = None
+        newer_start = hot[0]["timestamp"] if hot else None
+        for index in range(len(segments) - 1, -1, -1):
+            if newer_start is not None and segments[index]["end"] > newer_start:
+                first = index
+            start = segments[index]["start"]
+            newer_start = start if newer_start is None else min(newer_start, start)
+        if first is None:
+            return False
+        
+        # المقاطع المنقولة أثناء الاستيراد قد لا تكون مرتبة داخلياً؛ تُرتب واحداً واحداً قبل الدمج
+        for index in range(first, len(segments)):
+            self.cold_store.sort_segment(index)
+        
+        cold_count = sum(meta["count"] for meta in segments[first:])
+        merged = heapq.merge(
+            *[self.cold_store.iter_segment(meta["name"]) for meta in segments[first:]], hot,
+            key=lambda record: record["timestamp"]
+        )
+        
+        def _chunks():
+            chunk = []
+            for _, record in zip(range(cold_count), merged):
+                chunk.append(record)
+                if len(chunk) == self.segment_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+        
+        self.cold_store.rewrite_from(first, _chunks())
+        # ما بقي بعد ملء المقاطع هو الأحدث ويعود إلى الطبقة الساخنة بنفس عدده
+        self.memory_data["interactions"] = list(merged)
+        self.search_cache.invalidate("interactions")
+        return True
+
+    def _index_lexical(self, collection: str, ids: List[str], documents: List[str],
+                       metadatas: List[Dict[str, Any]]):
+        """إضافة مستندات إلى الفهرس النصي إن كان مفعلاً"""
+        if self.lexical_index is not None:
+            self.lexical_index.add(collection, ids, documents, metadatas)
+
+    def _embed(self, texts: List[str]) -> List:
+        """تضمين النصوص عبر الذاكرة المؤقتة"""
+        embeddings = self.embedding_cache.embed(texts, self.embedding_function)
+        if len(embeddings) and self._embedding_dim is None:
+            self._embedding_dim = len(embeddings[0])
+        return embeddings
+
+    @staticmethod
+    def _dedup_text(collection: str, record: Dict[str, Any]) -> str:
+        """النص الذي تُحسب منه بصمات التكرار (نص السجل في الفهرس)"""
+        if collection == "interactions":
+            return Memory._interaction_document(record["user_input"], record["agent_response"])
+        return record["lesson"]
+
+    def _register_fingerprint(self, collection: str, record: Dict[str, Any]):
+        """تسجيل بصمات سجل جديد في كاشف التكرار للمجموعة"""
+        deduplicator = self.deduplicators.get(collection)
+        if deduplicator is not None:
+            deduplicator.add(record["id"], self._dedup_text(collection, record))
+
+    def _forget_fingerprints(self, collection: str, ids: List[str]):
+        """حذف بصمات سجلات لم تعد في الذاكرة الساخنة"""
+        deduplicator = self.deduplicators.get(collection)
+        if deduplicator is not None:
+            deduplicator.remove(ids)
+
+    def _find_duplicate(self, collection: str, document: str) -> Optional[str]:
+        """
+        البحث عن سجل أصلي مكرر لنص جديد، ودمج التكرار فيه إن وُجد
+        (يُستدعى والقفل محجوز)
+        
+        Returns:
+            معرف السجل الأصلي، أو None إذا لم يكن النص مكرراً
+        """
+        deduplicator = self.deduplicators.get(collection)
+        if deduplicator is None:
+            return None
+        
+        match = deduplicator.find(document)
+        if match is None and deduplicator.policy.embedding_distance is not None:
+            hits = self._vector_hits(collection, self._embed([document])[0], 1)
+            if (hits and hits[0]["distance"] <= deduplicator.policy.embedding_distance
+                    and hits[0]["id"] in deduplicator):
+                match = (hits[0]["id"], "embedding")
+        if match is None:
+            return None
+        
+        record_id, kind = match
+        record = self._touch_record(collection, record_id)
+        if record is None:
+            return None
+        self._persist(
+            "touch_record", collection=collection, id=record_id,
+            hit_count=record["hit_count"], last_seen=record["last_seen"]
+        )
+        
+        vector_bytes = 4 * self._embedding_dim if self._embedding_dim else 0
+        deduplicator.record_duplicate(kind, len(document.encode('utf-8')) + vector_bytes)
+        return record_id
+
+    def _touch_record(self, collection: str, record_id: str,
+                      hit_count: Optional[int] = None,
+                      last_seen: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        تحديث عدّاد التكرار وآخر ظهور لسجل
+        النسخ عند التعديل: يُستبدل السجل بنسخة جديدة لأن الضغط في الخلفية
+        يكتب نسخاً سطحية من القوائم قد تشير إلى السجل القديم
+        
+        Returns:
+            السجل المحدّث، أو None إذا لم يعد السجل في الذاكرة
+        """
+        records = self.memory_data[collection]
+        # التكرار غالباً لسجل حديث، فيبدأ البحث من النهاية
+        for position in range(len(records) - 1, -1, -1):
+            if records[position]["id"] == record_id:
+                break
+        else:
+            return None
+        
+        old = records[position]
+        new = dict(
+            old,
+            hit_count=hit_count if hit_count is not None else old.get("hit_count", 1) + 1,
+            last_seen=last_seen or datetime.now().isoformat()
+        )
+        records[position] = new
+        if collection == "interactions":
+            self._interactions_bytes += self._record_size(new) - self._record_size(old)
+        else:
+            self.lesson_index.replace(old, new)
+        return new
+
+    def close(self):
+        """إغلاق الذاكرة ومزامنة السجل مع القرص"""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self.stop_retention()
+        if self._log is not None:
+            self._log.close()
+        if self._search_executor is not None:
+            self._search_executor.shutdown(wait=True)
+            self._search_executor = None
+        self.interactions_backend.close()
+        self.lessons_backend.close()
+        if self.lexical_index is not None:
+            self.lexical_index.close()
+        if self._file_lock is not None:
+            self._file_lock.close()
+        self.embedding_cache.save()
+
+    def _build_interaction(self, user_input: str, agent_response: str,
+                           metadata: Optional[Dict[str, Any]] = None) -> Union[Dict[str, Any], str]:
+        """
+        إنشاء سجل تفاعل جديد وإلحاقه ببيانات الذاكرة
+        
+        Returns:
+            السجل الجديد، أو معرف السجل الأصلي إذا كان التفاعل مكرراً
+        """
+        duplicate = self._find_duplicate(
+            "interactions", self._interaction_document(user_input, agent_response)
+        )
+        if duplicate is not None:
+            return duplicate
+        
+        interaction = {
+            "id": self._allocate_id("interaction"),
+            "timestamp": datetime.now().isoformat(),
+            "user_input": user_input,
+            "agent_response": agent_response,
+            "metadata": metadata or {}
+        }
+        self.memory_data["interactions"].append(interaction)
+        self._interactions_bytes += self._record_size(interaction)
+        self._register_fingerprint("interactions", interaction)
+        return interaction
+
+    def add_interaction_async(self, user_input: str, agent_response: str,
+                              metadata: Optional[Dict[str, Any]] = None) -> Future:
         """
-        تهيئة نظام الذاكرة
+        إضافة تفاعل عبر كاتب الخلفية دون انتظار التضمين والحفظ
+        عمليات البحث اللاحقة تنتظر اكتمال الكتابة، فتظهر فيها التفاعلات المضافة
         
         Args:
-            db_path: مسار قاعدة بيانات ChromaDB
+            user_input: مدخل المستخدم
+            agent_response: رد الوكيل
+            metadata: معلومات إضافية
+            
+        Returns:
+            Future يحمل معرف التفاعل بعد كتابته
         """
-        self.db_path = db_path
-        os.makedirs(db_path, exist_ok=True)
-        
-        # إعداد ChromaDB
-        self.client = chromadb.EphemeralClient()
-        
-        # إنشاء مجموعات الذاكرة
-        self.interactions_collection = self.client.get_or_create_collection(
-            name="interactions",
-            metadata={"description": "سجل التفاعلات والمحادثات"}
-        )
-        
-        self.lessons_collection = self.client.get_or_create_collection(
-            name="lessons",
-            metadata={"description": "الدروس المستفادة والخبرات"}
-        )
-        
-        self.memory_file = os.path.join(db_path, "memory.json")
-        self._load_memory()
+        with self._lock:
+            if self._writer is None:
+                self._writer = MemoryWriter(self)
+        return self._writer.submit(user_input, agent_response, metadata)
 
-    def _load_memory(self):
-        """تحميل الذاكرة من الملف"""
-        if os.path.exists(self.memory_file):
-            try:
-                with open(self.memory_file, 'r', encoding='utf-8') as f:
-                    self.memory_data = json.load(f)
-            except Exception as e:
-                print(f"خطأ في تحميل الذاكرة: {e}")
-                self.memory_data = {"interactions": [], "lessons": []}
-        else:
-            self.memory_data = {"interactions": [], "lessons": []}
+    def flush(self):
+        """انتظار كتابة كل التفاعلات المعلقة في كاتب الخلفية"""
+        if self._writer is not None:
+            self._writer.flush()
 
-    def _save_memory(self):
-        """حفظ الذاكرة إلى الملف"""
-        try:
-            with open(self.memory_file, 'w', encoding='utf-8') as f:
-                json.dump(self.memory_data, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"خطأ في حفظ الذاكرة: {e}")
+    def _wait_for_pending_writes(self):
+        """ضمان قراءة ما كُتب: انتظار الكتابات المعلقة قبل القراءة"""
+        if self._writer is not None and self._writer.pending():
+            self._writer.flush()
+
+    def _build_lesson(self, lesson: str, category: str,
+                      importance: int = 5) -> Union[Dict[str, Any], str]:
+        """
+        إنشاء سجل درس جديد وإلحاقه ببيانات الذاكرة
+        
+        Returns:
+            السجل الجديد، أو معرف الدرس الأصلي إذا كان الدرس مكرراً
+        """
+        duplicate = self._find_duplicate("lessons", lesson)
+        if duplicate is not None:
+            return duplicate
+        
+        lesson_entry = {
+            "id": self._allocate_id("lesson"),
+            "timestamp": datetime.now().isoformat(),
+            "lesson": lesson,
+            "category": category,
+            "importance": importance
+        }
+        self.memory_data["lessons"].append(lesson_entry)
+        self.lesson_index.add(lesson_entry)
+        self._register_fingerprint("lessons", lesson_entry)
+        return lesson_entry
 
     def add_interaction(self, user_input: str, agent_response: str, 
                        metadata: Optional[Dict[str, Any]] = None) -> str:
@@ -72,34 +1446,26 @@ class Memory:
             metadata: معلومات إضافية
             
         Returns:
-            معرف التفاعل
+            معرف التفاعل؛ إذا كان مكرراً فمعرف التفاعل الموجود (بنصه الأصلي ورده)
+            ولا يُنشأ تفاعل جديد
         """
-        interaction_id = f"interaction_{len(self.memory_data['interactions']) + 1}"
-        timestamp = datetime.now().isoformat()
-        
-        interaction = {
-            "id": interaction_id,
-            "timestamp": timestamp,
-            "user_input": user_input,
-            "agent_response": agent_response,
-            "metadata": metadata or {}
-        }
-        
-        self.memory_data["interactions"].append(interaction)
-        
-        # إضافة إلى ChromaDB
-        self.interactions_collection.add(
-            ids=[interaction_id],
-            documents=[f"{user_input} {agent_response}"],
-            metadatas=[{
-                "timestamp": timestamp,
-                "user_input": user_input[:500],  # تقليص الطول
-                "type": "interaction"
-            }]
-        )
-        
-        self._save_memory()
-        return interaction_id
+        with self._exclusive():
+            interaction = self._build_interaction(user_input, agent_response, metadata)
+            if isinstance(interaction, str):
+                return interaction
+            
+            # إضافة إلى فهرس المتجهات
+            entry_id, document, entry_metadata = self._interaction_index_entry(interaction)
+            self.interactions_backend.add(
+                [entry_id], self._embed([document]), [document], [entry_metadata]
+            )
+            self._index_lexical("interactions", [entry_id], [document], [entry_metadata])
+            
+            self.search_cache.invalidate("interactions")
+            self._persist("add_interaction", record=interaction)
+            self._enforce_quota()
+            self._maybe_spill()
+        return interaction["id"]
 
     def add_lesson(self, lesson: str, category: str, 
                    importance: int = 5) -> str:
@@ -112,143 +1478,687 @@ class Memory:
             importance: مستوى الأهمية (1-10)
             
         Returns:
-            معرف الدرس
+            معرف الدرس؛ إذا كان مكرراً فمعرف الدرس الموجود (بنصه الأصلي) ولا يُنشأ درس جديد
         """
-        lesson_id = f"lesson_{len(self.memory_data['lessons']) + 1}"
-        timestamp = datetime.now().isoformat()
+        with self._exclusive():
+            lesson_entry = self._build_lesson(lesson, category, importance)
+            if isinstance(lesson_entry, str):
+                return lesson_entry
+            
+            # إضافة إلى فهرس المتجهات
+            entry_id, document, entry_metadata = self._lesson_index_entry(lesson_entry)
+            self.lessons_backend.add(
+                [entry_id], self._embed([document]), [document], [entry_metadata]
+            )
+            self._index_lexical("lessons", [entry_id], [document], [entry_metadata])
+            
+            self.search_cache.invalidate("lessons")
+            self._persist("add_lesson", record=lesson_entry)
+        return lesson_entry["id"]
+
+    def _index_records(self, collection_name: str, op: str, build_entry: Callable,
+                       records: List[Dict[str, Any]]):
+        """تضمين دفعة سجلات وفهرستها وحفظها (يُستدعى والقفل محجوز)"""
+        entries = [build_entry(record) for record in records]
+        ids = [entry[0] for entry in entries]
+        documents = [entry[1] for entry in entries]
+        metadatas = [entry[2] for entry in entries]
+        getattr(self, f"{collection_name}_backend").add(
+            ids, self._embed(documents), documents, metadatas
+        )
+        self._index_lexical(collection_name, ids, documents, metadatas)
+        self.search_cache.invalidate(collection_name)
+        self._persist_many([{"op": op, "record": record} for record in records])
+        if collection_name == "interactions":
+            self._enforce_quota()
+            self._maybe_spill()
+
+    def _add_bulk(self, items: Iterable, build_record: Callable, build_entry: Callable,
+                  collection_name: str, op: str, batch_size: int,
+                  progress_callback: Optional[Callable[[int, float], None]]) -> Dict[str, Any]:
+        """
+        إدخال مجمّع: تضمين وفهرسة وحفظ مرة واحدة لكل دفعة
         
-        lesson_entry = {
-            "id": lesson_id,
-            "timestamp": timestamp,
-            "lesson": lesson,
-            "category": category,
-            "importance": importance
+        Returns:
+            المعرفات (المكرر بمعرف سجله الأصلي) والعدد وعدد المكررات المدموجة والزمن ومعدل الإدخال
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size يجب أن يكون 1 على الأقل")
+
+        start_time = time.perf_counter()
+        ids: List[str] = []
+        batch: List[Any] = []
+        duplicates = [0]
+
+        def _flush_batch():
+            with self._exclusive():
+                built = [build_record(item) for item in batch]
+                # المكررات تعود بمعرف السجل الأصلي ولا تُفهرس من جديد
+                records = [record for record in built if not isinstance(record, str)]
+                if records:
+                    self._index_records(collection_name, op, build_entry, records)
+            ids.extend(record if isinstance(record, str) else record["id"] for record in built)
+            duplicates[0] += len(built) - len(records)
+            batch.clear()
+
+            if progress_callback:
+                elapsed = time.perf_counter() - start_time
+                progress_callback(len(ids), len(ids) / elapsed if elapsed > 0 else 0.0)
+
+        for item in items:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                _flush_batch()
+        if batch:
+            _flush_batch()
+
+        elapsed = time.perf_counter() - start_time
+        return {
+            "ids": ids,
+            "count": len(ids),
+            "duplicates": duplicates[0],
+            "elapsed_seconds": elapsed,
+            "records_per_sec": len(ids) / elapsed if elapsed > 0 else 0.0
         }
+
+    def add_interactions_bulk(self, interactions: Iterable, batch_size: int = 64,
+                              progress_callback: Optional[Callable[[int, float], None]] = None
+                              ) -> Dict[str, Any]:
+        """
+        إضافة مجموعة كبيرة من التفاعلات (مثل استيراد سجلات محادثات قديمة)
         
-        self.memory_data["lessons"].append(lesson_entry)
-        
-        # إضافة إلى ChromaDB
-        self.lessons_collection.add(
-            ids=[lesson_id],
-            documents=[lesson],
-            metadatas=[{
-                "timestamp": timestamp,
-                "category": category,
-                "importance": importance,
-                "type": "lesson"
-            }]
+        Args:
+            interactions: عناصر على شكل قاموس (user_input, agent_response, metadata)
+                أو مجموعة (user_input, agent_response[, metadata])
+            batch_size: عدد السجلات في كل دفعة تضمين وحفظ
+            progress_callback: دالة تُستدعى بعد كل دفعة بـ (العدد المعالج، سجل/ثانية)
+            
+        Returns:
+            المعرفات (المكرر بمعرف سجله الأصلي) والعدد وعدد المكررات المدموجة والزمن ومعدل الإدخال
+        """
+        def _build(item):
+            if isinstance(item, dict):
+                return self._build_interaction(
+                    item["user_input"], item["agent_response"], item.get("metadata")
+                )
+            return self._build_interaction(*item)
+
+        return self._add_bulk(
+            interactions, _build, self._interaction_index_entry,
+            "interactions", "add_interaction",
+            batch_size, progress_callback
         )
+
+    def add_lessons_bulk(self, lessons: Iterable, batch_size: int = 64,
+                         progress_callback: Optional[Callable[[int, float], None]] = None
+                         ) -> Dict[str, Any]:
+        """
+        إضافة مجموعة كبيرة من الدروس المستفادة
         
-        self._save_memory()
-        return lesson_id
+        Args:
+            lessons: عناصر على شكل قاموس (lesson, category, importance)
+                أو مجموعة (lesson, category[, importance])
+            batch_size: عدد السجلات في كل دفعة تضمين وحفظ
+            progress_callback: دالة تُستدعى بعد كل دفعة بـ (العدد المعالج، سجل/ثانية)
+            
+        Returns:
+            المعرفات (المكرر بمعرف سجله الأصلي) والعدد وعدد المكررات المدموجة والزمن ومعدل الإدخال
+        """
+        def _build(item):
+            if isinstance(item, dict):
+                return self._build_lesson(
+                    item["lesson"], item.get("category", "general"), item.get("importance", 5)
+                )
+            return self._build_lesson(*item)
 
-    def search_interactions(self, query: str, n_results: int = 5) -> List[Dict]:
+        return self._add_bulk(
+            lessons, _build, self._lesson_index_entry,
+            "lessons", "add_lesson",
+            batch_size, progress_callback
+        )
+
+    @staticmethod
+    def _format_hits(collection: str, hits: List[Dict[str, Any]]) -> List[Dict]:
+        """تحويل نتائج الفهرس إلى صيغة نتائج البحث العامة"""
+        text_key = "document" if collection == "interactions" else "lesson"
+        results = []
+        for hit in hits:
+            result = {
+                "id": hit["id"],
+                text_key: hit["document"],
+                "metadata": hit["metadata"]
+            }
+            if hit.get("distance") is not None:
+                # الفهارس توحّد طول المتجهات (unit_vectors)، فالدرجة هي تشابه جيب التمام
+                result["distance"] = hit["distance"]
+                result["score"] = 1.0 - hit["distance"] / 2.0
+            results.append(result)
+        return results
+
+    @staticmethod
+    def filter_by_relevance(results: List[Dict], max_distance: Optional[float] = None,
+                            min_score: Optional[float] = None) -> List[Dict]:
         """
-        البحث عن التفاعلات السابقة
+        إبقاء النتائج التي تتجاوز عتبة الصلة
+        النتائج النصية البحتة (دون مسافة متجهية) لا تُستبعد لأنها تطابق حرفياً
         
         Args:
-            query: نص البحث
-            n_results: عدد النتائج المطلوبة
+            results: نتائج البحث
+            max_distance: أقصى مسافة متجهية مقبولة
+            min_score: أقل درجة تشابه مقبولة (من -1 إلى 1)
             
         Returns:
-            قائمة التفاعلات المطابقة
+            النتائج المقبولة بنفس الترتيب
         """
-        try:
-            results = self.interactions_collection.query(
-                query_texts=[query],
-                n_results=min(n_results, 10)
+        if max_distance is None and min_score is None:
+            return results
+        return [
+            result for result in results
+            if "distance" not in result or (
+                (max_distance is None or result["distance"] <= max_distance)
+                and (min_score is None or result["score"] >= min_score)
             )
-            
-            interactions = []
-            for i, doc in enumerate(results['documents'][0]):
-                interactions.append({
-                    "id": results['ids'][0][i],
-                    "document": doc,
-                    "metadata": results['metadatas'][0][i]
-                })
-            
-            return interactions
+        ]
+
+    def _vector_hits(self, collection: str, query_embedding, n_results: int,
+                     ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """البحث المتجهي في مجموعة (اختيارياً ضمن مرشحين محددين)"""
+        backend = getattr(self, f"{collection}_backend")
+        return backend.query(query_embedding, n_results, ids=ids)
+
+    def _hybrid_hits(self, collection: str, query: str, query_embedding,
+                     n_results: int) -> List[Dict[str, Any]]:
+        """
+        البحث الهجين: الفهرس النصي يضيّق المرشحين، ثم يُرتَّبون متجهياً،
+        ويُدمج الترتيبان بطريقة Reciprocal Rank Fusion
+        """
+        candidates = self.lexical_index.search(
+            collection, query, max(self.hybrid_candidates, n_results)
+        )
+        
+        # مسافات المرشحين النصيين من نفس الاستعلام المتجهي المحصور فيهم
+        scored_candidates = self._vector_hits(
+            collection, query_embedding, len(candidates),
+            ids=[hit["id"] for hit in candidates]
+        ) if candidates else []
+        
+        if len(candidates) >= n_results:
+            vector_hits = scored_candidates
+        else:
+            # مرشحون نصيون قليلون: بحث متجهي كامل حتى لا تنخفض الاستعادة
+            vector_hits = self._vector_hits(collection, query_embedding, n_results)
+        
+        by_id = {hit["id"]: hit for hit in candidates}
+        by_id.update({hit["id"]: hit for hit in scored_candidates})
+        by_id.update({hit["id"]: hit for hit in vector_hits})
+        fused = reciprocal_rank_fusion([
+            [hit["id"] for hit in candidates],
+            [hit["id"] for hit in vector_hits]
+        ])
+        return [by_id[record_id] for record_id in fused[:n_results]]
+
+    def _query(self, collection: str, query: str, query_embedding,
+               n_results: int, mode: str) -> Optional[List[Dict]]:
+        """تنفيذ البحث حسب النمط (None عند الفشل)"""
+        n_results = min(n_results, 10)
+        try:
+            if mode == "lexical":
+                hits = self.lexical_index.search(collection, query, n_results)
+            elif mode == "hybrid":
+                hits = self._hybrid_hits(collection, query, query_embedding, n_results)
+            else:
+                hits = self._vector_hits(collection, query_embedding, n_results)
+            return self._format_hits(collection, hits)
+        except Exception as e:
+            print(f"خطأ في البحث: {e}")
+            return None
+
+    def _embed_query(self, query: str):
+        """تضمين نص البحث، أو None عند الفشل"""
+        try:
+            return self._embed([query])[0]
         except Exception as e:
             print(f"خطأ في البحث: {e}")
+            return None
+
+    def _check_search_mode(self, mode: str):
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"نمط بحث غير معروف: {mode}")
+        if mode != "vector" and self.lexical_index is None:
+            raise ValueError(f"نمط البحث {mode} يتطلب تفعيل الفهرس النصي")
+
+    def _search_uncached(self, collection: str, query: str, n_results: int,
+                         mode: str = "vector", query_embedding=None) -> List[Dict]:
+        """البحث في الفهرس مباشرة ثم تخزين النتيجة في الذاكرة المؤقتة"""
+        generation = self.search_cache.generation(collection)
+        
+        if query_embedding is None and mode != "lexical":
+            query_embedding = self._embed_query(query)
+            if query_embedding is None:
+                return []
+        
+        results = self._query(collection, query, query_embedding, n_results, mode)
+        if results is None:
             return []
+        self.search_cache.put(collection, query, n_results, results, generation, variant=mode)
+        return results
+
+    def _search_collection(self, collection: str, query: str, n_results: int,
+                           mode: str = "vector", max_distance: Optional[float] = None,
+                           min_score: Optional[float] = None) -> List[Dict]:
+        """البحث في مجموعة مع استخدام الذاكرة المؤقتة للنتائج (تُخزَّن قبل تطبيق العتبة)"""
+        self._check_search_mode(mode)
+        self._wait_for_pending_writes()
+        self.refresh()
+        results = self.search_cache.get(collection, query, n_results, variant=mode)
+        if results is None:
+            results = self._search_uncached(collection, query, n_results, mode)
+        return self.filter_by_relevance(results, max_distance, min_score)
+
+    def search_interactions(self, query: str, n_results: int = 5, mode: str = "vector",
+                            max_distance: Optional[float] = None,
+                            min_score: Optional[float] = None) -> List[Dict]:
+        """
+        البحث عن التفاعلات السابقة
+        
+        Args:
+            query: نص البحث
+            n_results: عدد النتائج المطلوبة
+            mode: نمط البحث: vector (تشابه دلالي)، lexical (نصي FTS5)، hybrid (الاثنان معاً)
+            max_distance: أقصى مسافة متجهية للنتيجة (None دون حد)
+            min_score: أقل درجة تشابه للنتيجة (None دون حد)
+            
+        Returns:
+            قائمة التفاعلات المطابقة مع distance و score لكل نتيجة متجهية
+        """
+        return self._search_collection(
+            "interactions", query, n_results, mode, max_distance, min_score
+        )
 
-    def search_lessons(self, query: str, n_results: int = 5) -> List[Dict]:
+    def search_lessons(self, query: str, n_results: int = 5, mode: str = "vector",
+                       max_distance: Optional[float] = None,
+                       min_score: Optional[float] = None) -> List[Dict]:
         """
         البحث عن الدروس المستفادة
         
         Args:
             query: نص البحث
             n_results: عدد النتائج المطلوبة
+            mode: نمط البحث: vector (تشابه دلالي)، lexical (نصي FTS5)، hybrid (الاثنان معاً)
+            max_distance: أقصى مسافة متجهية للنتيجة (None دون حد)
+            min_score: أقل درجة تشابه للنتيجة (None دون حد)
             
         Returns:
-            قائمة الدروس المطابقة
+            قائمة الدروس المطابقة مع distance و score لكل نتيجة متجهية
         """
-        try:
-            results = self.lessons_collection.query(
-                query_texts=[query],
-                n_results=min(n_results, 10)
-            )
+        return self._search_collection("lessons", query, n_results, mode, max_distance, min_score)
+
+    def search_all(self, query: str, n_interactions: int = 5, n_lessons: int = 5,
+                   mode: str = "vector", max_distance: Optional[float] = None,
+                   min_score: Optional[float] = None) -> Dict[str, List[Dict]]:
+        """
+        البحث في التفاعلات والدروس معاً
+        يُضمَّن نص البحث مرة واحدة ثم تُنفَّذ عمليتا البحث بالتوازي،
+        فيكون زمن الاسترجاع أطول العمليتين لا مجموعهما
+        
+        Args:
+            query: نص البحث
+            n_interactions: عدد التفاعلات المطلوبة
+            n_lessons: عدد الدروس المطلوبة
+            mode: نمط البحث: vector (تشابه دلالي)، lexical (نصي FTS5)، hybrid (الاثنان معاً)
+            max_distance: أقصى مسافة متجهية للنتيجة (None دون حد)
+            min_score: أقل درجة تشابه للنتيجة (None دون حد)
             
-            lessons = []
-            for i, doc in enumerate(results['documents'][0]):
-                lessons.append({
-                    "id": results['ids'][0][i],
-                    "lesson": doc,
-                    "metadata": results['metadatas'][0][i]
-                })
+        Returns:
+            قاموس يحتوي interactions و lessons
+        """
+        results = self._search_all_unfiltered(query, n_interactions, n_lessons, mode)
+        return {
+            collection: self.filter_by_relevance(hits, max_distance, min_score)
+            for collection, hits in results.items()
+        }
+
+    def search_many(self, collection: str, queries: List[str], n_results: int = 5,
+                    mode: str = "vector", max_distance: Optional[float] = None,
+                    min_score: Optional[float] = None) -> List[List[Dict]]:
+        """
+        تنفيذ عدة عمليات بحث في مجموعة معاً: تضمين كل النصوص غير المخزنة باستدعاء واحد،
+        وفي النمط المتجهي مسح واحد للفهرس لكل الاستعلامات
+        
+        Args:
+            collection: interactions أو lessons
+            queries: نصوص البحث
+            n_results: عدد النتائج لكل نص
+            mode: نمط البحث: vector، lexical، أو hybrid
+            max_distance: أقصى مسافة متجهية للنتيجة (None دون حد)
+            min_score: أقل درجة تشابه للنتيجة (None دون حد)
             
-            return lessons
+        Returns:
+            قائمة نتائج لكل نص بنفس الترتيب
+        """
+        self._check_search_mode(mode)
+        self._wait_for_pending_writes()
+        self.refresh()
+        results = [self.search_cache.get(collection, query, n_results, variant=mode) for query in queries]
+        missing = list(dict.fromkeys(
+            query for query, found in zip(queries, results) if found is None
+        ))
+        
+        if missing:
+            generation = self.search_cache.generation(collection)
+            found = self._search_many_uncached(collection, missing, n_results, mode)
+            for query, hits in found.items():
+                if hits is not None:
+                    self.search_cache.put(collection, query, n_results, hits, generation, variant=mode)
+            results = [
+                (found.get(query) or []) if hits is None else hits
+                for query, hits in zip(queries, results)
+            ]
+        
+        return [self.filter_by_relevance(hits, max_distance, min_score) for hits in results]
+
+    def _search_many_uncached(self, collection: str, queries: List[str], n_results: int,
+                              mode: str) -> Dict[str, Optional[List[Dict]]]:
+        """البحث المجمّع في الفهرس مباشرة (None لنص فشل البحث عنه)"""
+        embeddings: List[Any] = [None] * len(queries)
+        if mode != "lexical":
+            try:
+                embeddings = self._embed(queries)
+            except Exception as e:
+                print(f"خطأ في البحث: {e}")
+                return {query: None for query in queries}
+        
+        if mode != "vector":
+            return {
+                query: self._query(collection, query, embedding, n_results, mode)
+                for query, embedding in zip(queries, embeddings)
+            }
+        
+        backend = getattr(self, f"{collection}_backend")
+        try:
+            hits = backend.query_many(embeddings, min(n_results, 10))
         except Exception as e:
             print(f"خطأ في البحث: {e}")
-            return []
+            return {query: None for query in queries}
+        return {query: self._format_hits(collection, found) for query, found in zip(queries, hits)}
+
+    def _search_all_unfiltered(self, query: str, n_interactions: int, n_lessons: int,
+                               mode: str) -> Dict[str, List[Dict]]:
+        """البحث في المجموعتين قبل تطبيق عتبة الصلة"""
+        self._check_search_mode(mode)
+        self._wait_for_pending_writes()
+        self.refresh()
+        requested = {"interactions": n_interactions, "lessons": n_lessons}
+        results = {
+            collection: self.search_cache.get(collection, query, n_results, variant=mode)
+            for collection, n_results in requested.items()
+        }
+        missing = [collection for collection, found in results.items() if found is None]
+        if not missing:
+            return results
+        
+        query_embedding = None
+        if mode != "lexical":
+            query_embedding = self._embed_query(query)
+            if query_embedding is None:
+                return {collection: found or [] for collection, found in results.items()}
+        
+        executor = self._get_search_executor()
+        futures = {
+            collection: executor.submit(
+                self._search_uncached, collection, query, requested[collection],
+                mode, query_embedding
+            )
+            for collection in missing
+        }
+        for collection, future in futures.items():
+            results[collection] = future.result()
+        
+        return results
+
+    def _get_search_executor(self) -> ThreadPoolExecutor:
+        """مجمّع الخيوط المستخدم في البحث المتوازي (يُنشأ عند أول استخدام)"""
+        with self._lock:
+            if self._search_executor is None:
+                self._search_executor = ThreadPoolExecutor(
+                    max_workers=2, thread_name_prefix="memory-search"
+                )
+            return self._search_executor
 
     def get_recent_interactions(self, n: int = 10) -> List[Dict]:
-        """الحصول على آخر التفاعلات"""
-        return self.memory_data["interactions"][-n:]
+        """الحصول على آخر التفاعلات (تُحمّل المقاطع الباردة فقط إذا لم تكفِ الطبقة الساخنة)"""
+        self._wait_for_pending_writes()
+        with self._exclusive():
+            recent = self.memory_data["interactions"][-n:]
+            if self.cold_store is None or len(recent) >= n:
+                return recent
+            
+            older: List[Dict] = []
+            for meta in reversed(self.cold_store.segments):
+                missing = n - len(recent) - len(older)
+                if missing <= 0:
+                    break
+                older = self.cold_store.load(meta["name"])[-missing:] + older
+            return older + recent
 
     def get_important_lessons(self, min_importance: int = 7) -> List[Dict]:
-        """الحصول على الدروس المهمة"""
-        return [
-            lesson for lesson in self.memory_data["lessons"]
-            if lesson.get("importance", 0) >= min_importance
-        ]
+        """الحصول على الدروس المهمة (الأعلى أهمية أولاً)"""
+        with self._exclusive():
+            return self.lesson_index.important(min_importance)
 
     def get_lessons_by_category(self, category: str) -> List[Dict]:
         """الحصول على الدروس حسب الفئة"""
-        return [
-            lesson for lesson in self.memory_data["lessons"]
-            if lesson.get("category") == category
-        ]
+        with self._exclusive():
+            return self.lesson_index.by_category(category)
 
     def get_memory_stats(self) -> Dict[str, Any]:
         """الحصول على إحصائيات الذاكرة"""
+        self.refresh()
+        memory_file_size = os.path.getsize(self.memory_file) if os.path.exists(self.memory_file) else 0
+        if self._log is not None:
+            memory_file_size += self._log.size()
+
+        cold_stats = self.cold_store.stats() if self.cold_store is not None else None
         return {
-            "total_interactions": len(self.memory_data["interactions"]),
+            "total_interactions": self._total_interactions(),
+            "hot_interactions": len(self.memory_data["interactions"]),
+            "interactions_bytes": self._interactions_bytes + (cold_stats["bytes"] if cold_stats else 0),
+            "cold_tier": cold_stats,
             "total_lessons": len(self.memory_data["lessons"]),
-            "categories": list(set(
-                lesson.get("category", "unknown") 
-                for lesson in self.memory_data["lessons"]
-            )),
-            "memory_file_size": os.path.getsize(self.memory_file) if os.path.exists(self.memory_file) else 0
+            "categories": self.lesson_index.categories(),
+            "category_counts": self.lesson_index.category_counts(),
+            "memory_file_size": memory_file_size,
+            "storage": self.storage,
+            "backend": self.backend,
+            "quantization": self.quantization,
+            "quota": {**self.quota.to_dict(), "evicted": self.quota_evictions} if self.quota else None,
+            "dedup": {
+                collection: deduplicator.stats()
+                for collection, deduplicator in self.deduplicators.items()
+            },
+            "embedding_cache": self.embedding_cache.stats(),
+            "search_cache": self.search_cache.stats()
         }
 
-    def clear_old_interactions(self, days: int = 30):
+    def clear_old_interactions(self, days: int = 30) -> Dict[str, Any]:
         """مسح التفاعلات القديمة"""
-        from datetime import timedelta
-        cutoff_date = datetime.now() - timedelta(days=days)
+        return self.apply_retention(RetentionPolicy(max_age_days=days))
+
+    @staticmethod
+    def _timestamp_key(interaction: Dict[str, Any]) -> str:
+        return interaction["timestamp"]
+
+    def _bytes_prefix(self, records: List[Dict], excess: int):
+        """عدد السجلات الأقدم التي يغطي حجمها الفائض، والفائض المتبقي"""
+        cut = 0
+        while excess > 0 and cut < len(records):
+            excess -= self._record_size(records[cut])
+            cut += 1
+        return cut, excess
+
+    def _retention_cut(self, policy: RetentionPolicy) -> Dict[str, int]:
+        """
+        حساب عدد التفاعلات الأقدم التي يجب حذفها لكل قيد في السياسة
+        التفاعلات مرتبة زمنياً (المقاطع الباردة ثم الطبقة الساخنة)، فيكفي تحديد طول
+        البادئة المحذوفة؛ المقاطع لا تُفتح إلا إذا وقع الحد داخلها
+        """
+        interactions = self.memory_data["interactions"]
+        segments = self.cold_store.segments if self.cold_store is not None else []
+        cuts = {"age": 0, "count": 0, "size": 0}
         
-        self.memory_data["interactions"] = [
-            interaction for interaction in self.memory_data["interactions"]
-            if datetime.fromisoformat(interaction["timestamp"]) > cutoff_date
-        ]
+        if policy.max_age_days is not None:
+            cutoff = (datetime.now() - timedelta(days=policy.max_age_days)).isoformat()
+            cut = 0
+            for meta in segments:
+                if meta["end"] <= cutoff:
+                    cut += meta["count"]
+                    continue
+                if meta["start"] <= cutoff:
+                    cut += bisect.bisect_right(
+                        self.cold_store.load(meta["name"]), cutoff, key=self._timestamp_key
+                    )
+                break
+            else:
+                cut += bisect.bisect_right(interactions, cutoff, key=self._timestamp_key)
+            cuts["age"] = cut
         
-        self._save_memory()
+        if policy.max_count is not None:
+            cuts["count"] = max(0, self._total_interactions() - policy.max_count)
+        
+        if policy.max_bytes is not None:
+            cold_bytes = self.cold_store.size_bytes() if self.cold_store is not None else 0
+            excess = self._interactions_bytes + cold_bytes - policy.max_bytes
+            cut = 0
+            for meta in segments:
+                if excess <= 0:
+                    break
+                if meta["bytes"] <= excess:
+                    cut += meta["count"]
+                    excess -= meta["bytes"]
+                else:
+                    partial, excess = self._bytes_prefix(self.cold_store.load(meta["name"]), excess)
+                    cut += partial
+            if excess > 0:
+                cut += self._bytes_prefix(interactions, excess)[0]
+            cuts["size"] = cut
+        
+        return cuts
+
+    def _delete_from_indexes(self, collection: str, ids: List[str], batch_size: int):
+        """حذف سجلات من فهرس المتجهات والفهرس النصي على دفعات"""
+        backend = getattr(self, f"{collection}_backend")
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            try:
+                backend.delete(batch)
+                if self.lexical_index is not None:
+                    self.lexical_index.delete(collection, batch)
+            except Exception as e:
+                print(f"خطأ في حذف السجلات من الفهرس: {e}")
+
+    def _trim_cold(self, cut: int, batch_size: int) -> int:
+        """
+        حذف أقدم cut تفاعل من المقاطع الباردة: مقاطع كاملة دون تحميلها،
+        ثم إعادة كتابة المقطع الذي يقع فيه الحد
+
+        Returns:
+            عدد التفاعلات المتبقي حذفه من الطبقة الساخنة
+        """
+        if self.cold_store is None:
+            return cut
+        
+        whole = 0
+        for meta in self.cold_store.segments:
+            if meta["count"] > cut:
+                break
+            self._delete_from_indexes("interactions", self.cold_store.ids(meta["name"]), batch_size)
+            cut -= meta["count"]
+            whole += 1
+        if whole:
+            self.cold_store.remove_oldest(whole)
+        
+        if cut and self.cold_store.segments:
+            records = self.cold_store.load(self.cold_store.segments[0]["name"])
+            self._delete_from_indexes(
+                "interactions", [record["id"] for record in records[:cut]], batch_size
+            )
+            self.cold_store.replace_oldest(records[cut:])
+            cut = 0
+        return cut
+
+    def _enforce_quota(self):
+        """حذف أقدم التفاعلات التي تتجاوز الحصة (رخيص ما دامت الذاكرة ضمن الحصة)"""
+        if self.quota is None:
+            return
+        removed = self.apply_retention(self.quota)["removed"]
+        self.quota_evictions += removed
+
+    def apply_retention(self, policy: RetentionPolicy,
+                        batch_size: int = 500) -> Dict[str, Any]:
+        """
+        تطبيق سياسة الاحتفاظ: حذف أقدم التفاعلات من الذاكرة ومن الفهرس
+        
+        Args:
+            policy: سياسة الاحتفاظ (العمر، العدد، الحجم)
+            batch_size: حجم دفعات الحذف من فهرس المتجهات
+            
+        Returns:
+            عدد التفاعلات المحذوفة إجمالاً ولكل قيد
+        """
+        with self._exclusive():
+            cuts = self._retention_cut(policy)
+            cut = max(cuts.values())
+            if cut == 0:
+                return {"removed": 0, **cuts}
+            
+            self.search_cache.invalidate("interactions")
+            hot_cut = self._trim_cold(cut, batch_size)
+            if hot_cut < cut:
+                self._persist("trim_cold", count=cut - hot_cut)
+            if hot_cut:
+                interactions = self.memory_data["interactions"]
+                expired = interactions[:hot_cut]
+                del interactions[:hot_cut]
+                self._interactions_bytes -= sum(self._record_size(record) for record in expired)
+                expired_ids = [record["id"] for record in expired]
+                self._delete_from_indexes("interactions", expired_ids, batch_size)
+                self._forget_fingerprints("interactions", expired_ids)
+                self._persist("trim_interactions", count=hot_cut)
+        
+        return {"removed": cut, **cuts}
+
+    def start_retention(self, policy: RetentionPolicy,
+                        interval_seconds: float = 3600) -> RetentionScheduler:
+        """
+        تشغيل سياسة الاحتفاظ دورياً في الخلفية
+        
+        Args:
+            policy: سياسة الاحتفاظ
+            interval_seconds: الفاصل الزمني بين التشغيلات
+            
+        Returns:
+            المجدول (يمكن إيقافه بـ stop)
+        """
+        self.stop_retention()
+        self._retention_scheduler = RetentionScheduler(self, policy, interval_seconds)
+        self._retention_scheduler.start()
+        return self._retention_scheduler
+
+    def stop_retention(self):
+        """إيقاف تشغيل سياسة الاحتفاظ الدوري"""
+        if self._retention_scheduler is not None:
+            self._retention_scheduler.stop()
+            self._retention_scheduler = None
 
     def export_memory(self, filepath: str):
         """تصدير الذاكرة إلى ملف"""
+        self.refresh()
         try:
+            data = self.memory_data
+            if self.cold_store is not None and self.cold_store.segments:
+                data = dict(data, interactions=[*self.cold_store.iter_records(), *data["interactions"]])
             with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(self.memory_data, f, ensure_ascii=False, indent=2)
+                json.dump(data, f, ensure_ascii=False, indent=2)
             print(f"تم تصدير الذاكرة إلى {filepath}")
         except Exception as e:
             print(f"خطأ في التصدير: {e}")
@@ -257,8 +2167,191 @@ class Memory:
         """استيراد الذاكرة من ملف"""
         try:
             with open(filepath, 'r', encoding='utf-8') as f:
-                self.memory_data = json.load(f)
-            self._save_memory()
+                data = json.load(f)
+            data.pop("log_seq", None)
+            with self._exclusive():
+                self._clear_all(self.reconcile_batch_size)
+                self.memory_data = data
+                self._rebuild_derived_state()
+                self._maybe_spill()
+                self.search_cache.invalidate("interactions")
+                self.search_cache.invalidate("lessons")
+                self._save_memory()
+                self.reconcile_index()
             print(f"تم استيراد الذاكرة من {filepath}")
         except Exception as e:
             print(f"خطأ في الاستيراد: {e}")
+
+    # أنواع السجلات في ملف NDJSON: النوع -> (المجموعة، عملية السجل، بناء مُدخل الفهرس)
+    _EXPORT_KINDS = {
+        "interaction": ("interactions", "add_interaction", "_interaction_index_entry"),
+        "lesson": ("lessons", "add_lesson", "_lesson_index_entry"),
+    }
+
+    def export_memory_stream(self, filepath: str) -> Dict[str, Any]:
+        """
+        تصدير الذاكرة إلى ملف NDJSON سجلاً سجلاً دون بناء المستند كاملاً في الذاكرة
+        كل سطر على الشكل {"type": "interaction" | "lesson", "record": {...}}
+        
+        Args:
+            filepath: مسار ملف التصدير
+            
+        Returns:
+            عدد السجلات لكل نوع والحجم والزمن ومعدل التصدير (سجل/ثانية)
+        """
+        self._wait_for_pending_writes()
+        start_time = time.perf_counter()
+        stats: Dict[str, Any] = {"interactions": 0, "lessons": 0}
+        with contextlib.ExitStack() as stack:
+            with self._exclusive():
+                # نسخة سطحية من القوائم؛ السجلات نفسها لا تُعدَّل بعد إنشائها
+                snapshot = {
+                    "interaction": list(self.memory_data["interactions"]),
+                    "lesson": list(self.memory_data["lessons"])
+                }
+                if self.cold_store is not None:
+                    # المقاطع تُثبَّت مع الطبقة الساخنة في نفس اللحظة، فلا يُصدَّر سجل نُقل
+                    # بعدها مرتين ولا يحذف الاحتفاظ مقطعاً أثناء قراءته
+                    segment_paths = stack.enter_context(self.cold_store.pinned())
+                    snapshot["interaction"] = itertools.chain(
+                        itertools.chain.from_iterable(
+                            SegmentStore.iter_file(path) for path in segment_paths
+                        ),
+                        snapshot["interaction"]
+                    )
+            
+            with open(filepath, 'w', encoding='utf-8') as f:
+                for kind, records in snapshot.items():
+                    collection = self._EXPORT_KINDS[kind][0]
+                    for record in records:
+                        f.write(json.dumps({"type": kind, "record": record}, ensure_ascii=False) + "\n")
+                        stats[collection] += 1
+                stats["bytes"] = f.tell()
+        
+        total = stats["interactions"] + stats["lessons"]
+        elapsed = time.perf_counter() - start_time
+        stats["elapsed_seconds"] = elapsed
+        stats["records_per_sec"] = total / elapsed if elapsed > 0 else 0.0
+        print(f"تم تصدير {total} سجل إلى {filepath}")
+        return stats
+
+    def _clear_all(self, batch_size: int):
+        """حذف كل السجلات من البيانات والفهارس (يُستدعى والقفل محجوز)"""
+        if self.cold_store is not None:
+            self._trim_cold(self.cold_store.count(), batch_size)
+        for collection in ("interactions", "lessons"):
+            ids = [record["id"] for record in self.memory_data[collection]]
+            self._delete_from_indexes(collection, ids, batch_size)
+            self.memory_data[collection] = []
+            self.search_cache.invalidate(collection)
+        self._rebuild_derived_state()
+        self._save_memory()
+
+    def _import_record(self, kind: str, record: Dict[str, Any]):
+        """إلحاق سجل مستورد بمعرفه الأصلي (يُستدعى والقفل محجوز)"""
+        collection = self._EXPORT_KINDS[kind][0]
+        self.memory_data[collection].append(record)
+        if kind == "interaction":
+            self._interactions_bytes += self._record_size(record)
+        else:
+            self.lesson_index.add(record)
+        self._register_fingerprint(collection, record)
+        
+        # عدم تخصيص معرف مستورد لسجل جديد يضاف أثناء الاستيراد
+        suffix = str(record["id"]).rsplit("_", 1)[-1]
+        if suffix.isdigit():
+            self._next_ids[kind] = max(self._next_ids[kind], int(suffix) + 1)
+
+    def import_memory_stream(self, filepath: str, mode: str = "merge", batch_size: int = 256,
+                             progress_callback: Optional[Callable[[int, float], None]] = None
+                             ) -> Dict[str, Any]:
+        """
+        استيراد ملف NDJSON (من export_memory_stream) سطراً سطراً مع فهرسة السجلات على دفعات
+        
+        Args:
+            filepath: مسار ملف الاستيراد
+            mode: merge (تخطي المعرفات الموجودة) أو replace (حذف الذاكرة الحالية أولاً)
+            batch_size: عدد السجلات في كل دفعة تضمين وحفظ
+            progress_callback: دالة تُستدعى بعد كل دفعة بـ (العدد المستورد، سجل/ثانية)
+            
+        Returns:
+            عدد السجلات المستوردة لكل نوع والمتخطاة والتالفة والزمن ومعدل الاستيراد
+        """
+        if mode not in ("merge", "replace"):
+            raise ValueError(f"نمط استيراد غير معروف: {mode}")
+        if batch_size < 1:
+            raise ValueError("batch_size يجب أن يكون 1 على الأقل")
+        
+        self._wait_for_pending_writes()
+        start_time = time.perf_counter()
+        stats: Dict[str, Any] = {"interactions": 0, "lessons": 0, "skipped": 0, "invalid": 0}
+        batches: Dict[str, List[Dict]] = {kind: [] for kind in self._EXPORT_KINDS}
+        
+        if mode == "replace":
+            with self._exclusive():
+                self._clear_all(batch_size)
+        
+        # معرفات الدفعة الحالية فقط في الذاكرة؛ الموجود مسبقاً يُعرف من فهرس المجموعة
+        pending: Dict[str, Set[str]] = {kind: set() for kind in self._EXPORT_KINDS}
+        
+        def _flush_batch(kind: str):
+            collection, op, build_entry = self._EXPORT_KINDS[kind]
+            batch = batches[kind]
+            with self._exclusive():
+                existing = getattr(self, f"{collection}_backend").existing_ids(
+                    [record["id"] for record in batch]
+                )
+                records = [record for record in batch if record["id"] not in existing]
+                for record in records:
+                    self._import_record(kind, record)
+                if records:
+                    self._index_records(collection, op, getattr(self, build_entry), records)
+            stats[collection] += len(records)
+            stats["skipped"] += len(batch) - len(records)
+            batches[kind] = []
+            pending[kind].clear()
+            
+            if progress_callback:
+                done = stats["interactions"] + stats["lessons"]
+                elapsed = time.perf_counter() - start_time
+                progress_callback(done, done / elapsed if elapsed > 0 else 0.0)
+        
+        with open(filepath, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                    kind, record = entry["type"], entry["record"]
+                    record_id = record["id"]
+                except (ValueError, KeyError, TypeError):
+                    stats["invalid"] += 1
+                    continue
+                if kind not in self._EXPORT_KINDS:
+                    stats["invalid"] += 1
+                    continue
+                if record_id in pending[kind]:
+                    stats["skipped"] += 1
+                    continue
+                
+                pending[kind].add(record_id)
+                batches[kind].append(record)
+                if len(batches[kind]) >= batch_size:
+                    _flush_batch(kind)
+        
+        for kind in self._EXPORT_KINDS:
+            if batches[kind]:
+                _flush_batch(kind)
+        
+        with self._exclusive():
+            # إعادة الترتيب الزمني بعد دمج سجلات قديمة، وحفظ الحالة المرتبة في لقطة
+            self._restore_cold_order()
+            self._rebuild_derived_state()
+            self._save_memory()
+        
+        total = stats["interactions"] + stats["lessons"]
+        elapsed = time.perf_counter() - start_time
+        stats["elapsed_seconds"] = elapsed
+        stats["records_per_sec"] = total / elapsed if elapsed > 0 else 0.0
+        print(f"تم استيراد {total} سجل من {filepath}")
+        return stats
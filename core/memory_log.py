@@ -0,0 +1,362 @@
+"""
+سجل الكتابة المسبقة (Write-Ahead Log) لنظام الذاكرة
+يُلحق كل عملية كسطر NDJSON بدلاً من إعادة كتابة memory.json بالكامل،
+ويدمج السجل دورياً في لقطة (snapshot) في الخلفية.
+في الوضع المشترك بين العمليات تُكتب الإدخالات والقفل محجوز، فتبقى الأرقام التسلسلية
+متتالية، وتقرأ كل عملية ما ألحقته العمليات الأخرى من موضع آخر قراءة
+"""
+
+import contextlib
+import glob
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .file_lock import FileLock
+
+
+FSYNC_POLICIES = ("always", "interval", "never")
+
+
+class MemoryLog:
+    """سجل إلحاقي بصيغة NDJSON مع ضغط دوري في لقطة"""
+
+    # اللقطة تبدأ برقمها التسلسلي فيُقرأ دون تحميل الملف
+    _SNAPSHOT_SEQ = re.compile(rb'^\{"log_seq": (\d+)')
+
+    def __init__(self, log_path: str, snapshot_path: str,
+                 fsync_policy: str = "interval", fsync_interval: float = 1.0,
+                 compact_threshold: int = 1000, lock: Optional[FileLock] = None):
+        """
+        Args:
+            log_path: مسار ملف السجل
+            snapshot_path: مسار ملف اللقطة (memory.json)
+            fsync_policy: سياسة المزامنة مع القرص:
+                always (بعد كل كتابة)، interval (كل fsync_interval ثانية)، never (يترك للنظام)
+            fsync_interval: الفاصل الزمني للمزامنة بالثواني في سياسة interval
+            compact_threshold: عدد الإدخالات الذي يُطلق بعده الضغط في الخلفية
+            lock: قفل بين العمليات عند مشاركة السجل بين عدة عمليات (None لعملية واحدة)
+        """
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"سياسة مزامنة غير معروفة: {fsync_policy}")
+
+        self.log_path = log_path
+        self.snapshot_path = snapshot_path
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.compact_threshold = compact_threshold
+        self.lock = lock
+
+        self.seq = 0
+        self.snapshot_seq = 0
+        self.entries_since_compaction = 0
+
+        self._file = None
+        # موضع آخر قراءة في السجل الحالي، ورقم أول إدخال فيه لاكتشاف تدويره
+        self._tail_offset = 0
+        self._tail_first_seq: Optional[int] = None
+        self._last_fsync = time.monotonic()
+        self._compaction_thread: Optional[threading.Thread] = None
+        # يرتب كتابة اللقطات بين الضغط الخلفي والضغط الفوري
+        self._snapshot_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # التحميل وإعادة التشغيل
+    # ------------------------------------------------------------------
+
+    def load_snapshot(self) -> Optional[Dict[str, Any]]:
+        """تحميل اللقطة الأخيرة إن وجدت"""
+        if not os.path.exists(self.snapshot_path):
+            return None
+
+        with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        self.snapshot_seq = data.pop("log_seq", 0)
+        self.seq = self.snapshot_seq
+        return data
+
+    def _log_files(self) -> List[str]:
+        """ملفات السجل بالترتيب: السجلات المدوّرة ثم السجل الحالي"""
+        rotated = glob.glob(f"{self.log_path}.*")
+        rotated = [path for path in rotated if path.rsplit(".", 1)[-1].isdigit()]
+        rotated.sort(key=lambda path: int(path.rsplit(".", 1)[-1]))
+
+        if os.path.exists(self.log_path):
+            rotated.append(self.log_path)
+        return rotated
+
+    @staticmethod
+    def _read_entries(path: str, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        قراءة الإدخالات المكتملة من ملف سجل بدءاً من موضع
+
+        Returns:
+            (الإدخالات، الموضع بعد آخر سطر مكتمل)
+        """
+        entries = []
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # سطر لم تكتمل كتابته (أو مبتور بسبب انقطاع أثناء الكتابة)
+                    break
+                offset += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    print(f"تجاهل سطر تالف في {path}")
+        return entries, offset
+
+    def _first_seq(self) -> Optional[int]:
+        """رقم أول إدخال في السجل الحالي (None إذا كان فارغاً أو غير موجود)"""
+        try:
+            with open(self.log_path, 'rb') as f:
+                return json.loads(f.readline())["seq"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _snapshot_seq_on_disk(self) -> int:
+        """الرقم التسلسلي للقطة الموجودة على القرص"""
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                match = self._SNAPSHOT_SEQ.match(f.read(32))
+        except OSError:
+            return 0
+        return int(match.group(1)) if match else 0
+
+    def replay(self) -> Iterator[Dict[str, Any]]:
+        """
+        إعادة تشغيل الإدخالات غير الموجودة في اللقطة
+
+        Yields:
+            إدخالات السجل بترتيب كتابتها
+        """
+        for path in self._log_files():
+            entries, offset = self._read_entries(path)
+            if path == self.log_path:
+                self._tail_offset, self._tail_first_seq = offset, self._first_seq()
+
+            for entry in entries:
+                if entry.get("seq", 0) <= self.snapshot_seq:
+                    continue
+
+                self.seq = max(self.seq, entry["seq"])
+                self.entries_since_compaction += 1
+                yield entry
+
+    def poll(self) -> Optional[List[Dict[str, Any]]]:
+        """
+        قراءة الإدخالات التي ألحقتها عمليات أخرى منذ آخر قراءة
+        (يُستدعى والقفل بين العمليات محجوز)
+
+        Returns:
+            الإدخالات الجديدة بالترتيب، أو None إذا ضُغطت إدخالات لم تُقرأ بعد
+            في لقطة، فيجب إعادة التحميل من اللقطة
+        """
+        entries: List[Dict[str, Any]] = []
+        first_seq = self._first_seq()
+        rotated = self._tail_offset == 0 or first_seq != self._tail_first_seq
+        if rotated:
+            # دوّرت عملية أخرى السجل: ما لم يُقرأ من الملف السابق صار في سجل مدوّر
+            self._close_file()
+            for path in self._log_files():
+                if path != self.log_path and int(path.rsplit(".", 1)[-1]) > self.seq:
+                    entries.extend(self._read_entries(path)[0])
+            self._tail_offset, self._tail_first_seq = 0, first_seq
+            self.entries_since_compaction = 0
+
+        if os.path.exists(self.log_path):
+            current, self._tail_offset = self._read_entries(self.log_path, self._tail_offset)
+            entries.extend(current)
+            self.entries_since_compaction += len(current)
+
+        entries = [entry for entry in entries if entry.get("seq", 0) > self.seq]
+        for expected, entry in enumerate(entries, self.seq + 1):
+            if entry["seq"] != expected:
+                return None
+        last_seq = self.seq + len(entries)
+        if rotated and self._snapshot_seq_on_disk() > last_seq:
+            return None
+
+        self.seq = last_seq
+        return entries
+
+    def reset(self):
+        """نسيان حالة القراءة تمهيداً لإعادة التحميل من اللقطة"""
+        self._close_file()
+        self.seq = 0
+        self.snapshot_seq = 0
+        self.entries_since_compaction = 0
+        self._tail_offset, self._tail_first_seq = 0, None
+
+    # ------------------------------------------------------------------
+    # الكتابة
+    # ------------------------------------------------------------------
+
+    def _open(self):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+            self._file = open(self.log_path, 'ab')
+        return self._file
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _locked(self):
+        """القفل بين العمليات إن وجد"""
+        return self.lock if self.lock is not None else contextlib.nullcontext()
+
+    def append(self, op: str, **payload) -> int:
+        """
+        إلحاق عملية بالسجل
+
+        Args:
+            op: اسم العملية
+            **payload: بيانات العملية
+
+        Returns:
+            الرقم التسلسلي للإدخال
+        """
+        return self.append_many([dict(payload, op=op)])
+
+    def append_many(self, entries: List[Dict[str, Any]]) -> int:
+        """إلحاق عدة عمليات بكتابة ومزامنة واحدة"""
+        f = self._open()
+
+        lines = []
+        for entry in entries:
+            self.seq += 1
+            entry["seq"] = self.seq
+            lines.append(json.dumps(entry, ensure_ascii=False))
+
+        f.write(("\n".join(lines) + "\n").encode('utf-8'))
+        f.flush()
+        self._maybe_fsync(f)
+
+        if self._tail_first_seq is None:
+            self._tail_first_seq = entries[0]["seq"]
+        self._tail_offset = f.tell()
+        self.entries_since_compaction += len(entries)
+        return self.seq
+
+    def _maybe_fsync(self, f):
+        if self.fsync_policy == "always":
+            os.fsync(f.fileno())
+        elif self.fsync_policy == "interval":
+            now = time.monotonic()
+            if now - self._last_fsync >= self.fsync_interval:
+                os.fsync(f.fileno())
+                self._last_fsync = now
+
+    def sync(self):
+        """مزامنة السجل الحالي مع القرص"""
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._last_fsync = time.monotonic()
+
+    # ------------------------------------------------------------------
+    # الضغط
+    # ------------------------------------------------------------------
+
+    def should_compact(self) -> bool:
+        """هل تجاوز السجل حد الضغط"""
+        return self.entries_since_compaction >= self.compact_threshold
+
+    def is_compacting(self) -> bool:
+        """هل يوجد ضغط قيد التنفيذ"""
+        return self._compaction_thread is not None and self._compaction_thread.is_alive()
+
+    def rotate(self) -> int:
+        """
+        تدوير السجل الحالي تمهيداً للضغط
+        يجب استدعاؤها أثناء حجز قفل الذاكرة (والقفل بين العمليات) حتى تتطابق اللقطة مع الرقم التسلسلي
+
+        Returns:
+            الرقم التسلسلي الذي ستغطيه اللقطة
+        """
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._close_file()
+
+        if os.path.exists(self.log_path):
+            os.replace(self.log_path, f"{self.log_path}.{self.seq}")
+
+        self._tail_offset, self._tail_first_seq = 0, None
+        self.entries_since_compaction = 0
+        return self.seq
+
+    def write_snapshot(self, data: Dict[str, Any], seq: int):
+        """
+        كتابة لقطة ذرية ثم حذف السجلات المدوّرة التي تغطيها
+
+        Args:
+            data: بيانات الذاكرة
+            seq: آخر رقم تسلسلي مضمّن في البيانات
+        """
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"log_seq": seq, **data}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+
+        with self._snapshot_lock, self._locked():
+            if seq <= self.snapshot_seq or (self.lock is not None and self._snapshot_seq_on_disk() >= seq):
+                # كُتبت لقطة أحدث في هذه الأثناء (ضغط فوري سبق الخلفي، أو عملية أخرى)
+                os.remove(tmp_path)
+                return
+            os.replace(tmp_path, self.snapshot_path)
+            self.snapshot_seq = seq
+
+            for path in self._log_files():
+                suffix = path.rsplit(".", 1)[-1]
+                if path != self.log_path and int(suffix) <= seq:
+                    os.remove(path)
+
+    def compact_in_background(self, prepare: Callable[[], Dict[str, Any]]):
+        """
+        تشغيل الضغط في خيط خلفي
+
+        Args:
+            prepare: دالة تُستدعى تحت قفل الذاكرة، تدوّر السجل وتعيد
+                نسخة سطحية من البيانات مع الرقم التسلسلي
+        """
+        if self.is_compacting():
+            return
+
+        def _run():
+            try:
+                data, seq = prepare()
+                self.write_snapshot(data, seq)
+            except Exception as e:
+                print(f"خطأ في ضغط سجل الذاكرة: {e}")
+
+        self._compaction_thread = threading.Thread(
+            target=_run, name="memory-log-compaction", daemon=True
+        )
+        self._compaction_thread.start()
+
+    def wait_for_compaction(self):
+        """انتظار انتهاء الضغط الجاري"""
+        if self._compaction_thread is not None:
+            self._compaction_thread.join()
+
+    def size(self) -> int:
+        """الحجم الإجمالي لملفات السجل بالبايت"""
+        return sum(os.path.getsize(path) for path in self._log_files())
+
+    def close(self):
+        """إغلاق السجل بعد مزامنته"""
+        self.wait_for_compaction()
+        if self._file is not None:
+            self.sync()
+            self._close_file()
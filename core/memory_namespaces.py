@@ -0,0 +1,134 @@
+"""
+مساحات الذاكرة لكل مستأجر/مستخدم (Namespaces)
+لكل مساحة مجلد خاص بسجلها وفهارسها، فيمسح البحث بيانات المستأجر وحده،
+مع حصة لكل مساحة تُحذف بعدها أقدم التفاعلات وإحصائيات لكل مساحة.
+نموذج التضمين وذاكرته المؤقتة مشتركان بين كل المساحات
+"""
+
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from .cache import EmbeddingCache
+from .embeddings import embedding_model_id, resolve_embedding_function
+from .memory import Memory
+from .retention import RetentionPolicy
+
+
+# اسم المساحة يصبح اسم مجلد، فلا يُسمح بالفواصل أو المسارات النسبية
+_NAMESPACE = re.compile(r"[\w@.-]{1,64}", re.UNICODE)
+
+
+def validate_namespace(namespace: str) -> str:
+    """التحقق من اسم مساحة وإعادته"""
+    if not isinstance(namespace, str) or not _NAMESPACE.fullmatch(namespace) \
+            or namespace in (".", ".."):
+        raise ValueError(f"اسم مساحة غير صالح: {namespace!r}")
+    return namespace
+
+
+class MemoryNamespaces:
+    """مدير مساحات الذاكرة: ينشئ Memory لكل مساحة عند أول استخدام"""
+
+    def __init__(self, root: str = "./data/namespaces",
+                 quota: Optional[RetentionPolicy] = None,
+                 quotas: Optional[Dict[str, RetentionPolicy]] = None,
+                 embedding_function: Union[str, Callable[[List[str]], Any]] = "default",
+                 embedding_cache_size: int = 10000,
+                 **memory_options):
+        """
+        Args:
+            root: المجلد الذي تُنشأ تحته مجلدات المساحات
+            quota: الحصة الافتراضية لكل مساحة (None دون حصة)
+            quotas: حصص خاصة لبعض المساحات تتقدم على الحصة الافتراضية
+            embedding_function: دالة التضمين المشتركة بين المساحات (كما في Memory)
+            embedding_cache_size: حجم الذاكرة المؤقتة للتضمينات المشتركة
+            **memory_options: خيارات إضافية تمرر إلى Memory لكل مساحة
+        """
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.quota = quota
+        self.quotas = {validate_namespace(name): policy for name, policy in (quotas or {}).items()}
+        self.memory_options = memory_options
+
+        # نموذج واحد وذاكرة مؤقتة واحدة بدلاً من نسخة لكل مساحة
+        self.embedding_function = resolve_embedding_function(embedding_function)
+        self.embedding_cache = EmbeddingCache(
+            model_id=embedding_model_id(self.embedding_function),
+            max_entries=embedding_cache_size
+        )
+
+        self._lock = threading.Lock()
+        self._memories: Dict[str, Memory] = {}
+
+    def quota_for(self, namespace: str) -> Optional[RetentionPolicy]:
+        """حصة مساحة"""
+        return self.quotas.get(namespace, self.quota)
+
+    def get(self, namespace: str) -> Memory:
+        """
+        ذاكرة مساحة (تُفتح أو تُنشأ عند أول طلب)
+
+        Args:
+            namespace: اسم المساحة (معرف المستأجر أو المستخدم)
+
+        Returns:
+            كائن Memory خاص بالمساحة
+        """
+        validate_namespace(namespace)
+        with self._lock:
+            memory = self._memories.get(namespace)
+            if memory is None:
+                memory = Memory(
+                    db_path=os.path.join(self.root, namespace),
+                    embedding_function=self.embedding_function,
+                    embedding_cache=self.embedding_cache,
+                    quota=self.quota_for(namespace),
+                    **self.memory_options
+                )
+                self._memories[namespace] = memory
+            return memory
+
+    def list_namespaces(self) -> List[str]:
+        """كل المساحات الموجودة على القرص أو المفتوحة"""
+        on_disk = {
+            name for name in os.listdir(self.root)
+            if os.path.isdir(os.path.join(self.root, name)) and _NAMESPACE.fullmatch(name)
+        }
+        with self._lock:
+            return sorted(on_disk | set(self._memories))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        إحصائيات كل مساحة مفتوحة: العدد والحجم والحصة وما حُذف بسببها
+
+        Returns:
+            قاموس اسم المساحة -> إحصائياتها
+        """
+        with self._lock:
+            memories = dict(self._memories)
+
+        stats = {}
+        for namespace, memory in memories.items():
+            memory_stats = memory.get_memory_stats()
+            stats[namespace] = {
+                "interactions": memory_stats["total_interactions"],
+                "lessons": memory_stats["total_lessons"],
+                "interactions_bytes": memory_stats["interactions_bytes"],
+                "memory_file_size": memory_stats["memory_file_size"],
+                "quota": memory_stats["quota"]
+            }
+        return stats
+
+    def close(self, namespace: Optional[str] = None):
+        """إغلاق مساحة واحدة، أو كل المساحات المفتوحة"""
+        with self._lock:
+            if namespace is None:
+                memories = list(self._memories.values())
+                self._memories.clear()
+            else:
+                memory = self._memories.pop(namespace, None)
+                memories = [memory] if memory is not None else []
+        for memory in memories:
+            memory.close()
@@ -0,0 +1,269 @@
+"""
+الطبقة الباردة (Cold Tier) للتفاعلات
+التفاعلات القديمة تُنقل من الذاكرة إلى مقاطع NDJSON على القرص تُحمّل عند الحاجة فقط،
+مع ملف وصفي لكل المقاطع (المدى الزمني، العدد، الحجم) يغني عن فتحها في الإحصائيات والاحتفاظ
+"""
+
+import contextlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List
+
+
+class SegmentStore:
+    """مقاطع NDJSON مرتبة من الأقدم إلى الأحدث، مع ذاكرة مؤقتة صغيرة للمقاطع المحمّلة"""
+
+    MANIFEST = "segments.json"
+
+    def __init__(self, directory: str, max_loaded_segments: int = 2):
+        """
+        Args:
+            directory: مجلد المقاطع
+            max_loaded_segments: أقصى عدد مقاطع تبقى محمّلة في الذاكرة
+        """
+        self.directory = directory
+        self.max_loaded_segments = max_loaded_segments
+        os.makedirs(directory, exist_ok=True)
+        self.manifest_path = os.path.join(directory, self.MANIFEST)
+
+        self._lock = threading.RLock()
+        self._loaded: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        self.segments: List[Dict[str, Any]] = []
+        self._next_number = 1
+        self.reload()
+
+    def reload(self):
+        """إعادة قراءة الملف الوصفي (بعد تعديل المقاطع من عملية أخرى)"""
+        with self._lock:
+            self._loaded.clear()
+            if os.path.exists(self.manifest_path):
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+                self.segments = manifest["segments"]
+                self._next_number = manifest["next_number"]
+            else:
+                self.segments = []
+
+    def _path(self, name: str, extension: str) -> str:
+        return os.path.join(self.directory, f"{name}.{extension}")
+
+    @staticmethod
+    def _write_atomic(path: str, lines: List[str]):
+        """كتابة ملف عبر ملف مؤقت ثم استبدال ذري"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _save_manifest(self):
+        self._write_atomic(self.manifest_path, [json.dumps(
+            {"next_number": self._next_number, "segments": self.segments},
+            ensure_ascii=False
+        )])
+
+    @staticmethod
+    def _describe(name: str, records: List[Dict], lines: List[str]) -> Dict[str, Any]:
+        """البيانات الوصفية لمقطع"""
+        numbers = [0]
+        for record in records:
+            suffix = str(record["id"]).rsplit("_", 1)[-1]
+            if suffix.isdigit():
+                numbers.append(int(suffix))
+        return {
+            "name": name,
+            "count": len(records),
+            "bytes": sum(len(line.encode('utf-8')) - 1 for line in lines),
+            "start": min(record["timestamp"] for record in records),
+            "end": max(record["timestamp"] for record in records),
+            "max_id": max(numbers)
+        }
+
+    def _write_files(self, name: str, records: List[Dict]) -> Dict[str, Any]:
+        lines = [json.dumps(record, ensure_ascii=False) + "\n" for record in records]
+        self._write_atomic(self._path(name, "ndjson"), lines)
+        self._write_atomic(self._path(name, "ids"), [f"{record['id']}\n" for record in records])
+        return self._describe(name, records, lines)
+
+    def append(self, records: List[Dict]) -> Dict[str, Any]:
+        """
+        كتابة مقطع جديد (أحدث من كل المقاطع الموجودة)
+
+        Returns:
+            البيانات الوصفية للمقطع
+        """
+        with self._lock:
+            name = f"segment_{self._next_number:06d}"
+            meta = self._write_files(name, records)
+            self._next_number += 1
+            self.segments.append(meta)
+            self._save_manifest()
+            return meta
+
+    def load(self, name: str) -> List[Dict]:
+        """تحميل سجلات مقطع (من الذاكرة المؤقتة إن كان محمّلاً)"""
+        with self._lock:
+            if name in self._loaded:
+                self._loaded.move_to_end(name)
+                return self._loaded[name]
+
+            with open(self._path(name, "ndjson"), 'r', encoding='utf-8') as f:
+                records = [json.loads(line) for line in f if line.strip()]
+
+            self._loaded[name] = records
+            while len(self._loaded) > self.max_loaded_segments:
+                self._loaded.popitem(last=False)
+            return records
+
+    def ids(self, name: str) -> List[str]:
+        """معرفات سجلات مقطع دون تحميل السجلات نفسها"""
+        with open(self._path(name, "ids"), 'r', encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip()]
+
+    @staticmethod
+    def iter_file(path: str) -> Iterator[Dict]:
+        """سجلات ملف مقطع سطراً سطراً دون تحميله"""
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def iter_segment(self, name: str) -> Iterator[Dict]:
+        """سجلات مقطع واحد سطراً سطراً دون تحميله"""
+        return self.iter_file(self._path(name, "ndjson"))
+
+    @contextlib.contextmanager
+    def pinned(self) -> Iterator[List[str]]:
+        """
+        تثبيت المقاطع الحالية لقراءتها لاحقاً: روابط ثابتة لملفاتها في مجلد مؤقت تبقى
+        صالحة ولو حذف الاحتفاظ أو إعادة الترتيب المقاطع الأصلية (يُستدعى والقفل محجوز،
+        وتجوز القراءة بعد تحريره)
+
+        Yields:
+            مسارات ملفات المقاطع من الأقدم إلى الأحدث
+        """
+        with tempfile.TemporaryDirectory(prefix="pinned_", dir=self.directory) as pin_dir:
+            paths = []
+            with self._lock:
+                for meta in self.segments:
+                    source = self._path(meta["name"], "ndjson")
+                    target = os.path.join(pin_dir, os.path.basename(source))
+                    try:
+                        os.link(source, target)
+                    except OSError:
+                        # نظام ملفات بلا روابط ثابتة
+                        shutil.copyfile(source, target)
+                    paths.append(target)
+            yield paths
+
+    def iter_records(self) -> Iterator[Dict]:
+        """كل السجلات من الأقدم إلى الأحدث، سطراً سطراً دون تحميل المقاطع"""
+        for meta in list(self.segments):
+            yield from self.iter_segment(meta["name"])
+
+    def _delete_files(self, name: str):
+        self._loaded.pop(name, None)
+        for extension in ("ndjson", "ids"):
+            path = self._path(name, extension)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def remove_oldest(self, count: int) -> List[Dict[str, Any]]:
+        """
+        حذف أقدم count مقطع
+
+        Returns:
+            البيانات الوصفية للمقاطع المحذوفة
+        """
+        with self._lock:
+            removed, self.segments = self.segments[:count], self.segments[count:]
+            self._save_manifest()
+            for meta in removed:
+                self._delete_files(meta["name"])
+            return removed
+
+    def replace_oldest(self, records: List[Dict]) -> Dict[str, Any]:
+        """إعادة كتابة أقدم مقطع بسجلات أقل (حذف جزئي)"""
+        with self._lock:
+            if not records:
+                self.remove_oldest(1)
+                return {}
+            name = self.segments[0]["name"]
+            self._loaded.pop(name, None)
+            meta = self._write_files(name, records)
+            self.segments[0] = meta
+            self._save_manifest()
+            return meta
+
+    def sort_segment(self, index: int) -> bool:
+        """
+        إعادة كتابة مقطع مرتباً زمنياً إن لم تكن سجلاته مرتبة
+
+        Returns:
+            هل أعيدت كتابته
+        """
+        with self._lock:
+            name = self.segments[index]["name"]
+            records = self.load(name)
+            if all(records[i]["timestamp"] <= records[i + 1]["timestamp"]
+                   for i in range(len(records) - 1)):
+                return False
+            self._loaded.pop(name, None)
+            self.segments[index] = self._write_files(
+                name, sorted(records, key=lambda record: record["timestamp"])
+            )
+            self._save_manifest()
+            return True
+
+    def rewrite_from(self, index: int, chunks: Iterable[List[Dict]]) -> List[Dict[str, Any]]:
+        """
+        استبدال المقاطع من index حتى الأحدث بمقاطع جديدة
+        chunks تُستهلك أثناء الكتابة فيمكن أن تُقرأ من المقاطع القديمة نفسها،
+        وهذه لا تُحذف إلا بعد حفظ الملف الوصفي الجديد
+
+        Returns:
+            البيانات الوصفية للمقاطع الجديدة
+        """
+        with self._lock:
+            written = []
+            for records in chunks:
+                written.append(self._write_files(f"segment_{self._next_number:06d}", records))
+                self._next_number += 1
+            replaced, self.segments = self.segments[index:], self.segments[:index] + written
+            self._save_manifest()
+            for meta in replaced:
+                self._delete_files(meta["name"])
+            return written
+
+    def clear(self):
+        """حذف كل المقاطع"""
+        with self._lock:
+            self.remove_oldest(len(self.segments))
+
+    def count(self) -> int:
+        """عدد السجلات في كل المقاطع"""
+        return sum(meta["count"] for meta in self.segments)
+
+    def size_bytes(self) -> int:
+        """حجم السجلات في كل المقاطع (تمثيلها JSON)"""
+        return sum(meta["bytes"] for meta in self.segments)
+
+    def max_id_number(self) -> int:
+        """أكبر رقم معرف في المقاطع"""
+        return max((meta["max_id"] for meta in self.segments), default=0)
+
+    def stats(self) -> Dict[str, Any]:
+        """إحصائيات الطبقة الباردة من البيانات الوصفية فقط"""
+        return {
+            "segments": len(self.segments),
+            "records": self.count(),
+            "bytes": self.size_bytes(),
+            "loaded_segments": len(self._loaded),
+            "oldest": self.segments[0]["start"] if self.segments else None,
+            "newest": self.segments[-1]["end"] if self.segments else None
+        }
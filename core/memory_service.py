@@ -0,0 +1,533 @@
+"""
+خدمة الذاكرة خارج العملية
+خادم واحد يملك Memory (الفهارس ونموذج التضمين) وتتصل به جلسات الوكيل عبر مقبس
+Unix أو TCP بطلبات JSON سطرية، فلا تبني كل جلسة ذاكرتها الخاصة.
+عمليات البحث المتزامنة تُجمّع في دفعات صغيرة تُضمَّن نصوصها باستدعاء واحد
+ويُمسح الفهرس مرة واحدة لكل دفعة
+
+التشغيل:
+    python -m core.memory_service --socket /tmp/memory.sock
+    python -m core.memory_service --host 127.0.0.1 --port 8765
+
+الخدمة بلا مصادقة: التصدير والاستيراد معطلان إلا مع --export-dir، ومساراتهما تبقى داخله
+"""
+
+import argparse
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from .memory import AwaitableMemory, Memory
+from .retention import RetentionPolicy
+
+
+# عنوان الخدمة: مسار مقبس Unix أو (المضيف، المنفذ) لـ TCP
+Address = Union[str, Tuple[str, int]]
+
+
+class MemoryServiceError(Exception):
+    """خطأ أعاده خادم الذاكرة"""
+    pass
+
+
+class SearchBatcher:
+    """خيط خلفي يجمع طلبات البحث المتزامنة في دفعات وينفذها عبر Memory.search_many"""
+
+    _STOP = object()
+
+    def __init__(self, memory: Memory, max_batch_size: int = 32, max_wait: float = 0.002):
+        """
+        Args:
+            memory: كائن الذاكرة
+            max_batch_size: أقصى عدد عمليات بحث في الدفعة الواحدة
+            max_wait: أقصى مدة انتظار طلبات أخرى بعد أول طلب في الدفعة بالثواني
+        """
+        self.memory = memory
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._stats = {"queries": 0, "batches": 0, "largest_batch": 0}
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="memory-search-batcher", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, collection: str, query: str, n_results: int, mode: str) -> Future:
+        """
+        إضافة عملية بحث إلى الدفعة التالية
+
+        Returns:
+            Future يحمل النتائج قبل تطبيق عتبة الصلة
+        """
+        future: Future = Future()
+        self._queue.put((collection, query, n_results, mode, future))
+        return future
+
+    def _next_batch(self) -> List[Any]:
+        """انتظار طلب ثم جمع ما يصل خلال max_wait حتى حجم الدفعة"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size and batch[-1] is not self._STOP:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            items = [item for item in batch if item is not self._STOP]
+            if items:
+                self._search(items)
+            if len(items) < len(batch):
+                return
+
+    def _search(self, items: List[Any]):
+        """تنفيذ الدفعة: عملية search_many واحدة لكل (مجموعة، عدد نتائج، نمط)"""
+        self._stats["queries"] += len(items)
+        self._stats["batches"] += 1
+        self._stats["largest_batch"] = max(self._stats["largest_batch"], len(items))
+
+        groups: Dict[Tuple[str, int, str], List[Any]] = {}
+        for item in items:
+            collection, _, n_results, mode, _ = item
+            groups.setdefault((collection, n_results, mode), []).append(item)
+
+        for (collection, n_results, mode), group in groups.items():
+            try:
+                results = self.memory.search_many(
+                    collection, [item[1] for item in group], n_results, mode
+                )
+                for item, hits in zip(group, results):
+                    item[4].set_result(hits)
+            except Exception as e:
+                for item in group:
+                    if not item[4].done():
+                        item[4].set_exception(e)
+
+    def stats(self) -> Dict[str, Any]:
+        """إحصائيات التجميع"""
+        return {
+            **self._stats,
+            "average_batch": self._stats["queries"] / self._stats["batches"] if self._stats["batches"] else 0.0
+        }
+
+    def close(self):
+        """تنفيذ الطلبات المتبقية ثم إيقاف الخيط"""
+        self._queue.put(self._STOP)
+        self._thread.join()
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """اتصال واحد: طلب JSON في كل سطر ورد JSON في سطر"""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                result = self.server.service.dispatch(
+                    request["method"], request.get("args", []), request.get("kwargs", {})
+                )
+                response = {"result": result}
+            except Exception as e:
+                response = {"error": str(e), "type": type(e).__name__}
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b"\n")
+            self.wfile.flush()
+
+
+# طابور اتصالات يتسع لجلسات كثيرة تتصل معاً (الافتراضي في socketserver خمسة)
+REQUEST_QUEUE_SIZE = 128
+
+if hasattr(socketserver, "UnixStreamServer"):
+    class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+        request_queue_size = REQUEST_QUEUE_SIZE
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = REQUEST_QUEUE_SIZE
+
+
+class MemoryServer:
+    """خادم يعرض عمليات Memory عبر مقبس مع تجميع عمليات البحث"""
+
+    # العمليات التي تُمرَّر إلى Memory كما هي
+    METHODS = (
+        "add_interaction", "add_lesson", "add_interactions_bulk", "add_lessons_bulk",
+        "get_recent_interactions", "get_important_lessons", "get_lessons_by_category",
+        "get_memory_stats", "clear_old_interactions", "reconcile_index", "flush"
+    )
+    # عمليات أول معاملاتها مسار ملف؛ المسار يُحل داخل export_dir فقط
+    FILE_METHODS = ("export_memory", "import_memory", "export_memory_stream", "import_memory_stream")
+
+    def __init__(self, memory: Memory, address: Address,
+                 max_batch_size: int = 32, max_wait: float = 0.002,
+                 export_dir: Optional[str] = None):
+        """
+        Args:
+            memory: كائن الذاكرة الذي تخدمه العملية
+            address: مسار مقبس Unix، أو (المضيف، المنفذ) لـ TCP (المنفذ 0 لاختيار منفذ متاح)
+            max_batch_size: أقصى عدد عمليات بحث في الدفعة الواحدة
+            max_wait: أقصى مدة انتظار طلبات بحث أخرى قبل تنفيذ الدفعة بالثواني
+            export_dir: مجلد التصدير والاستيراد في الخادم؛ مسارات العملاء تُحل داخله
+                ويُرفض ما يخرج عنه (None لتعطيل عمليات الملفات، فالخدمة بلا مصادقة)
+        """
+        self.memory = memory
+        self.export_dir = os.path.realpath(export_dir) if export_dir is not None else None
+        self.batcher = SearchBatcher(memory, max_batch_size, max_wait)
+
+        if isinstance(address, str):
+            if os.path.exists(address):
+                # مقبس متبقٍ من تشغيل سابق
+                os.remove(address)
+            self._server = _UnixServer(address, _RequestHandler)
+        else:
+            self._server = _TCPServer(tuple(address), _RequestHandler)
+        self._server.service = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> Address:
+        """العنوان الفعلي للخادم (بالمنفذ المختار عند تمرير 0)"""
+        return self._server.server_address
+
+    def dispatch(self, method: str, args: List[Any], kwargs: Dict[str, Any]) -> Any:
+        """تنفيذ طلب واحد"""
+        if method in self.METHODS:
+            return getattr(self.memory, method)(*args, **kwargs)
+        if method in self.FILE_METHODS:
+            filepath, *rest = args
+            return getattr(self.memory, method)(self._resolve_path(filepath), *rest, **kwargs)
+        if method in ("search_interactions", "search_lessons"):
+            return self._search(method[len("search_"):], *args, **kwargs)
+        if method == "search_all":
+            return self._search_all(*args, **kwargs)
+        if method == "search_many":
+            return self.memory.search_many(*args, **kwargs)
+        if method == "apply_retention":
+            policy, *rest = args
+            return self.memory.apply_retention(RetentionPolicy(**policy), *rest, **kwargs)
+        if method == "service_stats":
+            return self.batcher.stats()
+        raise ValueError(f"عملية غير معروفة: {method}")
+
+    def _resolve_path(self, filepath: str) -> str:
+        """مسار ملف من العميل داخل مجلد التصدير (PermissionError لما يخرج عنه)"""
+        if self.export_dir is None:
+            raise PermissionError("عمليات الملفات معطلة: لم يُحدد مجلد التصدير للخادم")
+        path = os.path.realpath(os.path.join(self.export_dir, filepath))
+        if os.path.commonpath([self.export_dir, path]) != self.export_dir:
+            raise PermissionError(f"المسار خارج مجلد التصدير: {filepath}")
+        return path
+
+    def _search(self, collection: str, query: str, n_results: int = 5, mode: str = "vector",
+                max_distance: Optional[float] = None, min_score: Optional[float] = None) -> List[Dict]:
+        hits = self.batcher.submit(collection, query, n_results, mode).result()
+        return self.memory.filter_by_relevance(hits, max_distance, min_score)
+
+    def _search_all(self, query: str, n_interactions: int = 5, n_lessons: int = 5,
+                    mode: str = "vector", max_distance: Optional[float] = None,
+                    min_score: Optional[float] = None) -> Dict[str, List[Dict]]:
+        futures = {
+            "interactions": self.batcher.submit("interactions", query, n_interactions, mode),
+            "lessons": self.batcher.submit("lessons", query, n_lessons, mode)
+        }
+        return {
+            collection: self.memory.filter_by_relevance(future.result(), max_distance, min_score)
+            for collection, future in futures.items()
+        }
+
+    def start(self) -> "MemoryServer":
+        """تشغيل الخادم في خيط خلفي داخل العملية الحالية (للاختبارات والتشغيل المدمج)"""
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="memory-service", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """تشغيل الخادم في الخيط الحالي حتى الإيقاف"""
+        self._server.serve_forever()
+
+    def close(self):
+        """إيقاف الخادم وتنفيذ عمليات البحث المتبقية"""
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+        self.batcher.close()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class MemoryClient(AwaitableMemory):
+    """
+    عميل خفيف بنفس واجهة Memory يرسل العمليات إلى خادم الذاكرة
+    اتصال واحد لكل خيط، فيمكن مشاركة العميل بين الجلسات
+    """
+
+    filter_by_relevance = staticmethod(Memory.filter_by_relevance)
+
+    def __init__(self, address: Address, timeout: Optional[float] = 30.0):
+        """
+        Args:
+            address: مسار مقبس Unix، أو (المضيف، المنفذ) لـ TCP
+            timeout: مهلة الرد بالثواني (None دون مهلة)
+        """
+        self.address = address
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections: List[socket.socket] = []
+        self._connections_lock = threading.Lock()
+        self._writer: Optional[ThreadPoolExecutor] = None
+        self._pending_writes = 0
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            if isinstance(self.address, str):
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            else:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.settimeout(self.timeout)
+            sock.connect(self.address if isinstance(self.address, str) else tuple(self.address))
+            connection = (sock, sock.makefile('rb'))
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(sock)
+        return connection
+
+    def _drop_connection(self):
+        """إغلاق اتصال الخيط الحالي وإزالته (يُفتح اتصال جديد في الطلب التالي)"""
+        connection = getattr(self._local, "connection", None)
+        self._local.connection = None
+        if connection is None:
+            return
+        sock, reader = connection
+        reader.close()
+        sock.close()
+        with self._connections_lock:
+            if sock in self._connections:
+                self._connections.remove(sock)
+
+    def _call(self, method: str, *args, **kwargs) -> Any:
+        """إرسال طلب وانتظار الرد"""
+        sock, reader = self._connection()
+        request = json.dumps({"method": method, "args": args, "kwargs": kwargs}, ensure_ascii=False)
+        try:
+            sock.sendall(request.encode('utf-8') + b"\n")
+            line = reader.readline()
+            if not line:
+                raise MemoryServiceError("أُغلق الاتصال بخادم الذاكرة")
+            response = json.loads(line)
+        except BaseException:
+            # رد متأخر على هذا الطلب سيُقرأ على أنه رد الطلب التالي، فلا يُعاد استخدام الاتصال
+            self._drop_connection()
+            raise
+
+        if "error" in response:
+            if response["type"] == "ValueError":
+                raise ValueError(response["error"])
+            raise MemoryServiceError(f"{response['type']}: {response['error']}")
+        return response["result"]
+
+    # ------------------------------------------------------------------
+    # الإدخال
+    # ------------------------------------------------------------------
+
+    def add_interaction(self, user_input: str, agent_response: str,
+                        metadata: Optional[Dict[str, Any]] = None) -> str:
+        return self._call("add_interaction", user_input, agent_response, metadata)
+
+    def add_interaction_async(self, user_input: str, agent_response: str,
+                              metadata: Optional[Dict[str, Any]] = None) -> Future:
+        """
+        إرسال التفاعل من خيط خلفي (بترتيب الإرسال) دون انتظار الرد
+        عمليات البحث والقراءة اللاحقة تنتظر إرساله، فتظهر فيها التفاعلات المضافة
+        """
+        with self._connections_lock:
+            if self._writer is None:
+                self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-client")
+            writer = self._writer
+            self._pending_writes += 1
+        future = writer.submit(self.add_interaction, user_input, agent_response, metadata)
+        future.add_done_callback(self._write_done)
+        return future
+
+    def _write_done(self, future: Future):
+        with self._connections_lock:
+            self._pending_writes -= 1
+
+    def _wait_for_pending_writes(self):
+        """ضمان قراءة ما كُتب: انتظار التفاعلات المعلقة في خيط الإرسال قبل القراءة"""
+        with self._connections_lock:
+            writer = self._writer if self._pending_writes else None
+        if writer is not None:
+            # خيط الإرسال واحد، فتنتهي هذه المهمة بعد كل ما سبقها
+            writer.submit(lambda: None).result()
+
+    def _call_after_writes(self, method: str, *args) -> Any:
+        """طلب بعد إرسال الكتابات المعلقة (للقراءة والصيانة)"""
+        self._wait_for_pending_writes()
+        return self._call(method, *args)
+
+    def add_lesson(self, lesson: str, category: str, importance: int = 5) -> str:
+        return self._call("add_lesson", lesson, category, importance)
+
+    def _add_bulk(self, method: str, items: Iterable, batch_size: int,
+                  progress_callback: Optional[Callable[[int, float], None]]) -> Dict[str, Any]:
+        # الخادم يعالج الدفعات؛ التقدم يُبلَّغ مرة واحدة عند الانتهاء
+        result = self._call(method, [list(item) if isinstance(item, tuple) else item for item in items],
+                            batch_size=batch_size)
+        if progress_callback:
+            progress_callback(result["count"], result["records_per_sec"])
+        return result
+
+    def add_interactions_bulk(self, interactions: Iterable, batch_size: int = 64,
+                              progress_callback: Optional[Callable[[int, float], None]] = None
+                              ) -> Dict[str, Any]:
+        return self._add_bulk("add_interactions_bulk", interactions, batch_size, progress_callback)
+
+    def add_lessons_bulk(self, lessons: Iterable, batch_size: int = 64,
+                         progress_callback: Optional[Callable[[int, float], None]] = None
+                         ) -> Dict[str, Any]:
+        return self._add_bulk("add_lessons_bulk", lessons, batch_size, progress_callback)
+
+    def flush(self):
+        """انتظار إرسال التفاعلات المعلقة ثم كتابتها في الخادم"""
+        with self._connections_lock:
+            writer = self._writer
+        if writer is not None:
+            writer.submit(lambda: None).result()
+        self._call("flush")
+
+    # ------------------------------------------------------------------
+    # البحث والقراءة
+    # ------------------------------------------------------------------
+
+    def search_interactions(self, query: str, n_results: int = 5, mode: str = "vector",
+                            max_distance: Optional[float] = None,
+                            min_score: Optional[float] = None) -> List[Dict]:
+        return self._call_after_writes("search_interactions", query, n_results, mode, max_distance, min_score)
+
+    def search_lessons(self, query: str, n_results: int = 5, mode: str = "vector",
+                       max_distance: Optional[float] = None,
+                       min_score: Optional[float] = None) -> List[Dict]:
+        return self._call_after_writes("search_lessons", query, n_results, mode, max_distance, min_score)
+
+    def search_all(self, query: str, n_interactions: int = 5, n_lessons: int = 5,
+                   mode: str = "vector", max_distance: Optional[float] = None,
+                   min_score: Optional[float] = None) -> Dict[str, List[Dict]]:
+        return self._call_after_writes("search_all", query, n_interactions, n_lessons, mode, max_distance, min_score)
+
+    def search_many(self, collection: str, queries: List[str], n_results: int = 5,
+                    mode: str = "vector", max_distance: Optional[float] = None,
+                    min_score: Optional[float] = None) -> List[List[Dict]]:
+        return self._call_after_writes("search_many", collection, list(queries), n_results, mode, max_distance, min_score)
+
+    def get_recent_interactions(self, n: int = 10) -> List[Dict]:
+        return self._call_after_writes("get_recent_interactions", n)
+
+    def get_important_lessons(self, min_importance: int = 7) -> List[Dict]:
+        return self._call("get_important_lessons", min_importance)
+
+    def get_lessons_by_category(self, category: str) -> List[Dict]:
+        return self._call("get_lessons_by_category", category)
+
+    def get_memory_stats(self) -> Dict[str, Any]:
+        return self._call_after_writes("get_memory_stats")
+
+    def service_stats(self) -> Dict[str, Any]:
+        """إحصائيات تجميع عمليات البحث في الخادم"""
+        return self._call("service_stats")
+
+    # ------------------------------------------------------------------
+    # الصيانة (مسارات الملفات نسبية إلى مجلد التصدير في الخادم)
+    # ------------------------------------------------------------------
+
+    def apply_retention(self, policy: RetentionPolicy, batch_size: int = 500) -> Dict[str, Any]:
+        return self._call_after_writes("apply_retention", policy.to_dict(), batch_size)
+
+    def clear_old_interactions(self, days: int = 30) -> Dict[str, Any]:
+        return self._call_after_writes("clear_old_interactions", days)
+
+    def reconcile_index(self) -> Dict[str, int]:
+        return self._call_after_writes("reconcile_index")
+
+    def export_memory(self, filepath: str):
+        return self._call_after_writes("export_memory", filepath)
+
+    def import_memory(self, filepath: str):
+        return self._call_after_writes("import_memory", filepath)
+
+    def export_memory_stream(self, filepath: str) -> Dict[str, Any]:
+        return self._call_after_writes("export_memory_stream", filepath)
+
+    def import_memory_stream(self, filepath: str, mode: str = "merge",
+                             batch_size: int = 256) -> Dict[str, Any]:
+        return self._call_after_writes("import_memory_stream", filepath, mode, batch_size)
+
+    def close(self):
+        """إغلاق اتصالات العميل (الخادم وذاكرته يبقيان)"""
+        with self._connections_lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.shutdown(wait=True)
+        with self._connections_lock:
+            for sock in self._connections:
+                sock.close()
+            self._connections = []
+        self._local = threading.local()
+
+
+def main():
+    """تشغيل خدمة الذاكرة كعملية مستقلة"""
+    parser = argparse.ArgumentParser(description="خدمة الذاكرة المشتركة بين جلسات الوكيل")
+    parser.add_argument("--db-path", default="./data/chroma_db", help="مسار بيانات الذاكرة")
+    parser.add_argument("--socket", help="مسار مقبس Unix")
+    parser.add_argument("--host", default="127.0.0.1", help="مضيف TCP (عند عدم تحديد --socket)")
+    parser.add_argument("--port", type=int, default=8765, help="منفذ TCP")
+    parser.add_argument("--max-batch-size", type=int, default=32, help="أقصى عدد عمليات بحث في الدفعة")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0, help="مدة انتظار الدفعة بالمللي ثانية")
+    parser.add_argument("--export-dir", help="مجلد التصدير والاستيراد (دونه تُعطل عمليات الملفات)")
+    args = parser.parse_args()
+
+    memory = Memory(db_path=args.db_path)
+    server = MemoryServer(
+        memory, args.socket or (args.host, args.port),
+        max_batch_size=args.max_batch_size, max_wait=args.max_wait_ms / 1000,
+        export_dir=args.export_dir
+    )
+    print(f"خدمة الذاكرة تعمل على {server.address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        memory.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+كاتب الذاكرة في الخلفية
+يستقبل التفاعلات في طابور ويكتبها على دفعات خارج المسار الحرج للرد
+"""
+
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+
+class MemoryWriter:
+    """خيط خلفي يجمع التفاعلات في دفعات ويكتبها عبر الإدخال المجمّع للذاكرة"""
+
+    _STOP = object()
+
+    def __init__(self, memory, max_batch_size: int = 64):
+        """
+        Args:
+            memory: كائن الذاكرة
+            max_batch_size: أقصى عدد تفاعلات في الدفعة الواحدة
+        """
+        self.memory = memory
+        self.max_batch_size = max_batch_size
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="memory-writer", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, user_input: str, agent_response: str,
+               metadata: Optional[Dict[str, Any]] = None) -> Future:
+        """
+        إضافة تفاعل إلى طابور الكتابة
+
+        Returns:
+            Future يحمل معرف التفاعل بعد كتابته
+        """
+        future: Future = Future()
+        self._queue.put((user_input, agent_response, metadata, future))
+        return future
+
+    def pending(self) -> int:
+        """عدد التفاعلات التي لم تُكتب بعد"""
+        return self._queue.unfinished_tasks
+
+    def flush(self):
+        """انتظار كتابة كل التفاعلات الموجودة في الطابور"""
+        self._queue.join()
+
+    def _next_batch(self) -> List[Any]:
+        """انتظار عنصر ثم سحب ما هو متاح حتى حجم الدفعة"""
+        batch = [self._queue.get()]
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            stop = any(item is self._STOP for item in batch)
+            items = [item for item in batch if item is not self._STOP]
+
+            if items:
+                self._write(items)
+
+            for _ in batch:
+                self._queue.task_done()
+
+            if stop:
+                return
+
+    def _write(self, items: List[Any]):
+        try:
+            result = self.memory.add_interactions_bulk(
+                [(user_input, agent_response, metadata)
+                 for user_input, agent_response, metadata, _ in items],
+                batch_size=len(items)
+            )
+            for item, interaction_id in zip(items, result["ids"]):
+                item[3].set_result(interaction_id)
+        except Exception as e:
+            print(f"خطأ في كتابة الذاكرة في الخلفية: {e}")
+            for item in items:
+                if not item[3].done():
+                    item[3].set_exception(e)
+
+    def close(self):
+        """كتابة ما تبقى ثم إيقاف الخيط"""
+        self._queue.put(self._STOP)
+        self._thread.join()
@@ -0,0 +1,226 @@
+"""
+مزودو النماذج اللغوية للوكيل
+واجهة موحدة للإكمال والبث، مع مزود OpenAI ومزود محلي حتمي
+(زمن استجابة قابل للضبط ومعدل رموز وحقن أخطاء) لتشغيل الوكيل وقياس أدائه دون اتصال
+"""
+
+import asyncio
+import math
+import os
+import random
+import re
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Union
+
+
+Messages = List[Dict[str, str]]
+
+_TOKEN = re.compile(r"\s*\S+")
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+
+class ProviderError(Exception):
+    """خطأ من مزود النموذج (بما فيه الأخطاء المحقونة في المزود المحلي)"""
+
+
+class LLMProvider(ABC):
+    """واجهة مزود النموذج اللغوي"""
+
+    model: str = ""
+
+    @abstractmethod
+    async def complete(self, messages: Messages, temperature: float = 0.7,
+                       max_tokens: int = 2000) -> str:
+        """
+        إكمال المحادثة
+
+        Args:
+            messages: رسائل المحادثة
+            temperature: درجة العشوائية
+            max_tokens: أقصى عدد رموز للرد
+
+        Returns:
+            نص الرد كاملاً
+        """
+
+    async def stream(self, messages: Messages, temperature: float = 0.7,
+                     max_tokens: int = 2000) -> AsyncIterator[str]:
+        """بث الرد جزءاً جزءاً (الافتراضي: الرد كاملاً كجزء واحد)"""
+        yield await self.complete(messages, temperature, max_tokens)
+
+
+class OpenAIProvider(LLMProvider):
+    """مزود OpenAI عبر العميل غير المتزامن"""
+
+    def __init__(self, model: str = "gpt-3.5-turbo", api_key: Optional[str] = None,
+                 base_url: Optional[str] = None, timeout: float = 600.0):
+        """
+        Args:
+            model: اسم النموذج
+            api_key: مفتاح API (الافتراضي OPENAI_API_KEY)
+            base_url: عنوان خادم متوافق (الافتراضي OPENAI_BASE_URL أو خادم OpenAI)
+            timeout: مهلة الطلب بالثواني
+        """
+        api_key = api_key or os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY غير موجود في متغيرات البيئة")
+
+        import httpx
+        from openai import AsyncOpenAI
+
+        self.model = model
+        # httpx.AsyncClient صريح لأن openai 1.3.0 يمرر proxies الذي أزيل في httpx 0.28
+        self.client = AsyncOpenAI(
+            api_key=api_key, base_url=base_url,
+            http_client=httpx.AsyncClient(timeout=timeout)
+        )
+
+    async def complete(self, messages: Messages, temperature: float = 0.7,
+                       max_tokens: int = 2000) -> str:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        return response.choices[0].message.content
+
+    async def stream(self, messages: Messages, temperature: float = 0.7,
+                     max_tokens: int = 2000) -> AsyncIterator[str]:
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class FakeProvider(LLMProvider):
+    """
+    مزود محلي حتمي لا يتصل بأي خدمة
+    يعيد نفس التسلسل من الأزمنة والأخطاء لنفس البذرة، فتتكرر نتائج القياس
+    """
+
+    def __init__(self, latency: float = 0.0, latency_distribution: str = "fixed",
+                 latency_jitter: float = 0.5, tokens_per_second: Optional[float] = None,
+                 error_rate: float = 0.0,
+                 responder: Optional[Callable[[Messages], str]] = None,
+                 seed: int = 0, model: str = "fake"):
+        """
+        Args:
+            latency: متوسط الزمن حتى أول رمز بالثواني
+            latency_distribution: fixed، uniform (latency × (1 ± jitter))،
+                exponential، أو lognormal (انحراف jitter بنفس المتوسط)
+            latency_jitter: مقدار التفاوت في uniform و lognormal
+            tokens_per_second: معدل توليد الرموز بعد أولها (None دون تأخير)
+            error_rate: نسبة الطلبات التي تفشل بـ ProviderError في موضع عشوائي من الرد
+            responder: دالة تبني الرد من الرسائل (الافتراضي صدى آخر رسالة للمستخدم)
+            seed: بذرة العشوائية
+            model: اسم النموذج المُبلَّغ عنه
+        """
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"توزيع زمن غير معروف: {latency_distribution}")
+        if not 0.0 <= error_rate <= 1.0:
+            raise ValueError("error_rate يجب أن يكون بين 0 و 1")
+
+        self.latency = latency
+        self.latency_distribution = latency_distribution
+        self.latency_jitter = latency_jitter
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.responder = responder or self._echo
+        self.model = model
+        self._random = random.Random(seed)
+
+        self.calls = 0
+        self.errors = 0
+        self.tokens = 0
+
+    @staticmethod
+    def _echo(messages: Messages) -> str:
+        """الرد الافتراضي: صدى آخر رسالة للمستخدم"""
+        user_messages = [message["content"] for message in messages if message["role"] == "user"]
+        return f"رد تجريبي على: {user_messages[-1] if user_messages else ''}"
+
+    def _sample_latency(self) -> float:
+        """زمن حتى أول رمز من التوزيع المختار"""
+        if self.latency <= 0:
+            return 0.0
+        if self.latency_distribution == "uniform":
+            spread = self.latency * self.latency_jitter
+            return max(0.0, self._random.uniform(self.latency - spread, self.latency + spread))
+        if self.latency_distribution == "exponential":
+            return self._random.expovariate(1.0 / self.latency)
+        if self.latency_distribution == "lognormal":
+            sigma = self.latency_jitter
+            return self.latency * math.exp(self._random.gauss(0.0, sigma) - sigma * sigma / 2)
+        return self.latency
+
+    def _plan(self, messages: Messages, max_tokens: int):
+        """
+        كل قرارات الطلب العشوائية تُسحب معاً عند بدئه، فلا يغيّر تداخل الطلبات التسلسل
+
+        Returns:
+            (الزمن حتى أول رمز، أجزاء الرد، موضع الخطأ أو None)
+        """
+        self.calls += 1
+        tokens = _TOKEN.findall(self.responder(messages))[:max_tokens]
+        latency = self._sample_latency()
+        fail_at = None
+        if self.error_rate and self._random.random() < self.error_rate:
+            fail_at = self._random.randint(0, len(tokens))
+        return latency, tokens, fail_at
+
+    async def _tokens(self, messages: Messages, max_tokens: int) -> AsyncIterator[str]:
+        """توليد أجزاء الرد بالزمن والمعدل المضبوطين"""
+        latency, tokens, fail_at = self._plan(messages, max_tokens)
+        await asyncio.sleep(latency)
+        for i, token in enumerate(tokens):
+            if i == fail_at:
+                break
+            if i and self.tokens_per_second:
+                await asyncio.sleep(1.0 / self.tokens_per_second)
+            self.tokens += 1
+            yield token
+        if fail_at is not None:
+            self.errors += 1
+            raise ProviderError(f"خطأ محقون بعد {fail_at} رموز")
+
+    async def complete(self, messages: Messages, temperature: float = 0.7,
+                       max_tokens: int = 2000) -> str:
+        return "".join([token async for token in self._tokens(messages, max_tokens)])
+
+    async def stream(self, messages: Messages, temperature: float = 0.7,
+                     max_tokens: int = 2000) -> AsyncIterator[str]:
+        async for token in self._tokens(messages, max_tokens):
+            yield token
+
+    def stats(self) -> Dict[str, Any]:
+        """عدد الطلبات والأخطاء المحقونة والرموز المولدة"""
+        return {"calls": self.calls, "errors": self.errors, "tokens": self.tokens}
+
+
+def resolve_provider(spec: Union[str, LLMProvider]) -> LLMProvider:
+    """
+    تحويل وصف المزود إلى كائن مزود
+
+    Args:
+        spec: openai، fake (المزود المحلي بإعداداته الافتراضية)، أو كائن LLMProvider
+
+    Returns:
+        المزود
+    """
+    if isinstance(spec, LLMProvider):
+        return spec
+
+    if spec == "openai":
+        return OpenAIProvider()
+    if spec == "fake":
+        return FakeProvider()
+
+    raise ValueError(f"مزود غير معروف: {spec}")
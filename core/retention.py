@@ -0,0 +1,85 @@
+"""
+نظام الاحتفاظ بالتفاعلات (Retention)
+يحدد التفاعلات المنتهية حسب العمر أو العدد أو الحجم، ويمكن تشغيله دورياً في الخلفية
+"""
+
+import threading
+from typing import Any, Dict, Optional
+
+
+class RetentionPolicy:
+    """سياسة الاحتفاظ بالتفاعلات؛ تُحذف الأقدم أولاً حتى تتحقق كل القيود المحددة"""
+
+    def __init__(self, max_age_days: Optional[float] = None,
+                 max_count: Optional[int] = None,
+                 max_bytes: Optional[int] = None):
+        """
+        Args:
+            max_age_days: أقصى عمر للتفاعل بالأيام
+            max_count: أقصى عدد للتفاعلات المحفوظة
+            max_bytes: أقصى حجم إجمالي للتفاعلات بالبايت (حجم تمثيلها JSON)
+        """
+        self.max_age_days = max_age_days
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+
+    def is_empty(self) -> bool:
+        """هل السياسة بلا قيود"""
+        return self.max_age_days is None and self.max_count is None and self.max_bytes is None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """تحويل السياسة إلى قاموس"""
+        return {
+            "max_age_days": self.max_age_days,
+            "max_count": self.max_count,
+            "max_bytes": self.max_bytes
+        }
+
+
+class RetentionScheduler:
+    """تشغيل سياسة الاحتفاظ دورياً في خيط خلفي"""
+
+    def __init__(self, memory, policy: RetentionPolicy,
+                 interval_seconds: float = 3600):
+        """
+        Args:
+            memory: كائن الذاكرة
+            policy: سياسة الاحتفاظ
+            interval_seconds: الفاصل الزمني بين التشغيلات
+        """
+        self.memory = memory
+        self.policy = policy
+        self.interval_seconds = interval_seconds
+        self.last_result: Optional[Dict[str, Any]] = None
+
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> Dict[str, Any]:
+        """تطبيق السياسة مرة واحدة"""
+        self.last_result = self.memory.apply_retention(self.policy)
+        return self.last_result
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval_seconds):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"خطأ في تطبيق سياسة الاحتفاظ: {e}")
+
+    def start(self):
+        """بدء التشغيل الدوري"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="memory-retention", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """إيقاف التشغيل الدوري"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,64 @@
+"""
+تقدير عدد الرموز (Tokens) في النصوص
+يستخدم tiktoken إن كانت مثبتة، وإلا تقديراً تقريبياً يراعي أن النص العربي
+يستهلك رموزاً أكثر لكل حرف من النص الإنجليزي
+"""
+
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+
+# متوسط عدد الأحرف لكل رمز في التقدير التقريبي
+ASCII_CHARS_PER_TOKEN = 4.0
+OTHER_CHARS_PER_TOKEN = 2.0
+# رموز إضافية لكل رسالة في صيغة المحادثة (الدور والفواصل)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    """ترميز tiktoken للنموذج، أو None إذا لم تكن المكتبة أو ملف الترميز متاحاً"""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # ملف الترميز يُنزَّل عند أول استخدام؛ تعذّره (دون اتصال) لا يوقف الطلب بل يُستخدم التقدير
+        print(f"خطأ في تحميل ترميز tiktoken: {e}")
+        return None
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    عدد الرموز في نص
+
+    Args:
+        text: النص
+        model: اسم النموذج (لاختيار ترميز tiktoken)
+
+    Returns:
+        عدد الرموز (تقديري إذا لم تكن tiktoken مثبتة)
+    """
+    if not text:
+        return 0
+
+    encoding = _encoding(model or "gpt-3.5-turbo")
+    if encoding is not None:
+        return len(encoding.encode(text))
+
+    ascii_chars = sum(1 for char in text if char.isascii())
+    other_chars = len(text) - ascii_chars
+    return max(1, round(ascii_chars / ASCII_CHARS_PER_TOKEN + other_chars / OTHER_CHARS_PER_TOKEN))
+
+
+def count_message_tokens(messages: List[Dict[str, str]], model: Optional[str] = None) -> int:
+    """عدد الرموز في قائمة رسائل محادثة"""
+    return sum(
+        count_tokens(message.get("content", ""), model) + MESSAGE_OVERHEAD_TOKENS
+        for message in messages
+    )
@@ -4,17 +4,39 @@
 """
 
 import asyncio
+import json
+import multiprocessing
 import os
+import socket
+import tempfile
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 
+import numpy as np
+
 # إضافة مسار المشروع
 import sys
 sys.path.insert(0, str(Path(__file__).parent))
 
 from core.agent import SmartAgent
-from core.memory import Memory
+from core.memory import ChromaBackend, Memory, NumpyBackend
+from core.memory_log import MemoryLog
+from core.memory_segments import SegmentStore
+from core.memory_namespaces import MemoryNamespaces
+from core.memory_service import MemoryClient, MemoryServer, MemoryServiceError
+from core.providers import FakeProvider, ProviderError, resolve_provider
+from core.cache import EmbeddingCache, SearchResultCache
+from core.dedup import DedupPolicy
+from core.lexical_index import LexicalIndex
+from core.context_builder import ContextBuilder, format_memory_context
+from core.conversation import ConversationHistory
+from core.retention import RetentionPolicy
 from core.reasoning import ReasoningEngine, ThoughtType
 from core.tools import ToolBox
+from core.tokens import _encoding, count_message_tokens, count_tokens
 
 
 def test_memory():
@@ -47,6 +69,807 @@ def test_memory():
     print(f"✅ إحصائيات الذاكرة: {stats}")
 
 
+def test_memory_offline():
+    """اختبار الذاكرة بالمُضمِّن المحلي دون اتصال"""
+    print("\n🧪 اختبار الذاكرة دون اتصال...")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        memory = Memory(db_path=tmp, embedding_function="hashing")
+        memory.add_interactions_bulk([
+            ("كيف أكتب برنامج بايثون؟", "استخدم الدالة print"),
+            ("ما حالة الطقس اليوم؟", "الجو مشمس")
+        ])
+        memory.add_lesson("التعامل مع المستخدمين بلطف مهم", "سلوك", importance=8)
+        memory.close()
+        
+        # بعد إعادة التشغيل يبقى الفهرس دون إعادة تضمين
+        memory = Memory(db_path=tmp, embedding_function="hashing")
+        assert memory.reconcile_stats == {"interactions": 0, "lessons": 0}
+        
+        results = memory.search_all("كيف اكتب برنامجاً بلغة بايثون", n_interactions=1)
+        assert results["interactions"][0]["id"] == "interaction_1"
+        assert len(results["lessons"]) == 1
+        memory.close()
+        print(f"✅ نتائج البحث: {results['interactions'][0]['document']}")
+
+
+def test_memory_retention():
+    """اختبار سياسة الاحتفاظ بالتفاعلات"""
+    print("\n🧪 اختبار سياسة الاحتفاظ...")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        memory = Memory(db_path=tmp, embedding_function="hashing")
+        memory.add_interactions_bulk([(f"سؤال {i}", f"جواب {i}") for i in range(10)])
+        
+        result = memory.apply_retention(RetentionPolicy(max_count=4))
+        assert result["removed"] == 6
+        assert memory.interactions_backend.count() == 4
+        
+        # المعرفات الجديدة لا تتكرر مع المعرفات المتبقية
+        new_id = memory.add_interaction("سؤال جديد", "جواب جديد")
+        assert new_id == "interaction_11"
+        
+        memory.clear_old_interactions(days=0)
+        assert memory.get_memory_stats()["total_interactions"] == 0
+        assert memory.interactions_backend.count() == 0
+        memory.close()
+        print(f"✅ تم حذف {result['removed']} تفاعلات من الذاكرة والفهرس")
+
+
+def test_memory_writer():
+    """اختبار الكتابة في الخلفية مع قراءة ما كُتب"""
+    print("\n🧪 اختبار كاتب الذاكرة في الخلفية...")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        memory = Memory(db_path=tmp, embedding_function="hashing")
+        futures = [
+            memory.add_interaction_async(f"سؤال رقم {i}", f"جواب رقم {i}")
+            for i in range(20)
+        ]
+        
+        # البحث بعد الإرسال مباشرة يرى التفاعلات المعلقة
+        results = memory.search_interactions("سؤال رقم 19 جواب رقم 19", n_results=1)
+        assert results[0]["id"] == futures[-1].result()
+        
+        memory.flush()
+        assert memory.get_memory_stats()["total_interactions"] == 20
+        memory.close()
+        print(f"✅ تمت كتابة {len(futures)} تفاعلاً في الخلفية")
+
+
+def test_numpy_backend():
+    """اختبار فهرس المتجهات المربوط بالذاكرة"""
+    print("\n🧪 اختبار فهرس NumPy...")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        memory = Memory(db_path=tmp, embedding_function="hashing", backend="numpy")
+        memory.add_interactions_bulk([(f"سؤال {i}", f"جواب {i}") for i in range(30)])
+        memory.apply_retention(RetentionPolicy(max_count=20))
+        memory.close()
+        
+        # الإضافة لا تعيد كتابة المصفوفة، والحذف علامات في الملف الجانبي
+        memory = Memory(db_path=tmp, embedding_function="hashing", backend="numpy")
+        assert memory.reconcile_stats["interactions"] == 0
+        assert memory.interactions_backend.count() == 20
+        
+        results = memory.search_interactions("سؤال 25 جواب 25", n_results=1)
+        assert results[0]["id"] == "interaction_26"
+        memory.close()
+        
+        # انقطاع بعد كتابة المتجه وقبل سطره الجانبي: الصف اليتيم يُستبدل عند الإضافة التالية
+        for quantization in ("none", "int8"):
+            path = os.path.join(tmp, f"crash_{quantization}")
+            backend = NumpyBackend(path, quantization=quantization)
+            backend.add(["a", "b"], [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]], ["أ", "ب"], [{"n": 1}, {"n": 2}])
+            for array in backend._arrays():
+                array.append(np.ones((1, 3), dtype=array.dtype))
+            backend.close()
+            
+            backend = NumpyBackend(path, quantization=quantization)
+            backend.add(["c", "d"], [[0.0, 0.0, 1.0], [1.0, 1.0, 0.0]], ["ج", "د"], [{"n": 3}, {"n": 4}])
+            assert backend.query([0.0, 0.0, 1.0], 1)[0]["id"] == "c"
+            assert backend.query([1.0, 1.0, 0.0], 1)[0]["id"] == "d"
+            assert backend._vectors.rows == 4
+            backend.close()
+        print(f"✅ نتيجة البحث: {results[0]['document']}")
+
+
+def test_quantized_backend():
+    """اختبار تخزين المتجهات مكمّمة مع إعادة الترتيب بالدقة الكاملة"""
+    print("\n🧪 اختبار تكميم المتجهات...")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        sizes = {}
+        for quantization in ("none", "float16", "int8"):
+            memory = Memory(db_path=tmp, embedding_function="hashing", backend="numpy",
+                            quantization=quantization, rerank_candidates=10)
+            if quantization == "none":
+                memory.add_interactions_bulk([(f"سؤال {i}", f"جواب {i}") for i in range(30)])
+            else:
+                # فهرس منفصل لكل نوع تكميم تملؤه المطابقة عند البدء
+                assert memory.reconcile_stats["interactions"] == 30
+            
+            results = memory.search_interactions("سؤال 25 جواب 25", n_results=1)
+            assert results[0]["id"] == "interaction_26"
+            sizes[quantization] = memory.interactions_backend.index_bytes()
+            memory.close()
+        
+        assert sizes["int8"] < sizes["float16"] < sizes["none"]
+    print(f"✅ حجم الفهرس بالبايت: {sizes}")
+
+
+def test_memory_log():
+    """اختبار سجل الكتابة المسبقة للذاكرة"""
+    print("\n🧪 اختبار سجل الذاكرة...")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = os.path.join(tmp, "memory.log")
+        snapshot_path = os.path.join(tmp, "memory.json")
+        
+        log = MemoryLog(log_path, snapshot_path, fsync_policy="always")
+        for i in range(3):
+            log.append("add_lesson", record={"id": f"lesson_{i + 1}"})
+        
+        # ضغط الإدخالات الثلاثة ثم إلحاق إدخال جديد
+        lessons = [{"id": f"lesson_{i + 1}"} for i in range(3)]
+        seq = log.rotate()
+        log.write_snapshot({"interactions": [], "lessons": lessons}, seq)
+        log.append("add_lesson", record={"id": "lesson_4"})
+        log.close()
+        
+        # إعادة التشغيل تتخطى ما تغطيه اللقطة
+        reopened = MemoryLog(log_path, snapshot_path)
+        data = reopened.load_snapshot()
+        replayed = [entry["record"]["id"] for entry in reopened.replay()]
+        
+        assert data["lessons"] == lessons
+        assert replayed == ["lesson_4"]
+        assert reopened.seq == 4
+        print(f"✅ تمت إعادة تشغيل {len(replayed)} إدخال فوق اللقطة")
+
+
+def test_memory_log_compaction():
+    """اختبار الحفظ الكامل أثناء ضغط خلفي (دون انتظار متبادل على قفل الذاكرة)"""
+    print("\n🧪 اختبار الضغط أثناء الاستيراد...")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        export_path = os.path.join(tmp, "memory.ndjson")
+        source = Memory(db_path=os.path.join(tmp, "source"), embedding_function="hashing", backend="numpy")
+        source.add_interactions_bulk([(f"سؤال {i}", f"جواب {i}") for i in range(100)])
+        source.export_memory_stream(export_path)
+        source.close()
+        
+        db_path = os.path.join(tmp, "target")
+        memory = Memory(db_path=db_path, embedding_function="hashing", backend="numpy", compact_threshold=10)
+        
+        def _import_twice():
+            for _ in range(2):
+                memory.import_memory_stream(export_path, mode="replace", batch_size=20)
+        
+        worker = threading.Thread(target=_import_twice, daemon=True)
+        worker.start()
+        worker.join(timeout=60)
+        assert not worker.is_alive(), "الاستيراد توقف بانتظار الضغط الخلفي"
+        memory.close()
+        
+        reopened = Memory(db_path=db_path, embedding_function="hashing", backend="numpy")
+        assert reopened.get_memory_stats()["total_interactions"] == 100
+        reopened.close()
+    print("✅ الاستيراد المتكرر انتهى واللقطة متسقة")
+
+
+def _shared_memory_worker(db_path: str, worker: int, count: int):
+    """عملية تضيف تفاعلات إلى ذاكرة مشتركة"""
+    memory = Memory(db_path=db_path, embedding_function="hashing", backend="numpy",
+                    shared=True, compact_threshold=25)
+    for i in range(count):
+        memory.add_interaction(f"سؤال العامل {worker} رقم {i}", f"جواب العامل {worker} رقم {i}")
+    memory.close()
+
+
+def test_shared_memory():
+    """اختبار مشاركة مجلد الذاكرة بين عدة عمليات"""
+    print("\n🧪 اختبار الذاكرة المشتركة بين العمليات...")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        reader = Memory(db_path=tmp, embedding_function="hashing", backend="numpy",
+                        shared=True, compact_threshold=25)
+        
+        context = multiprocessing.get_context("spawn")
+        workers = [
+            context.Process(target=_shared_memory_worker, args=(tmp, worker, 40))
+            for worker in range(3)
+        ]
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join()
+            assert process.exitcode == 0
+        
+        # إضافات العمليات الأخرى تظهر دون إعادة فتح الذاكرة، بمعرفات لا تتكرر
+        assert reader.get_memory_stats()["total_interactions"] == 120
+        ids = {record["id"] for record in reader.memory_data["interactions"]}
+        assert ids == {f"interaction_{i}" for i in range(1, 121)}
+        assert reader.interactions_backend.count() == 120
+        results = reader.search_interactions("سؤال العامل 2 رقم 7", n_results=1, mode="hybrid")
+        assert results[0]["metadata"]["user_input"] == "سؤال العامل 2 رقم 7"
+        assert reader.add_interaction("سؤال جديد", "جواب") == "interaction_121"
+        reader.close()
+        
+        reopened = Memory(db_path=tmp, embedding_function="hashing", backend="numpy", shared=True)
+        assert reopened.get_memory_stats()["total_interactions"] == 121
+        reopened.close()
+    print("✅ 3 عمليات كتبت 120 تفاعلاً دون فقدان أو تكرار في المعرفات")
+
+
+def test_memory_service():
+    """اختبار خدمة الذاكرة خارج العملية مع تجميع عمليات البحث"""
+    print("\n🧪 اختبار خدمة الذاكرة...")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        memory = Memory(db_path=tmp, embedding_function="hashing", backend="numpy")
+        with MemoryServer(memory, os.path.join(tmp, "memory.sock"), max_wait=0.05) as server:
+            client = MemoryClient(server.address)
+            client.add_interactions_bulk([(f"سؤال {i}", f"جواب {i}") for i in range(20)])
+            assert client.add_lesson("درس مهم", "general", 9) == "lesson_1"
+            assert client.get_memory_stats()["total_interactions"] == 20
+            
+            # عمليات بحث متزامنة من عدة جلسات تُنفَّذ في دفعات بنتائج البحث المباشر نفسها
+            queries = [f"سؤال {i} جواب {i}" for i in range(8)]
+            results = [None] * len(queries)
+            barrier = threading.Barrier(len(queries))
+            
+            def _search(i):
+                barrier.wait()
+                results[i] = client.search_interactions(queries[i], n_results=3)
+            
+            threads = [threading.Thread(target=_search, args=(i,)) for i in range(len(queries))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            
+            for query, found in zip(queries, results):
+                assert found == memory.search_interactions(query, n_results=3)
+            stats = client.service_stats()
+            assert stats["queries"] == 8 and stats["batches"] < 8
+            
+            # القراءة بعد الإرسال غير المتزامن ترى التفاعلات المرسلة
+            futures = [client.add_interaction_async(f"سؤال لاحق {i}", f"جواب لاحق {i}") for i in range(5)]
+            assert [hit["id"] for hit in client.get_recent_interactions(1)] == ["interaction_25"]
+            assert all(future.done() for future in futures)
+            assert client.get_memory_stats()["total_interactions"] == 25
+            
+            combined = client.search_all("درس مهم", n_interactions=1, n_lessons=1, min_score=0.1)
+            assert combined["lessons"][0]["id"] == "lesson_1"
+            try:
+                client.search_lessons("درس", mode="unknown")
+                assert False, "نمط البحث غير المعروف يجب أن يفشل"
+            except ValueError:
+                pass
+            # عمليات الملفات معطلة دون مجلد تصدير
+            try:
+                client.export_memory_stream(os.path.join(tmp, "memory.ndjson"))
+                assert False, "التصدير دون مجلد تصدير يجب أن يُرفض"
+            except MemoryServiceError as e:
+                assert "PermissionError" in str(e)
+            client.close()
+            
+            # بعد انتهاء المهلة يُغلق الاتصال فلا يُقرأ الرد المتأخر كرد للطلب التالي
+            slow_client = MemoryClient(server.address, timeout=0.2)
+            get_memory_stats = memory.get_memory_stats
+            memory.get_memory_stats = lambda: (time.sleep(0.5), get_memory_stats())[1]
+            try:
+                slow_client.get_memory_stats()
+                assert False, "الطلب البطيء يجب أن يتجاوز المهلة"
+            except (socket.timeout, TimeoutError):
+                pass
+            finally:
+                del memory.get_memory_stats
+            time.sleep(0.5)
+            assert slow_client.get_recent_interactions(1)[0]["id"] == "interaction_25"
+            assert len(slow_client._connections) == 1
+            slow_client.close()
+        
+        # المسارات تُحل داخل مجلد التصدير ويُرفض ما يخرج عنه
+        export_dir = os.path.join(tmp, "exports")
+        os.makedirs(export_dir)
+        with MemoryServer(memory, os.path.join(tmp, "export.sock"), export_dir=export_dir) as server:
+            client = MemoryClient(server.address)
+            assert client.export_memory_stream("memory.ndjson")["interactions"] == 25
+            assert os.path.exists(os.path.join(export_dir, "memory.ndjson"))
+            for path in ("../escape.ndjson", os.path.join(tmp, "escape.ndjson")):
+                try:
+                    client.export_memory_stream(path)
+                    assert False, "المسار خارج مجلد التصدير يجب أن يُرفض"
+                except MemoryServiceError as e:
+                    assert "PermissionError" in str(e)
+            assert not os.path.exists(os.path.join(tmp, "escape.ndjson"))
+            client.close()
+        memory.close()
+    print(f"✅ متوسط حجم دفعة البحث: {stats['average_batch']:.1f}")
+
+
+def test_memory_namespaces():
+    """اختبار مساحات الذاكرة لكل مستأجر مع الحصص"""
+    print("\n🧪 اختبار مساحات الذاكرة...")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        namespaces = MemoryNamespaces(
+            root=tmp, embedding_function="hashing", backend="numpy",
+            quota=RetentionPolicy(max_count=5),
+            quotas={"premium": RetentionPolicy(max_count=50)}
+        )
+        tenant = namespaces.get("tenant_a")
+        tenant.add_interactions_bulk([(f"سؤال {i}", f"جواب {i}") for i in range(4)])
+        for i in range(4, 8):
+            tenant.add_interaction(f"سؤال {i}", f"جواب {i}")
+        premium = namespaces.get("premium")
+        premium.add_interactions_bulk([(f"طلب {i}", f"رد {i}") for i in range(8)])
+        
+        # الحصة تحذف الأقدم في مساحتها فقط، والبحث لا يتجاوز المساحة
+        stats = namespaces.stats()
+        assert stats["tenant_a"]["interactions"] == 5 and stats["tenant_a"]["quota"]["evicted"] == 3
+        assert stats["premium"]["interactions"] == 8 and stats["premium"]["quota"]["evicted"] == 0
+        assert tenant.interactions_backend.count() == 5
+        assert all(hit["id"] in {f"interaction_{i}" for i in range(4, 9)}
+                   for hit in tenant.search_interactions("طلب 3 رد 3", n_results=5))
+        assert namespaces.get("tenant_a") is tenant
+        assert tenant.embedding_cache is premium.embedding_cache
+        assert namespaces.list_namespaces() == ["premium", "tenant_a"]
+        try:
+            namespaces.get("../other")
+            assert False, "اسم المساحة غير الصالح يجب أن يفشل"
+        except ValueError:
+            pass
+        namespaces.close()
+        
+        reopened = MemoryNamespaces(root=tmp, embedding_function="hashing", backend="numpy")
+        assert reopened.get("tenant_a").get_memory_stats()["total_interactions"] == 5
+        reopened.close()
+    print("✅ كل مساحة تبحث في بياناتها وتلتزم بحصتها")
+
+
+def test_embedding_cache():
+    """اختبار الذاكرة المؤقتة للتضمينات"""
+    print("\n🧪 اختبار ذاكرة التضمينات المؤقتة...")
+    
+    calls = []
+    
+    def embedding_function(texts):
+        calls.append(list(texts))
+        return [[float(len(text))] for text in texts]
+    
+    cache = EmbeddingCache("test-model", max_entries=2)
+    cache.embed(["مرحبا", "مرحبا  ", "سؤال"], embedding_function)
+    cache.embed(["مرحبا"], embedding_function)
+    
+    # النص الموحد يُضمَّن مرة واحدة فقط
+    assert calls == [["مرحبا", "سؤال"]]
+    
+    # الإخلاء LRU عند تجاوز الحد
+    cache.embed(["نص جديد"], embedding_function)
+    cache.embed(["سؤال"], embedding_function)
+    
+    stats = cache.stats()
+    assert stats["size"] == 2
+    assert stats["misses"] == 4
+    
+    # معرف النموذج يفصل الذاكرة المؤقتة والمجموعات، فالدالة المخصصة بلا name() تُرفض
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            Memory(db_path=tmp, embedding_function=embedding_function, backend="numpy")
+            assert False, "دالة تضمين بلا name() يجب أن تُرفض"
+        except ValueError:
+            pass
+        embedding_function.name = lambda: "length-1"
+        memory = Memory(db_path=tmp, embedding_function=embedding_function, backend="numpy")
+        assert memory.embedding_model == "length-1"
+        memory.close()
+    print(f"✅ إحصائيات الذاكرة المؤقتة: {stats}")
+
+
+def test_search_cache():
+    """اختبار الذاكرة المؤقتة لنتائج البحث"""
+    print("\n🧪 اختبار ذاكرة نتائج البحث المؤقتة...")
+    
+    cache = SearchResultCache(max_entries=8, ttl_seconds=60)
+    generation = cache.generation("lessons")
+    cache.put("lessons", "كيف أتعلم؟", 3, [{"id": "lesson_1"}], generation)
+    
+    assert cache.get("lessons", "  كيف   أتعلم؟ ", 3) == [{"id": "lesson_1"}]
+    assert cache.get("lessons", "كيف أتعلم؟", 5) is None
+    
+    # الكتابة في المجموعة تبطل نتائجها
+    cache.invalidate("lessons")
+    assert cache.get("lessons", "كيف أتعلم؟", 3) is None
+    
+    # نتيجة بحث بدأ قبل الكتابة لا تُخزَّن
+    cache.put("lessons", "كيف أتعلم؟", 3, [{"id": "lesson_1"}], generation)
+    assert cache.get("lessons", "كيف أتعلم؟", 3) is None
+    print(f"✅ إحصائيات ذاكرة البحث: {cache.stats()}")
+
+
+def test_lexical_search():
+    """اختبار البحث النصي والهجين"""
+    print("\n🧪 اختبار البحث النصي والهجين...")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        memory = Memory(db_path=tmp, embedding_function="hashing", backend="numpy")
+        memory.add_interactions_bulk(
+            [(f"سؤال عن الملف module_{i}.py", f"جواب {i}") for i in range(30)]
+            + [("ظهر الخطأ E1234 عند تشغيل app.py", "تم إصلاح الإعدادات")]
+        )
+        
+        lexical = memory.search_interactions("E1234", mode="lexical")
+        assert lexical and lexical[0]["id"] == "interaction_31"
+        
+        hybrid = memory.search_interactions("app.py E1234", n_results=3, mode="hybrid")
+        assert hybrid[0]["id"] == "interaction_31"
+        
+        # الحذف بسياسة الاحتفاظ يطال الفهرس النصي أيضاً
+        memory.apply_retention(RetentionPolicy(max_count=10))
+        assert memory.search_interactions("E1234", mode="lexical")[0]["id"] == "interaction_31"
+        assert memory.search_interactions("module_3.py", mode="lexical") == []
+        memory.close()
+
+        # إعادة فهرسة معرف موجود تستبدل صف FTS ولا تترك صفاً يتيماً
+        index = LexicalIndex(os.path.join(tmp, "lexical_replace.sqlite3"))
+        index.add("lessons", ["lesson_1"], ["نص قديم"], [{}])
+        index.add("lessons", ["lesson_1"], ["نص جديد"], [{}])
+        assert index.search("lessons", "قديم", 5) == []
+        assert [hit["document"] for hit in index.search("lessons", "جديد", 5)] == ["نص جديد"]
+        rows = index._conn.execute("SELECT COUNT(*) FROM lessons_fts").fetchone()[0]
+        assert rows == 1
+        index.close()
+    print("✅ البحث النصي يلتقط المعرفات الحرفية")
+
+
+def test_memory_stream_transfer():
+    """اختبار التصدير والاستيراد المتدفق بصيغة NDJSON"""
+    print("\n🧪 اختبار نقل الذاكرة بصيغة NDJSON...")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        export_path = os.path.join(tmp, "memory.ndjson")
+        source = Memory(db_path=os.path.join(tmp, "source"), embedding_function="hashing")
+        source.add_interactions_bulk([(f"سؤال {i}", f"جواب {i}") for i in range(20)])
+        source.add_lesson("درس مهم", "عام", 9)
+        exported = source.export_memory_stream(export_path)
+        source.close()
+        assert exported["interactions"] == 20 and exported["lessons"] == 1
+        
+        target = Memory(db_path=os.path.join(tmp, "target"), embedding_function="hashing")
+        stats = target.import_memory_stream(export_path, batch_size=8)
+        assert stats["interactions"] == 20 and stats["lessons"] == 1
+        assert target.interactions_backend.count() == 20
+        
+        # الدمج يتخطى المعرفات الموجودة، والاستبدال يحذف ما قبله
+        assert target.import_memory_stream(export_path)["skipped"] == 21
+        target.add_interaction("تفاعل محلي", "رد")
+        target.import_memory_stream(export_path, mode="replace")
+        assert len(target.memory_data["interactions"]) == 20
+        assert target.interactions_backend.count() == 20
+        print(f"✅ الاستيراد: {stats['records_per_sec']:.0f} سجل/ثانية")
+        target.close()
+
+
+def test_memory_tiers():
+    """اختبار الطبقتين الساخنة والباردة للتفاعلات"""
+    print("\n🧪 اختبار الطبقة الباردة للتفاعلات...")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        memory = Memory(db_path=tmp, embedding_function="hashing",
+                        hot_interactions=10, segment_size=20)
+        memory.add_interactions_bulk([(f"سؤال {i}", f"جواب {i}") for i in range(75)])
+        stats = memory.get_memory_stats()
+        assert stats["total_interactions"] == 75
+        assert stats["hot_interactions"] == 15 and stats["cold_tier"]["segments"] == 3
+        
+        # آخر التفاعلات تمتد إلى المقاطع الباردة عند الحاجة
+        recent = memory.get_recent_interactions(30)
+        assert [record["id"] for record in recent] == [f"interaction_{i}" for i in range(46, 76)]
+        memory.close()
+        
+        memory = Memory(db_path=tmp, embedding_function="hashing",
+                        hot_interactions=10, segment_size=20)
+        assert memory.get_memory_stats()["total_interactions"] == 75
+        
+        # الاحتفاظ يحذف مقاطع كاملة من بياناتها الوصفية ثم يقطع داخل المقطع التالي
+        assert memory.apply_retention(RetentionPolicy(max_count=30))["removed"] == 45
+        assert memory.get_memory_stats()["cold_tier"]["records"] == 15
+        assert memory.interactions_backend.count() == 30
+        assert memory.add_interaction("سؤال جديد", "جواب") == "interaction_76"
+        memory.close()
+
+        # دمج تصدير أقدم في ذاكرة مقسمة يبقي المقاطع مرتبة زمنياً
+        export_path = os.path.join(tmp, "older.ndjson")
+        older = Memory(db_path=os.path.join(tmp, "older"), embedding_function="hashing")
+        older.add_interactions_bulk([(f"قديم {i}", f"جواب {i}") for i in range(53)])
+        # معرفات لا تتداخل مع الذاكرة الأحدث (interaction_31 حتى interaction_53)
+        older.apply_retention(RetentionPolicy(max_count=23))
+        older.export_memory_stream(export_path)
+        older.close()
+
+        memory = Memory(db_path=os.path.join(tmp, "newer"), embedding_function="hashing",
+                        hot_interactions=10, segment_size=5)
+        for i in range(30):
+            memory.add_interaction(f"جديد {i}", f"جواب {i}")
+        newest = [record["id"] for record in memory.get_recent_interactions(5)]
+        stats = memory.import_memory_stream(export_path, batch_size=4)
+        assert stats["interactions"] == 23
+
+        segments = memory.cold_store.segments
+        hot = memory.memory_data["interactions"]
+        assert all(a["end"] <= b["start"] for a, b in zip(segments, segments[1:]))
+        assert segments[-1]["end"] <= hot[0]["timestamp"]
+        records = list(memory.cold_store.iter_records()) + hot
+        assert len({record["id"] for record in records}) == 53
+        assert [record["timestamp"] for record in records] == sorted(record["timestamp"] for record in records)
+        assert [record["id"] for record in memory.get_recent_interactions(5)] == newest
+        assert memory.import_memory_stream(export_path)["skipped"] == 23
+
+        # الاحتفاظ يحذف الأقدم، وهي التفاعلات المستوردة
+        assert memory.apply_retention(RetentionPolicy(max_count=30))["removed"] == 23
+        assert all(record["user_input"].startswith("جديد") for record in memory.cold_store.iter_records())
+        memory.close()
+
+        # التصدير يقرأ لقطة ثابتة ولو نُقلت تفاعلات أو حُذفت مقاطع أثناء قراءة الطبقة الباردة
+        memory = Memory(db_path=os.path.join(tmp, "export"), embedding_function="hashing",
+                        hot_interactions=10, segment_size=20)
+        memory.add_interactions_bulk([(f"سؤال {i}", f"جواب {i}") for i in range(75)])
+        iter_file = SegmentStore.iter_file
+        
+        def _iter_during_changes(path):
+            if not changed:
+                changed.append(True)
+                memory.add_interactions_bulk([(f"أثناء التصدير {i}", "جواب") for i in range(20)])
+                memory.apply_retention(RetentionPolicy(max_count=40))
+            return iter_file(path)
+        
+        changed = []
+        SegmentStore.iter_file = staticmethod(_iter_during_changes)
+        try:
+            memory.export_memory_stream(os.path.join(tmp, "during.ndjson"))
+        finally:
+            SegmentStore.iter_file = staticmethod(iter_file)
+        with open(os.path.join(tmp, "during.ndjson"), 'r', encoding='utf-8') as f:
+            exported = [json.loads(line)["record"]["id"] for line in f]
+        assert changed and exported == [f"interaction_{i}" for i in range(1, 76)]
+        memory.close()
+    print("✅ الطبقة الباردة تعمل")
+
+
+def test_memory_dedup():
+    """اختبار دمج التفاعلات والدروس المكررة عند الإدخال"""
+    print("\n🧪 اختبار كشف التكرار...")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        memory = Memory(db_path=tmp, embedding_function="hashing")
+        first = memory.add_interaction("كيف أقرأ ملف CSV في بايثون؟", "استخدم pandas.read_csv")
+        # نفس السؤال مع اختلاف التشكيل وعلامات الترقيم وحالة الأحرف
+        assert memory.add_interaction("كيف اقرأ ملف csv في بايثون", "استخدم pandas.read_csv.") == first
+        result = memory.add_interactions_bulk([("سؤال", "جواب"), ("سؤال", "جواب")])
+        assert result["ids"][0] == result["ids"][1] and result["duplicates"] == 1
+        
+        assert memory.interactions_backend.count() == 2
+        assert memory.memory_data["interactions"][0]["hit_count"] == 2
+        stats = memory.get_memory_stats()["dedup"]["interactions"]
+        assert stats["duplicates"] == 2 and stats["saved_bytes"] > 0
+        memory.close()
+        
+        # عدّاد التكرار محفوظ في السجل
+        memory = Memory(db_path=tmp, embedding_function="hashing")
+        assert memory.memory_data["interactions"][0]["hit_count"] == 2
+
+        # شبه المتطابق لا يُدمج إلا بتفعيل SimHash صراحة
+        question = "كيف أقرأ ملف CSV كبير في بايثون دون تحميله كاملاً في الذاكرة؟"
+        near = question.replace("كبير", "كبيرة")
+        answer = "استخدم pandas.read_csv مع المعامل chunksize"
+        first = memory.add_interaction(question, answer)
+        assert memory.add_interaction(near, answer) != first
+        memory.close()
+
+        memory = Memory(db_path=os.path.join(tmp, "near"), embedding_function="hashing",
+                        dedup={"interactions": DedupPolicy(simhash_distance=3)})
+        first = memory.add_interaction(question, answer)
+        assert memory.add_interaction(near, answer) == first
+        memory.close()
+    print(f"✅ إحصائيات التكرار: {stats['duplicates']} مكرر، {stats['saved_bytes']} بايت موفّرة")
+
+
+def test_search_thresholds():
+    """اختبار درجات التشابه وعتبات الصلة في نتائج البحث"""
+    print("\n🧪 اختبار عتبات الصلة في البحث...")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        memory = Memory(db_path=tmp, embedding_function="hashing")
+        memory.add_interactions_bulk([
+            ("كيف أقرأ ملف CSV في بايثون؟", "استخدم pandas.read_csv"),
+            ("ما حالة الطقس في الرياض؟", "مشمس")
+        ])
+        
+        results = memory.search_interactions("قراءة ملف csv في بايثون", n_results=2)
+        assert all("distance" in result and "score" in result for result in results)
+        assert results[0]["score"] >= results[1]["score"]
+        
+        relevant = memory.search_interactions("قراءة ملف csv في بايثون", n_results=2, min_score=0.3)
+        assert [result["id"] for result in relevant] == ["interaction_1"]
+        assert memory.search_all("سؤال لا علاقة له", max_distance=0.5)["interactions"] == []
+        memory.close()
+        
+        # الدرجات بنفس المقياس في الفهرسين ولو لم تكن التضمينات موحّدة الطول
+        import chromadb
+        backends = {
+            "chroma": ChromaBackend(chromadb.EphemeralClient().get_or_create_collection("scores")),
+            "numpy": NumpyBackend(os.path.join(tmp, "scores"))
+        }
+        for name, backend in backends.items():
+            backend.add(["a", "b"], [[3.0, 0.0], [0.0, 4.0]], ["أ", "ب"], [{"n": 1}, {"n": 2}])
+            hits = Memory._format_hits("interactions", backend.query([2.0, 0.0], 2))
+            scores = [round(hit["score"], 4) for hit in hits]
+            assert [hit["id"] for hit in hits] == ["a", "b"] and scores == [1.0, 0.0], (name, scores)
+    
+    # الوكيل لا يضيف رسالة سياق إذا لم تتجاوز أي نتيجة العتبة
+    assert format_memory_context([], []) == ""
+    context = format_memory_context([], [{"lesson": "درس"}])
+    print(f"✅ رسالة السياق: {count_tokens(context)} رمز تقريباً")
+
+
+def test_context_builder():
+    """اختبار بناء سياق الطلب ضمن ميزانية الرموز"""
+    print("\n🧪 اختبار باني السياق...")
+    
+    builder = ContextBuilder(budget=300, max_history_messages=6, snippet_chars=2000)
+    history = [
+        {"role": "user", "content": "سؤال قديم " * 200},
+        {"role": "assistant", "content": "رد قصير"},
+        {"role": "user", "content": "سؤال قصير"},
+        {"role": "assistant", "content": "رد قصير آخر"},
+        {"role": "user", "content": "الطلب الحالي"}
+    ]
+    history_tokens = [builder.count(message) for message in history]
+    interactions = [{"document": f"تفاعل سابق رقم {i} " * 5} for i in range(3)]
+    lessons = [{"lesson": "درس طويل " * 100}, {"lesson": "درس قصير"}]
+    
+    messages, report = builder.build("أنت وكيل ذكي", history, history_tokens, interactions, lessons)
+    
+    # الرسالة الطويلة القديمة تُحذف وما بعدها يُدرج، ثم المقتطفات، ثم الدرس الذي يتسع فقط
+    assert messages[0]["content"] == "أنت وكيل ذكي" and messages[1:5] == history[1:]
+    assert report["history_messages"] == 4 and report["dropped_history_messages"] == 1
+    assert report["memory_snippets"] == 3 and report["lessons"] == 1 and report["dropped_snippets"] == 1
+    all_snippets = {"role": "system", "content": format_memory_context(interactions, lessons, 2000)}
+    assert report["dropped_memory_tokens"] == builder.count(all_snippets) - report["memory_tokens"] > 300
+    assert "درس قصير" in messages[-1]["content"] and "درس طويل" not in messages[-1]["content"]
+    assert report["prompt_tokens"] == count_message_tokens(messages) <= 300
+    
+    # الطلب الحالي يُدرج دائماً حتى لو تجاوز الميزانية
+    messages, report = ContextBuilder(budget=20).build("تعليمات", history[:1], history_tokens[:1], [], [])
+    assert messages[-1] == history[0] and report["over_budget"]
+    
+    # الوكيل يحسب رموز كل رسالة مرة واحدة ويبلغ عن رموز الطلب
+    with tempfile.TemporaryDirectory() as tmp:
+        memory = Memory(db_path=tmp, embedding_function="hashing", backend="numpy")
+        agent = SmartAgent(memory=memory, provider="fake", context_budget=600)
+        
+        async def _run():
+            await agent.process_request("سؤال طويل جداً " * 300)
+            return await agent.process_request("سؤال قصير")
+        
+        result = asyncio.run(_run())
+        assert len(agent.history.recent(10)[1]) == len(agent.conversation_history) == 4
+        assert result["prompt_tokens"] <= 600 and result["context"]["history_messages"] == 1
+        agent.flush_memory()
+        
+        # ما تحذفه الميزانية لا يُحسب توفيراً من عتبة الصلة
+        memory.add_lessons_bulk([(f"درس طويل رقم {i} " * 60, "عام", 5) for i in range(3)])
+        agent = SmartAgent(memory=memory, provider="fake", context_budget=600, memory_min_score=None)
+        result = asyncio.run(agent.process_request("درس طويل"))
+        assert result["context"]["dropped_snippets"] and result["context"]["dropped_memory_tokens"] > 0
+        assert result["tokens_saved"] == 0
+        agent.flush_memory()
+        memory.close()
+    
+    # تعذّر تنزيل ملف ترميز tiktoken (دون اتصال) يعود إلى التقدير التقريبي ولا يوقف الطلب
+    def _download(*args):
+        raise OSError("network is unreachable")
+    
+    offline = types.ModuleType("tiktoken")
+    offline.encoding_for_model = offline.get_encoding = _download
+    installed = sys.modules.get("tiktoken")
+    sys.modules["tiktoken"] = offline
+    _encoding.cache_clear()
+    try:
+        assert count_tokens("hello world", "offline-model") == 3
+    finally:
+        if installed is None:
+            del sys.modules["tiktoken"]
+        else:
+            sys.modules["tiktoken"] = installed
+        _encoding.cache_clear()
+    print(f"✅ رموز الطلب: {result['prompt_tokens']} من 600")
+
+
+def test_conversation_history():
+    """اختبار السجل المحدود والملخص المتجدد في الجلسات الطويلة"""
+    print("\n🧪 اختبار سجل المحادثة والملخص...")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        history = ConversationHistory(os.path.join(tmp, "session.jsonl"), max_messages=10)
+        for i in range(25):
+            history.append({"role": "user", "content": f"رسالة {i}"}, 5)
+        
+        # الأقدم على القرص والأحدث في الذاكرة، والقراءة تجمع بينهما بالترتيب
+        assert len(history) == 25 and len(history.messages()) <= 10 and history.stats()["spilled"] >= 15
+        assert [m["content"] for m in history.slice(3, 6)] == ["رسالة 3", "رسالة 4", "رسالة 5"]
+        assert [m["content"] for m in history.slice(6, 22)] == [f"رسالة {i}" for i in range(6, 22)]
+        assert [m["content"] for m in history.iter_all()] == [f"رسالة {i}" for i in range(25)]
+        assert history.recent(3) == (history.messages()[-3:], [5, 5, 5])
+        history.clear()
+        assert len(history) == 0 and not os.path.exists(history.path)
+        
+        prompts = []
+        
+        def _responder(messages):
+            if messages[0]["content"].startswith("لخص"):
+                return f"ملخص حتى: {messages[-1]['content'].splitlines()[-1]}"
+            prompts.append(messages)
+            return f"رد على: {messages[-1 if messages[-1]['role'] == 'user' else -2]['content']}"
+        
+        memory = Memory(db_path=os.path.join(tmp, "memory"), embedding_function="hashing", backend="numpy")
+        agent = SmartAgent(memory=memory, provider=FakeProvider(responder=_responder),
+                           history_dir=os.path.join(tmp, "sessions"),
+                           max_history_in_memory=20, summarize_every=10)
+        
+        async def _run():
+            results = []
+            for i in range(60):
+                results.append(await agent.process_request(f"سؤال رقم {i} " * 20))
+                await asyncio.sleep(0)
+            await agent.wait_for_summary()
+            return results
+        
+        results = asyncio.run(_run())
+        
+        stats = agent.get_session_summary()["history"]
+        assert stats["messages"] == 120 and stats["in_memory"] <= 20 and stats["spilled"] >= 100
+        kept = results[-1]["context"]["history_messages"]
+        assert 119 - kept - stats["summarized"] < 2 * agent.summarize_every
+        assert agent.history.summary.startswith("ملخص حتى:")
+        assert any(message["content"].startswith("ملخص المحادثة السابقة")
+                   for message in prompts[-1] if message["role"] == "system")
+        # تكلفة الدور ثابتة مع نمو الجلسة
+        assert abs(results[-1]["prompt_tokens"] - results[30]["prompt_tokens"]) < 50
+        
+        export_path = os.path.join(tmp, "export.json")
+        agent.export_session(export_path)
+        with open(export_path, 'r', encoding='utf-8') as f:
+            exported = json.load(f)
+        assert len(exported["conversation"]) == 120 and exported["conversation_summary"] == agent.history.summary
+        
+        agent.reset_session()
+        assert agent.get_session_summary()["conversation_turns"] == 0 and agent.history.summary == ""
+
+        # الأدوار التي تحذفها الميزانية داخل النافذة تُطوى أيضاً، ولا تُدرج بعد طيها
+        agent.summarize_every = 4
+        agent.context_builder.budget = agent._system_tokens + 300
+
+        async def _run_budget():
+            for i in range(5):
+                await agent.process_request(f"سؤال قصير رقم {i} " * 10)
+                await agent.wait_for_summary()
+
+        prompts.clear()
+        asyncio.run(_run_budget())
+        summarized = agent.history.summarized
+        assert len(agent.history) == 10 and summarized >= 4
+        folded = {message["content"] for message in agent.history.slice(0, summarized)}
+        assert not any(message["content"] in folded for message in prompts[-1])
+        agent.flush_memory()
+        memory.close()
+    print(f"✅ {stats['summarized']} رسالة في الملخص و{stats['in_memory']} في الذاكرة، "
+          f"رموز الطلب {results[-1]['prompt_tokens']}")
+
+
 def test_reasoning():
     """اختبار محرك التفكير"""
     print("\n🧪 اختبار محرك التفكير المنطقي...")
@@ -100,6 +923,223 @@ def test_tools():
         print(f"  ❌ خطأ: {result.get('error')}")
 
 
+class _FakeChatHandler(BaseHTTPRequestHandler):
+    """خادم محلي متوافق مع chat/completions يرد بعد تأخير ثابت"""
+    
+    delay = 0.3
+    token_delay = 0.05
+    
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        user_input = [message for message in request["messages"] if message["role"] == "user"][-1]
+        if request.get("stream"):
+            self._stream(request, f"رد على: {user_input['content']}")
+            return
+        time.sleep(self.delay)
+        body = json.dumps({
+            "id": "chatcmpl-test", "object": "chat.completion", "created": 0,
+            "model": request["model"],
+            "choices": [{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": f"رد على: {user_input['content']}"}
+            }],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _stream(self, request, content):
+        """بث الرد كلمةً كلمةً بصيغة server-sent events"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for i, token in enumerate(content.split(" ")):
+            time.sleep(self.token_delay)
+            chunk = {
+                "id": "chatcmpl-test", "object": "chat.completion.chunk", "created": 0,
+                "model": request["model"],
+                "choices": [{"index": 0, "finish_reason": None,
+                             "delta": {"content": token if i == 0 else f" {token}"}}]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+    
+    def log_message(self, *args):
+        pass
+
+
+class _FakeChatServer(ThreadingHTTPServer):
+    # طابور الاتصالات الافتراضي (5) يؤخر الجلسات المتزامنة الزائدة عنه
+    request_queue_size = 64
+
+
+def test_agent_concurrency():
+    """اختبار تزامن جلسات الوكيل على حلقة أحداث واحدة مع خادم محلي بطيء"""
+    print("\n🧪 اختبار تزامن جلسات الوكيل...")
+    
+    server = _FakeChatServer(("127.0.0.1", 0), _FakeChatHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    saved_env = {key: os.environ.get(key) for key in ("OPENAI_API_KEY", "OPENAI_BASE_URL")}
+    os.environ["OPENAI_API_KEY"] = "test-key"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            memory = Memory(db_path=tmp, embedding_function="hashing", backend="numpy")
+            sessions = 8
+            agents = [SmartAgent(agent_name=f"جلسة {i}", memory=memory) for i in range(sessions + 1)]
+            
+            async def _run():
+                start = time.perf_counter()
+                single = await agents[0].process_request("طلب منفرد")
+                single_latency = time.perf_counter() - start
+                
+                start = time.perf_counter()
+                results = await asyncio.gather(*[
+                    agent.process_request(f"طلب {i}") for i, agent in enumerate(agents[1:])
+                ])
+                await agents[0].aflush_memory()
+                return single, single_latency, results, time.perf_counter() - start
+            
+            single, single_latency, results, elapsed = asyncio.run(_run())
+            
+            assert single["success"] and single["response"] == "رد على: طلب منفرد"
+            assert all(result["success"] for result in results)
+            assert [result["response"] for result in results] == [f"رد على: طلب {i}" for i in range(sessions)]
+            # الطلبات تتداخل: الزمن الكلي قريب من زمن طلب واحد لا مجموعها
+            assert elapsed < 2.5 * single_latency, (elapsed, single_latency)
+            assert memory.get_memory_stats()["total_interactions"] == sessions + 1
+            memory.close()
+    finally:
+        for key, value in saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        server.shutdown()
+        server.server_close()
+    print(f"✅ {sessions} جلسات في {elapsed:.2f}ث مقابل {single_latency:.2f}ث لطلب واحد")
+
+
+def test_agent_streaming():
+    """اختبار بث رد الوكيل: أول جزء يصل قبل اكتمال الرد"""
+    print("\n🧪 اختبار بث رد الوكيل...")
+    
+    server = _FakeChatServer(("127.0.0.1", 0), _FakeChatHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    saved_env = {key: os.environ.get(key) for key in ("OPENAI_API_KEY", "OPENAI_BASE_URL")}
+    os.environ["OPENAI_API_KEY"] = "test-key"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            memory = Memory(db_path=tmp, embedding_function="hashing", backend="numpy")
+            agent = SmartAgent(memory=memory)
+            
+            async def _run():
+                events = []
+                start = time.perf_counter()
+                async for event in agent.process_request_stream("اكتب قصة قصيرة جداً عن البحر"):
+                    events.append(event)
+                return events, time.perf_counter() - start
+            
+            events, total = asyncio.run(_run())
+            
+            kinds = [event["type"] for event in events]
+            assert kinds[0] == "thought" and kinds[-1] == "done" and kinds.count("done") == 1
+            tokens = [event["content"] for event in events if event["type"] == "token"]
+            result = events[-1]["result"]
+            assert len(tokens) == 8 and result["success"]
+            assert "".join(tokens) == result["response"] == "رد على: اكتب قصة قصيرة جداً عن البحر"
+            # التقييم يُبث بعد الرد، والرد الأول متاح قبل آخره بوقت ملحوظ
+            assert kinds.index("token") < len(kinds) - 2 and kinds[-2] == "thought"
+            assert result["time_to_first_token"] < total / 2, (result["time_to_first_token"], total)
+            
+            agent.flush_memory()
+            assert memory.get_recent_interactions(1)[0]["agent_response"] == result["response"]
+            assert agent.conversation_history[-1]["content"] == result["response"]
+            memory.close()
+    finally:
+        for key, value in saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        server.shutdown()
+        server.server_close()
+    print(f"✅ أول جزء بعد {result['time_to_first_token']:.2f}ث والرد كاملاً بعد {total:.2f}ث")
+
+
+def test_fake_provider():
+    """اختبار المزود المحلي الحتمي وتشغيل الوكيل دون مفتاح API"""
+    print("\n🧪 اختبار المزود المحلي...")
+    
+    saved_key = os.environ.pop("OPENAI_API_KEY", None)
+    try:
+        try:
+            resolve_provider("openai")
+            assert False, "مزود OpenAI يجب أن يتطلب OPENAI_API_KEY"
+        except ValueError:
+            pass
+        
+        # نفس البذرة تعطي نفس الأزمنة ونفس الأخطاء
+        first, second = (FakeProvider(latency=0.05, latency_distribution="lognormal", seed=7)
+                         for _ in range(2))
+        assert [first._sample_latency() for _ in range(5)] == [second._sample_latency() for _ in range(5)]
+        
+        messages = [{"role": "user", "content": "واحد اثنان ثلاثة أربعة"}]
+        provider = FakeProvider(latency=0.05, tokens_per_second=100)
+        start = time.perf_counter()
+        response = asyncio.run(provider.complete(messages))
+        elapsed = time.perf_counter() - start
+        assert response == "رد تجريبي على: واحد اثنان ثلاثة أربعة"
+        # 0.05 حتى أول رمز ثم 6 رموز بمعدل 100/ث
+        assert 0.1 <= elapsed < 0.3, elapsed
+        
+        def _outcomes(seed):
+            flaky = FakeProvider(error_rate=0.5, seed=seed)
+            outcomes = []
+            for _ in range(20):
+                try:
+                    outcomes.append(asyncio.run(flaky.complete(messages)))
+                except ProviderError:
+                    outcomes.append(None)
+            return outcomes, flaky.stats()
+        
+        outcomes, stats = _outcomes(3)
+        assert outcomes == _outcomes(3)[0]
+        assert 0 < stats["errors"] == outcomes.count(None) < 20 and stats["calls"] == 20
+        
+        # الوكيل كاملاً دون اتصال: الأخطاء المحقونة تظهر كنتيجة فاشلة، وأثناء البث بعد أجزاء من الرد
+        with tempfile.TemporaryDirectory() as tmp:
+            memory = Memory(db_path=tmp, embedding_function="hashing", backend="numpy")
+            
+            async def _run(agent):
+                results = [await agent.process_request(f"طلب {i}") for i in range(8)]
+                events = [event async for event in agent.process_request_stream("طلب مبثوث")]
+                return results, events
+            
+            agent = SmartAgent(memory=memory, provider=FakeProvider(error_rate=0.5, seed=3))
+            results, events = asyncio.run(_run(agent))
+            replay, _ = asyncio.run(_run(SmartAgent(memory=memory, provider=FakeProvider(error_rate=0.5, seed=3))))
+            
+            succeeded = [result["success"] for result in results]
+            assert succeeded == [result["success"] for result in replay] and 0 < sum(succeeded) < 8
+            assert results[succeeded.index(True)]["response"] == f"رد تجريبي على: طلب {succeeded.index(True)}"
+            assert "خطأ محقون" in results[succeeded.index(False)]["error"]
+            assert events[-1]["type"] == "done"
+            agent.flush_memory()
+            assert agent.get_session_summary()["conversation_turns"] >= sum(succeeded)
+            memory.close()
+    finally:
+        if saved_key is not None:
+            os.environ["OPENAI_API_KEY"] = saved_key
+    print(f"✅ {stats['errors']} أخطاء محقونة من 20 طلباً بتسلسل قابل للتكرار")
+
+
 async def test_agent():
     """اختبار الوكيل الذكي"""
     print("\n🧪 اختبار الوكيل الذكي...")
@@ -140,6 +1180,25 @@ def main():
     
     # اختبار الذاكرة
     test_memory()
+    test_memory_offline()
+    test_memory_retention()
+    test_memory_writer()
+    test_numpy_backend()
+    test_quantized_backend()
+    test_memory_log()
+    test_memory_log_compaction()
+    test_shared_memory()
+    test_memory_service()
+    test_memory_namespaces()
+    test_embedding_cache()
+    test_search_cache()
+    test_lexical_search()
+    test_memory_stream_transfer()
+    test_memory_tiers()
+    test_memory_dedup()
+    test_search_thresholds()
+    test_context_builder()
+    test_conversation_history()
     
     # اختبار التفكير
     test_reasoning()
@@ -148,6 +1207,9 @@ def main():
     test_tools()
     
     # اختبار الوكيل
+    test_agent_concurrency()
+    test_agent_streaming()
+    test_fake_provider()
     asyncio.run(test_agent())
     
     print("\n" + "=" * 60)
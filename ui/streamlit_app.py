@@ -79,9 +79,13 @@ def initialize_agent():
             st.session_state.agent = SmartAgent(
                 agent_name="الوكيل الذكي المتقدم",
                 language="ar",
-                debug=True
+                debug=True,
+                # AGENT_PROVIDER=fake لتشغيل الواجهة دون اتصال بمزود محلي
+                provider=os.getenv("AGENT_PROVIDER", "openai")
             )
             st.session_state.conversation = []
+            # حلقة أحداث واحدة للجلسة: اتصالات عميل OpenAI غير المتزامن مرتبطة بها
+            st.session_state.loop = asyncio.new_event_loop()
         except ValueError as e:
             st.error(f"❌ خطأ: {str(e)}")
             st.info("تأكد من تعيين OPENAI_API_KEY في ملف .env")
@@ -116,6 +120,34 @@ def display_thought_process(thoughts: list):
             st.progress(confidence, text=f"درجة الثقة: {confidence*100:.0f}%")
 
 
+def stream_response(user_input: str) -> dict:
+    """عرض الرد جزءاً جزءاً أثناء توليده وإرجاع النتيجة النهائية"""
+    loop = st.session_state.loop
+    events = st.session_state.agent.process_request_stream(user_input)
+    status = st.empty()
+    placeholder = st.empty()
+    response = ""
+    result = {"success": False, "error": "انتهى البث دون نتيجة"}
+    
+    while True:
+        try:
+            event = loop.run_until_complete(events.__anext__())
+        except StopAsyncIteration:
+            break
+        
+        if event["type"] == "thought":
+            status.caption(f"💭 {event['thought']['content']}")
+        elif event["type"] == "token":
+            response += event["content"]
+            placeholder.markdown(response + "▌")
+        elif event["type"] == "done":
+            result = event["result"]
+    
+    status.empty()
+    placeholder.markdown(response)
+    return result
+
+
 def display_memory_stats():
     """عرض إحصائيات الذاكرة"""
     if "agent" not in st.session_state:
@@ -231,36 +263,32 @@ def main():
         
         if st.button("📤 إرسال", key="send_button"):
             if user_input.strip():
-                with st.spinner("🔄 جاري معالجة طلبك..."):
-                    try:
-                        # معالجة الطلب
-                        loop = asyncio.new_event_loop()
-                        asyncio.set_event_loop(loop)
-                        result = loop.run_until_complete(
-                            st.session_state.agent.process_request(user_input)
-                        )
-                        
-                        # إضافة إلى السجل
+                try:
+                    with st.chat_message("user"):
+                        st.write(user_input)
+                    
+                    # معالجة الطلب مع عرض الرد أثناء توليده
+                    with st.chat_message("assistant"):
+                        result = stream_response(user_input)
+                    
+                    # إضافة إلى السجل
+                    st.session_state.conversation.append({
+                        "role": "user",
+                        "content": user_input
+                    })
+                    
+                    if result["success"]:
                         st.session_state.conversation.append({
-                            "role": "user",
-                            "content": user_input
+                            "role": "assistant",
+                            "content": result["response"]
                         })
                         
-                        if result["success"]:
-                            st.session_state.conversation.append({
-                                "role": "assistant",
-                                "content": result["response"]
-                            })
-                            
-                            with st.chat_message("assistant"):
-                                st.write(result["response"])
-                            
-                            st.success("✅ تم معالجة الطلب بنجاح")
-                        else:
-                            st.error(f"❌ خطأ: {result.get('error', 'خطأ غير معروف')}")
-                    
-                    except Exception as e:
-                        st.error(f"❌ خطأ: {str(e)}")
+                        st.success("✅ تم معالجة الطلب بنجاح")
+                    else:
+                        st.error(f"❌ خطأ: {result.get('error', 'خطأ غير معروف')}")
+                
+                except Exception as e:
+                    st.error(f"❌ خطأ: {str(e)}")
     
     # قسم التفكير المنطقي
     with tab2: